@@ -0,0 +1,204 @@
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+import numpy as np
+from quiz_bank import standard_key
+
+DIMENSIONS = 1024
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words that say how to answer rather than what the question is about
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "to", "for", "and", "or", "it", "its",
+    "what", "why", "how", "does", "do", "can", "could", "you", "me", "my", "i", "please", "explain", "tell",
+    "about", "describe", "define", "simply", "simple", "briefly", "give", "with", "example", "examples",
+}
+
+def partition_key(subject, standard):
+    return f"{subject or 'any'}|{standard_key(standard)}"
+
+# Lowercased words without apostrophes or a plural "s", so "Newton's laws" and "newtons law" agree
+def terms(text):
+    for word in TOKEN_PATTERN.findall((text or "").lower().replace("'", "").replace("\u2019", "")):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        yield word
+
+def features(text):
+    words = list(terms(text))
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+# Hashed unigram + bigram vector, L2-normalized so a dot product is the cosine similarity.
+# crc32 rather than hash() so vectors built offline match the ones built at query time
+def vectorize(text, dimensions=DIMENSIONS):
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in features(text):
+        bucket = zlib.crc32(feature.encode("utf-8"))
+        # The top bit picks the sign, so colliding features tend to cancel rather than add up
+        vector[bucket % dimensions] += -1.0 if bucket & 0x80000000 else 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# Index files: vectors.npy (rows grouped by partition), partitions.json ({key: [start, end]}),
+# answers.jsonl (one {"question", "answer"} line per row) and offsets.npy (byte offset of each line)
+def write_index(path, entries, dimensions=DIMENSIONS):
+    entries = sorted(entries, key=lambda entry: entry[0])
+    os.makedirs(path, exist_ok=True)
+    vectors = np.zeros((len(entries), dimensions), dtype=np.float32)
+    offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    partitions = {}
+    with open(os.path.join(path, "answers.jsonl"), "wb") as f:
+        for row, (key, question, answer) in enumerate(entries):
+            vectors[row] = vectorize(question, dimensions)
+            start, _ = partitions.get(key, (row, row))
+            partitions[key] = (start, row + 1)
+            f.write(json.dumps({"question": question, "answer": answer}, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets[row + 1] = f.tell()
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    with open(os.path.join(path, "partitions.json"), "w", encoding="utf-8") as f:
+        json.dump(partitions, f)
+    return len(entries)
+
+# A prebuilt index, memory-mapped read-only: loading is instant and pages are shared between
+# worker processes through the OS page cache
+class IndexFile:
+    def __init__(self, path):
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "partitions.json"), encoding="utf-8") as f:
+            self.partitions = json.load(f)
+        with open(os.path.join(path, "answers.jsonl"), "rb") as f:
+            self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if len(self.offsets) > 1 else b""
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, key, vector):
+        start, end = self.partitions.get(key, (0, 0))
+        if start == end:
+            return None, 0.0
+        scores = self.vectors[start:end] @ vector
+        best = int(scores.argmax())
+        return start + best, float(scores[best])
+
+    def entry(self, row):
+        return json.loads(self.text[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+# Answers learned since startup for one partition. Rows grow by doubling up to capacity; once
+# full, the least recently used row is overwritten
+class Partition:
+    def __init__(self, dimensions, capacity):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 64), dimensions), dtype=np.float32)
+        self.last_used = np.zeros(len(self.vectors))
+        self.entries = []
+
+    def search(self, vector):
+        if not self.entries:
+            return None, 0.0
+        scores = self.vectors[:len(self.entries)] @ vector
+        best = int(scores.argmax())
+        return best, float(scores[best])
+
+    def add(self, vector, question, answer, now):
+        count = len(self.entries)
+        if count == self.capacity:
+            row = int(self.last_used.argmin())
+            self.entries[row] = {"question": question, "answer": answer}
+            evicted = True
+        else:
+            if count == len(self.vectors):
+                size = min(self.capacity, count * 2)
+                self.vectors = np.resize(self.vectors, (size, self.vectors.shape[1]))
+                self.last_used = np.resize(self.last_used, size)
+            row = count
+            self.entries.append({"question": question, "answer": answer})
+            evicted = False
+        self.vectors[row] = vector
+        self.last_used[row] = now
+        return evicted
+
+# Similarity index over past tutor questions, partitioned by subject and standard. A prebuilt,
+# memory-mapped file (see build_answer_index.py) is searched alongside answers learned live.
+# A match at or above serve_threshold is answered from the index; one at or above
+# seed_threshold is handed to the model as a starting point. Live memory is bounded by
+# max_partitions * max_entries * dimensions * 4 bytes
+class AnswerIndex:
+    def __init__(self, path=None, dimensions=DIMENSIONS, max_entries=1000, max_partitions=64,
+                 serve_threshold=0.9, seed_threshold=0.75):
+        self.base = IndexFile(path) if path and os.path.exists(os.path.join(path, "vectors.npy")) else None
+        self.dimensions = self.base.vectors.shape[1] if self.base else dimensions
+        self.max_entries = max_entries
+        self.max_partitions = max_partitions
+        self.serve_threshold = serve_threshold
+        self.seed_threshold = seed_threshold
+        self.partitions = OrderedDict()
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    # The closest past answer as {"question", "answer", "score", "served"}, or None below seed_threshold
+    def lookup(self, question, subject=None, standard=None):
+        key = partition_key(subject, standard)
+        vector = vectorize(question, self.dimensions)
+        if not vector.any():
+            return None
+        match = None
+        if self.base:
+            row, score = self.base.search(key, vector)
+            if row is not None and score >= self.seed_threshold:
+                match = dict(self.base.entry(row), score=score)
+        with self.lock:
+            partition = self.partitions.get(key)
+            if partition:
+                row, score = partition.search(vector)
+                if row is not None and score >= max(self.seed_threshold, match["score"] if match else 0.0):
+                    partition.last_used[row] = time.monotonic()
+                    match = dict(partition.entries[row], score=score)
+            if match is None:
+                self.counters["misses"] += 1
+                return None
+            match["served"] = match["score"] >= self.serve_threshold
+            self.counters["served" if match["served"] else "seeded"] += 1
+        match["score"] = round(match["score"], 4)
+        return match
+
+    def add(self, question, answer, subject=None, standard=None):
+        key = partition_key(subject, standard)
+        vector = vectorize(question, self.dimensions)
+        if not answer or not vector.any():
+            return
+        with self.lock:
+            partition = self.partitions.get(key)
+            if partition is None:
+                partition = self.partitions[key] = Partition(self.dimensions, self.max_entries)
+                if len(self.partitions) > self.max_partitions:
+                    _, dropped = self.partitions.popitem(last=False)
+                    self.counters["evictions"] += len(dropped.entries)
+            self.partitions.move_to_end(key)
+            if partition.add(vector, question, answer, time.monotonic()):
+                self.counters["evictions"] += 1
+            self.counters["stores"] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["served"] + self.counters["seeded"] + self.counters["misses"]
+            return {
+                "served": self.counters["served"],
+                "seeded": self.counters["seeded"],
+                "misses": self.counters["misses"],
+                "serve_rate": self.counters["served"] / lookups if lookups else 0.0,
+                "stores": self.counters["stores"],
+                "evictions": self.counters["evictions"],
+                "live_entries": sum(len(partition.entries) for partition in self.partitions.values()),
+                "live_partitions": len(self.partitions),
+                "file_entries": len(self.base) if self.base else 0,
+                "serve_threshold": self.serve_threshold,
+                "seed_threshold": self.seed_threshold,
+            }
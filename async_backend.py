@@ -0,0 +1,164 @@
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+from bson import ObjectId
+from pymongo import AsyncMongoClient
+import asyncio
+import os
+import certifi
+from backend import (
+    MONGO_POOL_OPTIONS,
+    StudentContext,
+    conversations_collection,
+    create_summary_async,
+    current_endpoint,
+    job_queue,
+    metrics_registry,
+    process_started,
+    run_agent_async,
+    tracer,
+)
+from llm_scheduler import SchedulerOverloaded
+from process_local import LazyProxy, ProcessLocal
+from telemetry import MongoCommandListener
+
+# Async serving mode: a reduced surface of backend.py, with only /initialize, /agent,
+# /get-learning-summary and /save-basic-summary (plus /health, /ready and /metrics). Sessions,
+# quizzes, roadmaps, streaming, rosters and every other route are served by backend.py alone.
+# The agents are the same, but every OpenAI and MongoDB call is awaited on one event loop per
+# process, so in-flight LLM calls do not each pin a worker thread. Run with an ASGI server, e.g.
+#   hypercorn async_backend:app --workers 4
+app = cors(Quart(__name__))
+
+ca = certifi.where()
+async_mongo_client = ProcessLocal(lambda: AsyncMongoClient(
+    os.getenv("MONGODB_URI"), tlsCAFile=ca, event_listeners=[MongoCommandListener(tracer)], **MONGO_POOL_OPTIONS))
+async_db = LazyProxy(lambda: async_mongo_client.get()[os.getenv("DB_NAME")])
+async_students_collection = async_db[os.getenv("COLLECTION_NAME")]
+async_conversations_collection = async_db[conversations_collection.name]
+
+# Indexes, job workers and the synchronous client used by background jobs, once per worker
+@app.before_serving
+async def start_process():
+    await asyncio.to_thread(process_started.get)
+
+@app.before_request
+async def tag_endpoint():
+    current_endpoint.set(request.endpoint)
+    g.trace = tracer.start_trace(request.endpoint, request.method)
+
+@app.after_request
+async def record_status(response):
+    if 'trace' in g:
+        g.trace["status"] = response.status_code
+    return response
+
+@app.teardown_request
+async def finish_trace(error=None):
+    if 'trace' in g:
+        tracer.finish_trace(g.pop('trace'))
+
+@app.errorhandler(SchedulerOverloaded)
+async def scheduler_overloaded(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+# StudentContext whose read and write are awaited; the projected document is fetched up front
+# so the agents' synchronous prompt builders can read it without blocking the loop
+class AsyncStudentContext(StudentContext):
+    async def fetch(self):
+        if not self.loaded:
+            self.document = await async_students_collection.find_one({"_id": self.student_id}, self.FIELDS)
+            self.loaded = True
+        return self
+
+    def load(self):
+        return self.document
+
+    async def commit_async(self):
+        result = None
+        if self.new_conversations:
+            await async_conversations_collection.insert_many(self.new_conversations)
+            self.new_conversations = []
+        if self.updates:
+            result = await async_students_collection.update_one({"_id": self.student_id}, {"$set": self.updates})
+            if self.document is not None:
+                self.document.update(self.updates)
+            self.updates = {}
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+        for callback in callbacks:
+            await asyncio.to_thread(callback)
+        return result
+
+@app.route('/initialize', methods=['POST'])
+async def initialize_student():
+    data = await request.get_json()
+    new_student = {
+        "name": data.get('name'),
+        "standard": data.get('standard'),
+        "subject": data.get('subject'),
+        "like_study": data.get('like_study'),
+    }
+    
+    student_summary = await create_summary_async(new_student, summary_type="basic")
+    new_student['basic_summary'] = student_summary
+    new_student['tracking_summary'] = ""
+    result = await async_students_collection.insert_one(new_student)
+    
+    return jsonify({"student_id": str(result.inserted_id), "basic_summary": student_summary})
+
+@app.route('/agent', methods=['POST'])
+async def agent():
+    data = await request.get_json()
+    student = await AsyncStudentContext(data['student_id']).fetch()
+    response, agent_type = await run_agent_async(data['query'], student, question=data['query'])
+    await student.commit_async()
+    return jsonify({"response": response, "model": agent_type})
+
+@app.route('/get-learning-summary/<student_id>', methods=['GET'])
+async def get_tracking_summary(student_id):
+    try:
+        student = await async_students_collection.find_one({"_id": ObjectId(student_id)}, {"tracking_summary": 1})
+        
+        if not student:
+            return jsonify({"error": "Student not found"}), 404
+        
+        return jsonify({"tracking_summary": student.get('tracking_summary', "")}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/save-basic-summary', methods=['POST'])
+async def save_basic_summary():
+    try:
+        data = await request.get_json()
+        student_id = data.get('student_id')
+        questions_answer = data.get('questions_answer')
+        
+        if not student_id or not questions_answer:
+            return jsonify({"error": "Missing student_id or questions_answer"}), 400
+        
+        student = await AsyncStudentContext(student_id).fetch()
+        if not student.exists:
+            return jsonify({"error": "Student not found"}), 404
+        
+        job_id = await asyncio.to_thread(job_queue.enqueue, "save_basic_summary", {"student_id": student_id, "questions_answer": questions_answer})
+        return jsonify({"message": "Basic summary update queued", "job_id": job_id}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/health', methods=['GET'])
+async def health():
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
+@app.route('/ready', methods=['GET'])
+async def ready():
+    try:
+        await async_mongo_client.get().admin.command("ping")
+    except Exception as e:
+        return jsonify({"status": "unavailable", "pid": os.getpid(), "error": str(e)}), 503
+    return jsonify({"status": "ready", "pid": os.getpid(), "job_workers": len(job_queue.threads)}), 200
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -1,196 +1,1012 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from bson import ObjectId
-from openai import OpenAI 
-from pymongo import MongoClient
+from bson.errors import InvalidId
+import openai
+from openai import AsyncOpenAI, OpenAI, Timeout
+from openai._constants import DEFAULT_CONNECTION_LIMITS
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
 from dotenv import load_dotenv
 import os
+import json
+import queue
+import asyncio
+import time
+import threading
 import certifi
+import csv
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from datetime import datetime, timezone
+from functools import wraps
+from answer_index import AnswerIndex
+from curriculum import SUBJECT_TOPICS
+from jobs import JobQueue
+from learning_scores import INTERVALS, ScoreStore, evaluated_topic, extract_scores
+from llm_cache import CompletionCache
+from llm_scheduler import LLMScheduler, SchedulerOverloaded
+from model_registry import AGENT_TASKS, ModelRegistry, UsageRecorder
+from process_local import LazyProxy, ProcessLocal
+from prompts import PromptBuilder, PromptTemplate, Tokenizer
+from quiz_bank import DIFFICULTIES, QuizBank, grade, level, next_difficulty, public_quiz
+from roadmaps import RoadmapStore, inputs_hash
+from roster import RosterImport, parse_roster, roster_import_id
+from router import ROUTING_QUESTION, FastRouter
+from singleflight import IdempotencyConflict, IdempotencyPending, IdempotencyStore, SingleFlight, fingerprint
+from telemetry import MetricsRegistry, MongoCommandListener, Tracer
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+# Latency histograms and counters for /metrics; optional sampled per-request trace log (JSONL)
+metrics_registry = MetricsRegistry()
+tracer = Tracer(
+    metrics_registry,
+    log_path=os.getenv("TRACE_LOG_PATH"),
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+    slow_ms=float(os.getenv("TRACE_SLOW_MS", "0")),
+)
 
 # OpenAI setup
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries are owned by llm_scheduler, which backs off across all callers at once. Clients, and
+# their connection pools, are created per process on first use
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "600"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# Limits and Timeout come through openai, so they match whichever httpx build it ships with
+def openai_http_options():
+    return {
+        "limits": type(DEFAULT_CONNECTION_LIMITS)(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS),
+        "timeout": Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+    }
+
+openai_client = ProcessLocal(lambda: OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, http_client=openai.DefaultHttpxClient(**openai_http_options())))
+async_openai_client = ProcessLocal(lambda: AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, http_client=openai.DefaultAsyncHttpxClient(**openai_http_options())))
+client = LazyProxy(openai_client.get)
+async_client = LazyProxy(async_openai_client.get)
 
 # MongoDB setup
+# One client per process, connected on first use; every worker has its own pool, so the server
+# sees up to workers * MONGO_MAX_POOL_SIZE connections
 ca = certifi.where()
-mongo_client = MongoClient(os.getenv("MONGODB_URI"), tlsCAFile=ca)
-db = mongo_client[os.getenv("DB_NAME")]
+MONGO_POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "2")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None,
+}
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+mongo_client = ProcessLocal(lambda: MongoClient(
+    os.getenv("MONGODB_URI"), tlsCAFile=ca, event_listeners=[MongoCommandListener(tracer)], **MONGO_POOL_OPTIONS))
+db = LazyProxy(lambda: mongo_client.get()[os.getenv("DB_NAME")])
 students_collection = db[os.getenv("COLLECTION_NAME")]
 
+# Append-only conversation history, one document per agent exchange
+conversations_collection = db[os.getenv("CONVERSATIONS_COLLECTION_NAME", "conversations")]
+CONVERSATION_HISTORY_LIMIT = int(os.getenv("CONVERSATION_HISTORY_LIMIT", "50"))
+
+# Server-side chat sessions: the backend owns the transcript and sends the model a bounded window of it
+sessions_collection = db[os.getenv("SESSIONS_COLLECTION_NAME", "sessions")]
+session_turns_collection = db[os.getenv("SESSION_TURNS_COLLECTION_NAME", "session_turns")]
+SESSION_CONTEXT_TOKEN_BUDGET = int(os.getenv("SESSION_CONTEXT_TOKEN_BUDGET", "1500"))
+SESSION_WINDOW_MAX_TURNS = int(os.getenv("SESSION_WINDOW_MAX_TURNS", "20"))
+
+# Durable background jobs for work the student does not wait on
+jobs_collection = db[os.getenv("JOBS_COLLECTION_NAME", "jobs")]
+job_queue = JobQueue(jobs_collection, workers=int(os.getenv("JOB_WORKERS", "4")))
+
+# Structured learning scores, one document per (student, subject, topic, evaluation)
+score_store = ScoreStore(db[os.getenv("SCORES_COLLECTION_NAME", "learning_scores")])
+TOPIC_SUBJECTS = {topic: subject for subject, topics in SUBJECT_TOPICS.items() for topic in topics}
+
+# Generated roadmaps per (student, subject); regenerated only when the student's summaries change or on refresh
+roadmap_store = RoadmapStore(
+    db[os.getenv("ROADMAPS_COLLECTION_NAME", "roadmaps")],
+    max_versions=int(os.getenv("ROADMAP_MAX_VERSIONS", "20")),
+)
+
+# Past tutor answers, searched before a tutor call: a memory-mapped index built offline from the
+# tutor_answers collection (build_answer_index.py) plus answers learned since startup
+tutor_answers_collection = db[os.getenv("ANSWER_INDEX_COLLECTION_NAME", "tutor_answers")]
+answer_index = AnswerIndex(
+    os.getenv("ANSWER_INDEX_PATH"),
+    max_entries=int(os.getenv("ANSWER_INDEX_MAX_ENTRIES", "1000")),
+    max_partitions=int(os.getenv("ANSWER_INDEX_MAX_PARTITIONS", "64")),
+    serve_threshold=float(os.getenv("ANSWER_INDEX_SERVE_THRESHOLD", "0.9")),
+    seed_threshold=float(os.getenv("ANSWER_INDEX_SEED_THRESHOLD", "0.75")),
+)
+
+# Duplicate requests: identical in-flight requests share one run; Idempotency-Key results are kept for retries
+request_flights = SingleFlight()
+idempotency_store = IdempotencyStore(
+    db[os.getenv("IDEMPOTENCY_COLLECTION_NAME", "idempotency_keys")],
+    ttl_seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600))),
+    wait_seconds=float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60")),
+)
+
+# Rolling tracking summary: compact once it outgrows the budget or after this many folds
+TRACKING_SUMMARY_TOKEN_BUDGET = int(os.getenv("TRACKING_SUMMARY_TOKEN_BUDGET", "600"))
+TRACKING_SUMMARY_COMPACT_EVERY = int(os.getenv("TRACKING_SUMMARY_COMPACT_EVERY", "20"))
+
+# Naive UTC, matching the datetimes pymongo hands back
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Local token count for budget checks (see prompts.Tokenizer)
+prompt_tokenizer = Tokenizer(os.getenv("PROMPT_TOKENIZER_ENCODING", "cl100k_base"))
+
+def estimate_tokens(text):
+    return prompt_tokenizer.count(text)
+
+# Newest-first page of conversations; pass the last one's timestamp and _id as `before` and
+# `before_id` for the next page. Without `before_id` the page ends strictly before the timestamp
+def find_conversations(student_id, agent=None, subject=None, before=None, before_id=None, limit=20):
+    query = {"student_id": ObjectId(student_id)}
+    if agent:
+        query["agent"] = agent
+    if subject:
+        query["subject"] = subject
+    if before and before_id:
+        query["$or"] = [{"timestamp": {"$lt": before}}, {"timestamp": before, "_id": {"$lt": before_id}}]
+    elif before:
+        query["timestamp"] = {"$lt": before}
+    cursor = conversations_collection.find(query, {"student_id": 0}).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+    return list(cursor)
+
+# Oldest-first page of conversations after the (timestamp, _id) cursor of the last one handled;
+# the _id orders conversations stored with the same timestamp. A cursor without an _id (set
+# before ids were recorded) resumes strictly after its timestamp
+def find_conversations_after(student_id, agent=None, after=None, after_id=None, limit=20):
+    query = {"student_id": ObjectId(student_id)}
+    if agent:
+        query["agent"] = agent
+    if after and after_id:
+        query["$or"] = [{"timestamp": {"$gt": after}}, {"timestamp": after, "_id": {"$gt": after_id}}]
+    elif after:
+        query["timestamp"] = {"$gt": after}
+    cursor = conversations_collection.find(query, {"student_id": 0}).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(limit)
+    return list(cursor)
+
+# Local routing engine in front of the MasterAgent LLM call
+fast_router = FastRouter(
+    rule_threshold=float(os.getenv("ROUTER_RULE_THRESHOLD", "0.9")),
+    classifier_threshold=float(os.getenv("ROUTER_CLASSIFIER_THRESHOLD", "0.85")),
+    log_path=os.getenv("ROUTER_LOG_PATH"),
+)
+
+# Per-request view of a student: one projected read, one batched write
+class StudentContext:
+    FIELDS = {"standard": 1, "subject": 1, "roster_import": 1, "basic_summary": 1, "tracking_summary": 1, "guide_summary": 1, "tracking_summary_until": 1, "tracking_summary_until_id": 1, "tracking_summary_folds": 1}
+
+    def __init__(self, student_id):
+        self.student_id = ObjectId(student_id)
+        self.document = None
+        self.loaded = False
+        self.updates = {}
+        self.new_conversations = []
+        self.commit_callbacks = []
+
+    def load(self):
+        if not self.loaded:
+            self.document = students_collection.find_one({"_id": self.student_id}, self.FIELDS)
+            self.loaded = True
+        return self.document
+
+    @property
+    def exists(self):
+        return self.load() is not None
+
+    def __getitem__(self, field):
+        if field in self.updates:
+            return self.updates[field]
+        return self.load()[field]
+
+    def get(self, field, default=None):
+        if field in self.updates:
+            return self.updates[field]
+        document = self.load()
+        return document.get(field, default) if document else default
+
+    def set(self, field, value):
+        self.updates[field] = value
+
+    # Work that must only start once this request's writes are stored
+    def after_commit(self, callback):
+        self.commit_callbacks.append(callback)
+
+    def add_conversation(self, conversation):
+        conversation = dict(conversation, student_id=self.student_id, timestamp=utcnow())
+        self.new_conversations.append(conversation)
+
+    def commit(self):
+        result = None
+        if self.new_conversations:
+            conversations_collection.insert_many(self.new_conversations)
+            self.new_conversations = []
+        if self.updates:
+            result = students_collection.update_one({"_id": self.student_id}, {"$set": self.updates})
+            if self.document is not None:
+                self.document.update(self.updates)
+            self.updates = {}
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+        for callback in callbacks:
+            callback()
+        return result
+
+# Completion cache; only the agents listed in LLM_CACHE_AGENTS read from or write to it
+completion_cache = CompletionCache(
+    db[os.getenv("LLM_CACHE_COLLECTION_NAME", "llm_cache")],
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")),
+    max_entry_bytes=int(os.getenv("LLM_CACHE_MAX_ENTRY_BYTES", str(64 * 1024))),
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    agents=[name.strip() for name in os.getenv("LLM_CACHE_AGENTS", "master_agent,guide_agent,create_summary").split(",") if name.strip()],
+)
+
+# Model, fallback chain and limits per agent/task; every call's tokens and wall time are recorded
+model_registry = ModelRegistry.from_env()
+usage_recorder = UsageRecorder(model_registry)
+# Every agent prompt is a static system prefix plus per-call fields cut to the registry's prompt_budgets
+prompt_builder = PromptBuilder(lambda agent: model_registry.resolve(agent).get("prompt_budgets", {}), metrics_registry, prompt_tokenizer)
+# Set per request so usage can be attributed to the route that caused it
+current_endpoint = ContextVar("current_endpoint", default=None)
+
+# Shared rate-limit-aware gate in front of the OpenAI client; background jobs yield to interactive calls
+llm_scheduler = LLMScheduler(
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "80000")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "256")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+)
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "500"))
+current_priority = ContextVar("current_priority", default="interactive")
+
+def prompt_size(messages):
+    return sum(estimate_tokens(message['content']) for message in messages)
+
+# Tokens to reserve against the per-minute budget before the real usage is known
+def reserve_tokens(messages, params):
+    return prompt_size(messages) + (params.get("max_tokens") or LLM_COMPLETION_TOKEN_ESTIMATE)
+
+# Job handlers run at background priority
+def background(handler):
+    def run(*args, **kwargs):
+        token = current_priority.set("background")
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            current_priority.reset(token)
+    return run
+
+def record_usage(agent, config, model, response=None, started=None, cached=False, error=None, messages=None):
+    usage = getattr(response, "usage", None)
+    prompt_tokens = usage.prompt_tokens if usage else 0
+    completion_tokens = usage.completion_tokens if usage else 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    elapsed = time.perf_counter() - started if started else 0.0
+    usage_recorder.record(
+        current_endpoint.get(), agent, config["task"], model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        elapsed=elapsed,
+        cached=cached,
+        error=error,
+        prompt_size=prompt_size(messages) if messages else 0,
+        cached_prompt_tokens=getattr(details, "cached_tokens", None) or 0,
+    )
+    tracer.observe_llm(agent, model, prompt_tokens, completion_tokens, elapsed, cached=cached, error=error)
+
+# Try each model of the chain in turn; the last failure is re-raised
+def create_with_fallback(agent, config, messages, params):
+    for index, model in enumerate(config["models"]):
+        started = time.perf_counter()
+        try:
+            response = llm_scheduler.run(
+                lambda: client.chat.completions.create(model=model, messages=messages, **params),
+                tokens=reserve_tokens(messages, params),
+                priority=current_priority.get(),
+                stream=bool(params.get("stream")),
+            )
+        except openai.APIError as e:
+            record_usage(agent, config, model, started=started, error=type(e).__name__, messages=messages)
+            if index == len(config["models"]) - 1:
+                raise
+            continue
+        if not params.get("stream"):
+            record_usage(agent, config, model, response, started, messages=messages)
+        return response, model, started
+
+async def async_create_with_fallback(agent, config, messages, params):
+    for index, model in enumerate(config["models"]):
+        started = time.perf_counter()
+        try:
+            response = await llm_scheduler.run_async(
+                lambda: async_client.chat.completions.create(model=model, messages=messages, **params),
+                tokens=reserve_tokens(messages, params),
+                priority=current_priority.get(),
+            )
+        except openai.APIError as e:
+            record_usage(agent, config, model, started=started, error=type(e).__name__, messages=messages)
+            if index == len(config["models"]) - 1:
+                raise
+            continue
+        record_usage(agent, config, model, response, started, messages=messages)
+        return response, model, started
+
+# Every agent's completion goes through here so caching and model selection apply uniformly.
+# refresh skips the cache lookup; the new completion still replaces the cached one
+def chat_completion(agent, messages, refresh=False, **params):
+    config = model_registry.resolve(agent)
+    params = model_registry.apply_limits(config, params)
+    cacheable = completion_cache.enabled_for(agent)
+    if cacheable:
+        started = time.perf_counter()
+        key = completion_cache.key(config["models"][0], messages, params)
+        cached = None if refresh else completion_cache.get(key, agent)
+        if cached is not None:
+            record_usage(agent, config, config["models"][0], started=started, cached=True, messages=messages)
+            return cached
+    response, model, started = create_with_fallback(agent, config, messages, params)
+    content = response.choices[0].message.content
+    if cacheable:
+        completion_cache.set(key, content, agent=agent, model=model)
+    return content
+
+# Event-loop counterpart of chat_completion; cache lookups touch MongoDB so they run off the loop
+async def async_chat_completion(agent, messages, **params):
+    config = model_registry.resolve(agent)
+    params = model_registry.apply_limits(config, params)
+    cacheable = completion_cache.enabled_for(agent)
+    if cacheable:
+        started = time.perf_counter()
+        key = completion_cache.key(config["models"][0], messages, params)
+        cached = await asyncio.to_thread(completion_cache.get, key, agent)
+        if cached is not None:
+            record_usage(agent, config, config["models"][0], started=started, cached=True, messages=messages)
+            return cached
+    response, model, started = await async_create_with_fallback(agent, config, messages, params)
+    content = response.choices[0].message.content
+    if cacheable:
+        await asyncio.to_thread(completion_cache.set, key, content, agent, model)
+    return content
+
+# Yield completion deltas as they arrive from OpenAI
+def stream_completion(agent, messages, refresh=False):
+    config = model_registry.resolve(agent)
+    params = model_registry.apply_limits(config, {})
+    cacheable = completion_cache.enabled_for(agent)
+    if cacheable:
+        started = time.perf_counter()
+        key = completion_cache.key(config["models"][0], messages, params)
+        cached = None if refresh else completion_cache.get(key, agent)
+        if cached is not None:
+            record_usage(agent, config, config["models"][0], started=started, cached=True, messages=messages)
+            yield cached
+            return
+    # Fallback only covers opening the stream; usage arrives in the final chunk
+    response, model, started = create_with_fallback(agent, config, messages, dict(params, stream=True, stream_options={"include_usage": True}))
+    parts = []
+    usage_chunk = None
+    # Closing hands the scheduler slot back even when the client disconnects mid-stream
+    with response:
+        for chunk in response:
+            if chunk.usage:
+                usage_chunk = chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    record_usage(agent, config, model, usage_chunk, started, messages=messages)
+    if cacheable:
+        completion_cache.set(key, "".join(parts), agent=agent, model=model)
+
 # AI Agents
 class MasterAgent:
     def __init__(self):
         self.client = client
         
-    def decide_agent(self, query, student_id):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        student_summary = student['basic_summary'] if student else "No summary available."
-        tracking_summary = student['tracking_summary'] if student else "No summary available."
-        
-        prompt = f"""
-        Given the student's query and their background information, determine the appropriate agent to assign.
-        Query: {query}
-        Student summary: {student_summary}
-        Student tracking summary: {tracking_summary}
-        
-        Agents:
-        1. Discover Agent: Gather more information about the student's background and context. (name = discover_agent)
-        2. Tutor Agent: Provide clear explanations of topics through role-based explanations. (name = tutor_agent)
-        3. Learning Tracker Agent: Assess the student, track progress, and provide quizzes. (name = learning_tracker_agent)
-        4. Guide Agent: Recommend learning paths and refine roadmaps based on the student's learning score. (name = guide_agent)
-        
-        Which agent should handle this query? (provide only the agent's name, nothing more)
-        
-        If the "student_summary" lacks basic information about the student, always select the "discover_agent" to gather more details by asking fundamental questions about the student.
-        """
+    def decide_agent(self, query, student, decision=None):
+        started = time.perf_counter()
+        decision = decision or fast_router.route(query)
+        # The LLM must pick discover_agent when the basic summary is missing, so only trust the fast path otherwise
+        if decision.source != "fallback" and student.get('basic_summary'):
+            fast_router.record(query, decision, decision.agent, time.perf_counter() - started)
+            return decision.agent
 
-    
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                "role": "system","content": "Your goal is to allocate tasks to Discover Agent, Learning Status Tracker Agent, Guide Agent, Tutor Agent, and Practice Agent based on the student's query and available data. Regularly assess and adjust actions for effectiveness. Types of Personalized Information: 1. Student Info: Students name, grade, subjects, and context from Discover Agent. 2. Learning Status: Learning Score in Science and summary from Learning Status Tracker Agent. 3. Learning Path: Detailed study plan in Science from Guide Agent. Guidelines: 1. Contextual Awareness: Use Student Info, Learning Status, and Learning Path for decisions. Organize and prioritize data. 2. Task Delegation: Respond to queries using personalized info. Assign tasks to agents if more details are needed. Ensure clarity and alignment of tasks. 3. Effectiveness Review: Regularly assess and adjust actions if goals are not met. 4. Addressing Uncertainty: Seek clarification or use Discover Agent if info or query is unclear. If Learning Status is missing, use Learning Status Tracker Agent before involving Tutor Agent. 5. Independent Responses: If a task can't be assigned, generate a suitable response yourself. Agents and Goals: 1. Discover Agent: Collect detailed student info through conversation. 2. Learning Status Tracker Agent: Assess understanding and progress via quizzes. 3. Guide Agent: Create a customized learning path based on Learning Status and other data. 4. Tutor Agent: Provide tailored explanations based on the learning path. 5. Practice Agent: Develop practice questions and quizzes. Scenarios: 1. Query: /Can you explain photosynthesis to me?/ Check Learning Status. If unavailable, assign Learning Status Tracker Agent. Once confirmed, assign Tutor Agent. 2. Query: /What should I study next in Science?/ Review Learning Path. Provide guidance or update with Guide Agent if needed. 3. Query: /I am struggling with basics of chemistry./ Check Student Info. If insufficient, use Discover Agent for more info. Evaluate with Learning Status Tracker Agent, then create path with Guide Agent. Execution: 1. Receive Query: Analyze the question. 2. Identify Required Info: Check Student Info, Learning Status, and Learning Path. 3. Delegate Tasks: Assign agents as needed. 4. Review Actions: Monitor and adjust effectiveness. 5. Provide Answer: Ensure the response is clear and effective."} ,
-                {"role": "user", "content": prompt}
-            ]
+        response = chat_completion(
+            "master_agent",
+            messages=self.decide_agent_messages(query, student)
         )
-        
-        agent_decision = response.choices[0].message.content.strip().lower()
+        agent_decision = response.strip().lower()
+        fast_router.record(query, decision, agent_decision, time.perf_counter() - started)
         return agent_decision
+
+    async def decide_agent_async(self, query, student, decision=None):
+        started = time.perf_counter()
+        decision = decision or fast_router.route(query)
+        if decision.source != "fallback" and student.get('basic_summary'):
+            fast_router.record(query, decision, decision.agent, time.perf_counter() - started)
+            return decision.agent
+
+        response = await async_chat_completion(
+            "master_agent",
+            messages=self.decide_agent_messages(query, student)
+        )
+        agent_decision = response.strip().lower()
+        fast_router.record(query, decision, agent_decision, time.perf_counter() - started)
+        return agent_decision
+
+    PROMPT = PromptTemplate(
+        "master_agent",
+        "Your goal is to allocate tasks to Discover Agent, Learning Status Tracker Agent, Guide Agent, Tutor Agent, and Practice Agent based on the student's query and available data. Regularly assess and adjust actions for effectiveness. Types of Personalized Information: 1. Student Info: Students name, grade, subjects, and context from Discover Agent. 2. Learning Status: Learning Score in Science and summary from Learning Status Tracker Agent. 3. Learning Path: Detailed study plan in Science from Guide Agent. Guidelines: 1. Contextual Awareness: Use Student Info, Learning Status, and Learning Path for decisions. Organize and prioritize data. 2. Task Delegation: Respond to queries using personalized info. Assign tasks to agents if more details are needed. Ensure clarity and alignment of tasks. 3. Effectiveness Review: Regularly assess and adjust actions if goals are not met. 4. Addressing Uncertainty: Seek clarification or use Discover Agent if info or query is unclear. If Learning Status is missing, use Learning Status Tracker Agent before involving Tutor Agent. 5. Independent Responses: If a task can't be assigned, generate a suitable response yourself. Agents and Goals: 1. Discover Agent: Collect detailed student info through conversation. 2. Learning Status Tracker Agent: Assess understanding and progress via quizzes. 3. Guide Agent: Create a customized learning path based on Learning Status and other data. 4. Tutor Agent: Provide tailored explanations based on the learning path. 5. Practice Agent: Develop practice questions and quizzes. Scenarios: 1. Query: /Can you explain photosynthesis to me?/ Check Learning Status. If unavailable, assign Learning Status Tracker Agent. Once confirmed, assign Tutor Agent. 2. Query: /What should I study next in Science?/ Review Learning Path. Provide guidance or update with Guide Agent if needed. 3. Query: /I am struggling with basics of chemistry./ Check Student Info. If insufficient, use Discover Agent for more info. Evaluate with Learning Status Tracker Agent, then create path with Guide Agent. Execution: 1. Receive Query: Analyze the question. 2. Identify Required Info: Check Student Info, Learning Status, and Learning Path. 3. Delegate Tasks: Assign agents as needed. 4. Review Actions: Monitor and adjust effectiveness. 5. Provide Answer: Ensure the response is clear and effective."
+        "\n\nGiven the student's query and their background information, determine the appropriate agent to assign."
+        "\n\nAgents:"
+        "\n1. Discover Agent: Gather more information about the student's background and context. (name = discover_agent)"
+        "\n2. Tutor Agent: Provide clear explanations of topics through role-based explanations. (name = tutor_agent)"
+        "\n3. Learning Tracker Agent: Assess the student, track progress, and provide quizzes. (name = learning_tracker_agent)"
+        "\n4. Guide Agent: Recommend learning paths and refine roadmaps based on the student's learning score. (name = guide_agent)"
+        "\n\nIf the student summary lacks basic information about the student, always select the \"discover_agent\" to gather more details by asking fundamental questions about the student."
+        "\n\n" + ROUTING_QUESTION,
+        fields=(("basic_summary", "Student summary"), ("tracking_summary", "Student tracking summary")),
+        request_label="Query",
+    )
+
+    def decide_agent_messages(self, query, student):
+        return prompt_builder.build(
+            self.PROMPT,
+            query,
+            basic_summary=(student['basic_summary'] if student.exists else "") or "No summary available.",
+            tracking_summary=(student['tracking_summary'] if student.exists else "") or "No summary available.",
+        )
     
 class DiscoverAgent:
     def __init__(self):
         self.client = client
         
-    def get_student_info(self, student_id, basic_info):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        if not student:
+    def get_student_info(self, student, basic_info):
+        messages = self.student_info_messages(student, basic_info)
+        if messages is None:
             return "Student not found."
 
-        prompt = f"Summarize the student's background: {basic_info}"
-        if student.get('basic_summary'):
-           prompt = f"Create a few questions to learn more about the student based on their basic details provided below. Do not generate too many questions. Use the following summary to generate the questions. \n Student details: {student['basic_summary']} \n The response should be in JSON format, structured as 'question', 'options': [ 'a. ...', 'b. ...' ]"
-
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-               {"role": "system","content": "You are the Discover Agent in the PadhAI system, tasked with uncovering all relevant details about the student in a relaxed and engaging manner. Your main goal is to collect thorough, personalized data to improve their Science learning experience. Use a friendly, interactive conversation style and check the Master Agent's information before starting. Continuously update and refine the student's contextual information. After each interaction, compile or revise a detailed summary. Essential details to gather include learning ability, subject preferences, personal interests, past learning experiences, preferred learning methods, subjects of difficulty, strengths, challenges, social interaction style, and major academic hurdles. Operational Protocol: Review existing data, identify missing info, prepare up to 10 engaging questions with multiple-choice options, ask in a casual manner, adapt questions based on responses, update student info in real-time, summarize gathered data, and note areas for future exploration. Use casual language, mix question types, incorporate pop culture references, relate questions to real life, and keep it to 10 questions. Sample Questions: What’s your favorite subject? What subject do you find most difficult? How do you like to learn? Why is that subject challenging? What hobbies do you have? How do you prepare for exams? What’s your biggest study challenge? What subject are you best at? What part of learning do you enjoy the most? How do you like to interact during learning? Start with a captivating question, balance easy and thought-provoking queries, tailor questions based on previous answers, and conclude on a positive note. Adaptation Strategies: Use multiple-choice for reserved students, open-ended for outgoing ones, provide encouragement for those struggling, and explore more with enthusiastic respondents. Focus on relevant info, avoid sensitive topics, and let students skip questions if uncomfortable. Improve by reviewing questions, spotting trends, and suggesting new topics. Update Process: Begin with existing info, evaluate new data, update details, address discrepancies, and prioritize recent information. After each interaction, review and organize info, highlight key points, and identify areas needing more detail. Final Summary: Draft a concise profile summary, note new insights, document changes, and identify further exploration areas. Maintain a friendly, engaging approach, refine the student profile with each interaction, and keep questions straightforward and easy to understand."},
-
-                 {"role": "user", "content": prompt}
-            ]
+        questions = chat_completion(
+            "discover_agent",
+            messages=messages
         )
-        questions = response.choices[0].message.content
-        # students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"basic_summary": questions}})
+        # student.set("basic_summary", questions)
         return questions
 
+    async def get_student_info_async(self, student, basic_info):
+        messages = self.student_info_messages(student, basic_info)
+        if messages is None:
+            return "Student not found."
+        return await async_chat_completion("discover_agent", messages=messages)
+
+    PROMPT = PromptTemplate(
+        "discover_agent",
+        "You are the Discover Agent in the PadhAI system, tasked with uncovering all relevant details about the student in a relaxed and engaging manner. Your main goal is to collect thorough, personalized data to improve their Science learning experience. Use a friendly, interactive conversation style and check the Master Agent's information before starting. Continuously update and refine the student's contextual information. After each interaction, compile or revise a detailed summary. Essential details to gather include learning ability, subject preferences, personal interests, past learning experiences, preferred learning methods, subjects of difficulty, strengths, challenges, social interaction style, and major academic hurdles. Operational Protocol: Review existing data, identify missing info, prepare up to 10 engaging questions with multiple-choice options, ask in a casual manner, adapt questions based on responses, update student info in real-time, summarize gathered data, and note areas for future exploration. Use casual language, mix question types, incorporate pop culture references, relate questions to real life, and keep it to 10 questions. Sample Questions: What’s your favorite subject? What subject do you find most difficult? How do you like to learn? Why is that subject challenging? What hobbies do you have? How do you prepare for exams? What’s your biggest study challenge? What subject are you best at? What part of learning do you enjoy the most? How do you like to interact during learning? Start with a captivating question, balance easy and thought-provoking queries, tailor questions based on previous answers, and conclude on a positive note. Adaptation Strategies: Use multiple-choice for reserved students, open-ended for outgoing ones, provide encouragement for those struggling, and explore more with enthusiastic respondents. Focus on relevant info, avoid sensitive topics, and let students skip questions if uncomfortable. Improve by reviewing questions, spotting trends, and suggesting new topics. Update Process: Begin with existing info, evaluate new data, update details, address discrepancies, and prioritize recent information. After each interaction, review and organize info, highlight key points, and identify areas needing more detail. Final Summary: Draft a concise profile summary, note new insights, document changes, and identify further exploration areas. Maintain a friendly, engaging approach, refine the student profile with each interaction, and keep questions straightforward and easy to understand.",
+        fields=(("basic_info", "Student background"), ("basic_summary", "Student details")),
+    )
+
+    def student_info_messages(self, student, basic_info):
+        if not student.exists:
+            return None
+
+        if student.get('basic_summary'):
+            return prompt_builder.build(
+                self.PROMPT,
+                "Create a few questions to learn more about the student based on their details above. Do not generate too many questions. The response should be in JSON format, structured as 'question', 'options': [ 'a. ...', 'b. ...' ]",
+                basic_summary=student['basic_summary'],
+            )
+        return prompt_builder.build(self.PROMPT, "Summarize the student's background.", basic_info=basic_info)
+
 class TutorAgent:
     def __init__(self):
         self.client = client
         
-    def explain_topic(self, query, student_id):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        prompt = f"{query}. Generate a explanation. Here is some basic information about me (as a student) : {student['basic_summary']} & tracking summary : {student['tracking_summary']}."
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "system","content": "Your Role: You are the top teacher, skilled at breaking down any topic in a clear, simple, and engaging way. Your aim is to deliver interactive, fun, and highly informative answers that boost understanding and spark curiosity. Follow instructions carefully and use a tone that fits the given style (e.g., funny, serious, enthusiastic). Be specific and to the point, avoid extra details, and use emojis sparingly. Make sure explanations are thorough but easy to grasp, especially for younger students. Emphasize key points. Tones: Funny: Incorporate humor, puns, and playful language. Serious: Keep a formal and professional tone. Enthusiastic: Display excitement and use lively language. Casual: Use a relaxed, conversational approach. Dramatic: Employ vivid language and create excitement. Keep responses brief."},
-                {"role": "user", "content": prompt},
-            ]
+    # question is the student's message when it stands on its own (no conversation around it).
+    # Such a question gets one shared answer, written without any student's profile and kept in
+    # the answer index for every student of the subject and standard; a cheap personalization
+    # call then fits it to this student. Other messages are answered from the full personal prompt
+    def explain_topic(self, query, student, question=None):
+        if not question:
+            return chat_completion("tutor_agent", messages=self.explain_topic_messages(query, student))
+        answer, generated = self.shared_answer(question, student)
+        if generated:
+            self.remember(question, answer, student)
+        return self.personalize(question, answer, student)
+
+    async def explain_topic_async(self, query, student, question=None):
+        if not question:
+            return await async_chat_completion("tutor_agent", messages=self.explain_topic_messages(query, student))
+        match = self.lookup(question, student)
+        if match and match['served']:
+            answer = match['answer']
+        else:
+            answer = await async_chat_completion("tutor_agent", messages=self.shared_answer_messages(question, match))
+            await asyncio.to_thread(self.remember, question, answer, student)
+        return await async_chat_completion("tutor_personalize", messages=self.personalize_messages(question, answer, student))
+
+    # The index's answer when it is close enough to serve, otherwise a new one (seeded with a
+    # close match, if any); also says whether it is new and so still to be remembered
+    def shared_answer(self, question, student):
+        match = self.lookup(question, student)
+        if match and match['served']:
+            return match['answer'], False
+        return chat_completion("tutor_agent", messages=self.shared_answer_messages(question, match)), True
+
+    def personalize(self, question, answer, student):
+        return chat_completion("tutor_personalize", messages=self.personalize_messages(question, answer, student))
+
+    def lookup(self, question, student):
+        if not question:
+            return None
+        return answer_index.lookup(question, student.get('subject'), student.get('standard'))
+
+    def remember(self, question, answer, student):
+        if not question or not answer:
+            return
+        answer_index.add(question, answer, student.get('subject'), student.get('standard'))
+        tutor_answers_collection.insert_one({
+            "subject": student.get('subject'),
+            "standard": student.get('standard'),
+            "question": question,
+            "answer": answer,
+            "shared": True,
+            "created_at": utcnow(),
+        })
+
+    PROMPT = PromptTemplate(
+        "tutor_agent",
+        "Your Role: You are the top teacher, skilled at breaking down any topic in a clear, simple, and engaging way. Your aim is to deliver interactive, fun, and highly informative answers that boost understanding and spark curiosity. Follow instructions carefully and use a tone that fits the given style (e.g., funny, serious, enthusiastic). Be specific and to the point, avoid extra details, and use emojis sparingly. Make sure explanations are thorough but easy to grasp, especially for younger students. Emphasize key points. Tones: Funny: Incorporate humor, puns, and playful language. Serious: Keep a formal and professional tone. Enthusiastic: Display excitement and use lively language. Casual: Use a relaxed, conversational approach. Dramatic: Employ vivid language and create excitement. Keep responses brief.",
+        fields=(
+            ("basic_summary", "Some basic information about me (as a student)"),
+            ("tracking_summary", "My tracking summary"),
+            ("match", "A teacher's answer to a similar question"),
+        ),
+    )
+
+    def explain_topic_messages(self, query, student):
+        return prompt_builder.build(
+            self.PROMPT,
+            f"{query}. Generate a explanation.",
+            basic_summary=student['basic_summary'],
+            tracking_summary=student['tracking_summary'],
+        )
+
+    # Same template with the personal fields left out, so the answer can be shared
+    def shared_answer_messages(self, question, match=None):
+        request = f"{question}. Generate a explanation."
+        if match:
+            request += " Reuse what fits from the teacher's answer above."
+        return prompt_builder.build(
+            self.PROMPT,
+            request,
+            match=f"Question: {match['question']}\nAnswer: {match['answer']}" if match else None,
+        )
+
+    PERSONALIZE_PROMPT = PromptTemplate(
+        "tutor_personalize",
+        "You adapt a teacher's explanation for one student. Keep every fact and the order of the explanation, but fit the examples, tone and level to the student's information and learning status. Do not add new material, do not mention that the explanation was adapted, and keep it about as long as the original.",
+        fields=(
+            ("basic_summary", "Some basic information about me (as a student)"),
+            ("tracking_summary", "My tracking summary"),
+            ("answer", "The teacher's explanation"),
+        ),
+        request_label="My question",
+    )
+
+    def personalize_messages(self, question, answer, student):
+        return prompt_builder.build(
+            self.PERSONALIZE_PROMPT,
+            question,
+            basic_summary=student['basic_summary'],
+            tracking_summary=student['tracking_summary'],
+            answer=answer,
         )
-        
-        explanation = response.choices[0].message.content
-        # self.log_conversation(student_id, query, explanation, "coach_agent")
-        return explanation
 
 class LearningTrackerAgent:
     def __init__(self):
         self.client = client
         
-    def evaluate_student(self, subject, student_id):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        prompt = f"Evaluate the my knowledge in {subject} with background info: {student['basic_summary']}. Create exact point wise summary(should be very short) & learning score (for example, algebra - 20 %). not add any personal inforation here, only and only learning regarding things add here. Give me a quiz in MCQ format (like a, questions, options: [a. ..., b. ... ]), not add a 'correct answer' in quiz."
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-               { "role": "system", "content": "You are the Learning Status Tracker Agent in the PadhAI system—your job is to assess a students grasp of Physics topics accurately while making it engaging and fun. Primary Objective: Evaluate the student's understanding, identify strengths and challenges, and provide a Learning Score and Status summary. Key Responsibilities: 1. Create custom questions to assess understanding. 2. Analyze answers to determine knowledge depth. 3. Compute a Learning Score. 4. Deliver a detailed Learning Status summary. Operational Protocol: 1. Review the topic. 2. Ask questions sequentially, adjusting based on responses. 3. Offer friendly feedback. 4. Calculate the Learning Score. 5. Summarize Learning Status. Question Guidelines: - Start with basics, then increase difficulty. - Use varied question types (multiple-choice, true/false, short answer). - Keep questions clear and age-appropriate. - Include real-world examples or fun scenarios. - Adjust based on performance. Evaluation Process: - Multiple-choice: Score correct (1) or incorrect (0). - Open-ended: Score (0-1) based on accuracy. - Provide supportive feedback. Learning Score Calculation: - (Points earned / Points possible) * 100, rounded to the nearest whole number. Learning Status Summary: 1. Understanding level (Beginner, Intermediate, Advanced, Master). 2. Key concepts known. 3. Strengths. 4. Areas needing improvement. 5. Challenges. 6. Study recommendations. Interaction Style: - Friendly, encouraging tone. - Use age-appropriate humor. - Praise correct answers and motivate for incorrect ones. - Keep it enjoyable. Sample Interaction: - You: Ready to dive into some exciting physics questions? Let’s start with forces! - Q1: What’s the formula for calculating force? (F=ma, E=mc^2, P=IV, V=IR) - Follow-up: Why does a heavier object require more force to accelerate? (Due to greater mass) - Intermediate: Can you explain Newton’s second law of motion? (Open-ended) - Advanced: How does friction affect the motion of an object? (Opposes motion and converts kinetic energy to heat) Adaptive Questioning: - Provide basic questions if the student is having difficulty. - Challenge with more complex questions if the student is performing well. Privacy and Sensitivity: - Focus on the subject, avoid personal queries. - Simplify if student is frustrated. Continuous Improvement: - Evaluate question effectiveness. - Identify common difficulties. - Update question bank based on performance. Final Reporting: - Present the Learning Score. - Provide a comprehensive Learning Status summary. - End with encouragement. Evaluation Example: - Correct Answers: 3/4. - Learning Score: 75%. - Summary: Good basics, needs improvement on frictions effects. Mastery level: 75%, focus on Newtons laws. Remember, youre a supportive guide—keep the energy high and make each question an opportunity for growth!"},
-                {"role": "user", "content": prompt}
-            ]
-        )        
-        evaluation = response.choices[0].message.content
-        self.log_conversation(student_id, subject, evaluation, "learning_tracker_agent")
+    # topic is the session's topic when the evaluation runs in one; a generic "Learning Score" is filed under it
+    def evaluate_student(self, subject, student, topic=None):
+        evaluation = chat_completion(
+            "learning_tracker_agent",
+            messages=self.evaluate_student_messages(subject, student)
+        )
+        self.log_conversation(student, subject, evaluation, "learning_tracker_agent", topic=topic)
         return evaluation
 
-    def log_conversation(self, student_id, subject, evaluation, agent_type):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        conversations = student.get('conversations', [])
-        conversations.append({"agent": agent_type, "subject": subject, "evaluation": evaluation})
-        students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"conversations": conversations}})
-        self.update_tracking_summary(student_id)
-
-    def update_tracking_summary(self, student_id):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        conversations = student.get('conversations', [])
-        tracking_conversations = [conv for conv in conversations if conv['agent'] == "learning_tracker_agent"]
+    async def evaluate_student_async(self, subject, student, topic=None):
+        evaluation = await async_chat_completion("learning_tracker_agent", messages=self.evaluate_student_messages(subject, student))
+        self.log_conversation(student, subject, evaluation, "learning_tracker_agent", topic=topic)
+        return evaluation
+
+    PROMPT = PromptTemplate(
+        "learning_tracker_agent",
+        "You are the Learning Status Tracker Agent in the PadhAI system—your job is to assess a students grasp of Physics topics accurately while making it engaging and fun. Primary Objective: Evaluate the student's understanding, identify strengths and challenges, and provide a Learning Score and Status summary. Key Responsibilities: 1. Create custom questions to assess understanding. 2. Analyze answers to determine knowledge depth. 3. Compute a Learning Score. 4. Deliver a detailed Learning Status summary. Operational Protocol: 1. Review the topic. 2. Ask questions sequentially, adjusting based on responses. 3. Offer friendly feedback. 4. Calculate the Learning Score. 5. Summarize Learning Status. Question Guidelines: - Start with basics, then increase difficulty. - Use varied question types (multiple-choice, true/false, short answer). - Keep questions clear and age-appropriate. - Include real-world examples or fun scenarios. - Adjust based on performance. Evaluation Process: - Multiple-choice: Score correct (1) or incorrect (0). - Open-ended: Score (0-1) based on accuracy. - Provide supportive feedback. Learning Score Calculation: - (Points earned / Points possible) * 100, rounded to the nearest whole number. Learning Status Summary: 1. Understanding level (Beginner, Intermediate, Advanced, Master). 2. Key concepts known. 3. Strengths. 4. Areas needing improvement. 5. Challenges. 6. Study recommendations. Interaction Style: - Friendly, encouraging tone. - Use age-appropriate humor. - Praise correct answers and motivate for incorrect ones. - Keep it enjoyable. Sample Interaction: - You: Ready to dive into some exciting physics questions? Let’s start with forces! - Q1: What’s the formula for calculating force? (F=ma, E=mc^2, P=IV, V=IR) - Follow-up: Why does a heavier object require more force to accelerate? (Due to greater mass) - Intermediate: Can you explain Newton’s second law of motion? (Open-ended) - Advanced: How does friction affect the motion of an object? (Opposes motion and converts kinetic energy to heat) Adaptive Questioning: - Provide basic questions if the student is having difficulty. - Challenge with more complex questions if the student is performing well. Privacy and Sensitivity: - Focus on the subject, avoid personal queries. - Simplify if student is frustrated. Continuous Improvement: - Evaluate question effectiveness. - Identify common difficulties. - Update question bank based on performance. Final Reporting: - Present the Learning Score. - Provide a comprehensive Learning Status summary. - End with encouragement. Evaluation Example: - Correct Answers: 3/4. - Learning Score: 75%. - Summary: Good basics, needs improvement on frictions effects. Mastery level: 75%, focus on Newtons laws. Remember, youre a supportive guide—keep the energy high and make each question an opportunity for growth!",
+        fields=(("basic_summary", "My background"),),
+    )
+
+    def evaluate_student_messages(self, subject, student):
+        return prompt_builder.build(
+            self.PROMPT,
+            f"Evaluate the my knowledge in {subject} with the background info above. Create exact point wise summary(should be very short) & learning score (for example, algebra - 20 %). not add any personal inforation here, only and only learning regarding things add here. Give me a quiz in MCQ format (like a, questions, options: [a. ..., b. ... ]), not add a 'correct answer' in quiz.",
+            basic_summary=student['basic_summary'],
+        )
+
+    def log_conversation(self, student, subject, evaluation, agent_type, scores=None, topic=None, **details):
+        student.add_conversation(dict({"agent": agent_type, "subject": subject, "evaluation": evaluation}, **details))
+        # Chat evaluations state their scores in prose ("Algebra - 20 %"); quiz results pass them in.
+        # Without a session topic, only the "evaluate my knowledge about X" line names the topic
+        if scores is None:
+            default_topic = topic if topic in TOPIC_SUBJECTS else evaluated_topic(str(subject), TOPIC_SUBJECTS)
+            scores = [(TOPIC_SUBJECTS.get(topic, student.get('subject')), topic, score)
+                      for topic, score in extract_scores(evaluation, default_topic, TOPIC_SUBJECTS)]
+        documents = score_store.documents(student.student_id, student, scores, agent_type,
+                                          **{key: details[key] for key in ("quiz_id", "difficulty") if key in details})
+        if documents:
+            student.after_commit(lambda: score_store.record(documents))
+        # Pending summary jobs for the same student collapse into one
+        student_id = str(student.student_id)
+        student.after_commit(lambda: job_queue.enqueue("update_tracking_summary", {"student_id": student_id}, dedupe_key=f"tracking_summary:{student_id}"))
+
+    TRACKING_PROMPT = PromptTemplate(
+        "tracking_summary",
+        "You are an AI designed to generate concise and useful tracking summaries based on student-learning tracker interactions (learning_tracker_agent). Your summaries should be brief, clear, and actionable. Using quiz answers and communication, prepare one learning score with the topic (e.g., Physics - 50%) and extra details about the student.",
+        fields=(("tracking_summary", "Current tracking summary"), ("conversations", "New conversations")),
+    )
+
+    # Fold the stored evaluations past the summary's cursor into it, oldest first. A backlog larger
+    # than one page or the conversations budget is folded in several passes rather than cut off
+    def update_tracking_summary(self, student):
+        existing_summary = student.get('tracking_summary', "")
+        new_conversations = find_conversations_after(
+            student.student_id,
+            agent="learning_tracker_agent",
+            after=student.get('tracking_summary_until'),
+            after_id=student.get('tracking_summary_until_id'),
+            limit=CONVERSATION_HISTORY_LIMIT,
+        )
         
-        if not tracking_conversations:
-            return student.get('tracking_summary', "")
+        if not new_conversations:
+            return existing_summary
         
-        conversation_text = "\n".join([f"Subject: {conv['subject']}, Evaluation: {conv['evaluation']}" for conv in tracking_conversations])
-        prompt = f"Based on the following conversations, create a tracking summary:\n\n{conversation_text}. prepare topic wise summmary."
+        budget = prompt_builder.budget("tracking_summary", "conversations")
+        lines = []
+        for conv in new_conversations:
+            line = f"Subject: {conv['subject']}, Evaluation: {conv['evaluation']}"
+            budget -= estimate_tokens(line)
+            if lines and budget < 0:
+                break
+            lines.append(line)
+        folded = new_conversations[len(lines) - 1]
+        if existing_summary:
+            request = "Update the current tracking summary with the new conversations, keeping earlier topics unless the new evaluations replace them. prepare topic wise summmary."
+        else:
+            request = "Create a tracking summary from the new conversations. prepare topic wise summmary."
         
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system","content": "You are an AI designed to generate concise and useful tracking summaries based on student-learning tracker interactions (learning_tracker_agent). Your summaries should be brief, clear, and actionable. Using quiz answers and communication, prepare one learning score with the topic (e.g., Physics - 50%) and extra details about the student."},
-                {"role": "user", "content": prompt}
-            ]
+        summary = chat_completion(
+            "tracking_summary",
+            messages=prompt_builder.build(self.TRACKING_PROMPT, request, tracking_summary=existing_summary, conversations="\n".join(lines))
         )
-        summary = response.choices[0].message.content
-        students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"tracking_summary": summary}})
+        folds = student.get('tracking_summary_folds', 0) + 1
+        student.set("tracking_summary", summary)
+        student.set("tracking_summary_until", folded['timestamp'])
+        student.set("tracking_summary_until_id", folded['_id'])
+        student.set("tracking_summary_folds", folds)
+        
+        student_id = str(student.student_id)
+        if len(lines) < len(new_conversations) or len(new_conversations) == CONVERSATION_HISTORY_LIMIT:
+            student.after_commit(lambda: job_queue.enqueue("update_tracking_summary", {"student_id": student_id}, dedupe_key=f"tracking_summary:{student_id}"))
+        if estimate_tokens(summary) > TRACKING_SUMMARY_TOKEN_BUDGET or folds >= TRACKING_SUMMARY_COMPACT_EVERY:
+            student.after_commit(lambda: job_queue.enqueue("compact_tracking_summary", {"student_id": student_id, "summary": summary}, dedupe_key=f"compact_tracking_summary:{student_id}"))
+        return summary
+
+    # Rewrite the rolling summary under the token budget; skipped if a newer fold landed meanwhile
+    def compact_tracking_summary(self, student_id, summary):
+        compacted = chat_completion(
+            "tracking_summary",
+            max_tokens=TRACKING_SUMMARY_TOKEN_BUDGET,
+            messages=prompt_builder.build(
+                self.TRACKING_PROMPT,
+                f"Compact the current tracking summary into at most {TRACKING_SUMMARY_TOKEN_BUDGET // 2} tokens. Keep every topic's latest learning score and the most important strengths and weaknesses.",
+                tracking_summary=summary,
+            )
+        )
+        students_collection.update_one(
+            {"_id": ObjectId(student_id), "tracking_summary": summary},
+            {"$set": {"tracking_summary": compacted, "tracking_summary_folds": 0}}
+        )
+
+ROADMAP_PROMPT = "Generate a comprehensive learning path for {subject} that covers all major topics and subtopics. Include estimated time frames for each section and suggested resources or activities."
 
 class GuideAgent:
     def __init__(self):
         self.client = client
         
-    def suggest_path(self, learning_score, student_id):
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        prompt = f"{learning_score}. Based on the my learning score {student['tracking_summary']} & my tracking summary {student['tracking_summary']}, suggest the next learning path for a improve my learning score."
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-               {"role": "system","content": "You are the Learning Roadmap Creator in the PadhAI system, responsible for designing a personalized learning plan for each student. Your goal is to craft a specific, actionable roadmap based on the student’s Learning Status Score, Summary, and personal details. Key Responsibilities: 1. Create a customized learning roadmap based on the student's current understanding. 2. Set a Learning Score target and timeline. 3. Provide clear steps to help achieve goals. Operational Guidelines: 1. Obtain the student's Learning Status Score and Summary; get from Learning Status Tracker Agent if missing. Use personal info for customization. 2. Assess the Learning Status to identify strengths and weaknesses; adjust the roadmap accordingly. 3. Set a specific Learning Score goal and a feasible timeline. 4. Include actionable steps like topics, practice questions, and activities. 5. Ensure the roadmap is engaging and motivating. Roadmap Components: 1. Topics (covered by Tutor Agent). 2. Practice questions. 3. Hands-on activities. 4. Real-world applications or projects. 5. Progress checkpoints. Personalization Checklist: - Match the student’s understanding level. - Adapt to learning styles. - Address strengths and weaknesses. - Incorporate personal interests. - Adjust difficulty based on Learning Status Score. Roadmap Creation Guidelines: - Low Scores (<50%): Focus on basics, break into small chunks, add practice and activities. - Medium Scores (50-75%): Mix review with new material, increase complexity, add application exercises. - High Scores (75-90%): Introduce advanced concepts, problem-solving, projects, and peer teaching. - Exceptional Scores (>90%): Move to new topics, suggest enrichment, propose advanced projects or mentorship. Timeline and Milestones: - Set achievable goals with weekly or bi-weekly milestones. - Include regular progress check-ins. Engagement Strategies: - Use interests for relevant examples. - Incorporate gamification (points, levels). - Suggest collaborative activities. - Vary learning methods to keep interest. Sample Roadmap: - Status: 60% in Photosynthesis. Summary: Basic understanding, struggles with details. - Target Score: 85% in 4 weeks. - Week 1: Basics - Overview, role of sunlight, practice questions, video, drawing activity. - Week 2: Processes - Light-dependent and Calvin cycle, short-answer questions, experiment, story writing. - Week 3: Application - Real-life importance, case studies, mini-project, presentation. Self-Evaluation: 1. Is the roadmap tailored to the student’s needs? 2. Are the steps clear and attainable? 3. Does it address weaknesses and enhance strengths? 4. Is it engaging? 5. Does it challenge the student appropriately? Adjust if needed. Keep the tone encouraging and present the roadmap as an exciting learning journey to foster curiosity, confidence, and enjoyment in learning."},
-                {"role": "user", "content": prompt}
-            ]
+    def suggest_path(self, learning_score, student):
+        response = chat_completion(
+            "guide_agent",
+            messages=self.suggest_path_messages(learning_score, student)
         )
-        
-        response = response.choices[0].message.content
-        students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"guide_summary": response}})
+        self.save_path(student, response)
+        return response
+
+    async def suggest_path_async(self, learning_score, student):
+        response = await async_chat_completion("guide_agent", messages=self.suggest_path_messages(learning_score, student))
+        self.save_path(student, response)
         return response
+
+    def save_path(self, student, roadmap):
+        student.set("guide_summary", roadmap)
+
+    # Inputs hash of the roadmap the student would get for a subject right now
+    def roadmap_hash(self, student, subject):
+        return inputs_hash(subject, student.get('basic_summary'), student.get('tracking_summary'))
+
+    def roadmap_messages(self, subject, student):
+        return self.suggest_path_messages(ROADMAP_PROMPT.format(subject=subject), student)
+
+    # The stored roadmap while its inputs are unchanged, otherwise a newly generated version
+    def roadmap(self, student, subject, refresh=False):
+        current_hash = self.roadmap_hash(student, subject)
+        latest = roadmap_store.latest(student.student_id, subject)
+        if latest and not refresh and latest['inputs_hash'] == current_hash:
+            return latest, False
+        response = chat_completion("guide_agent", messages=self.roadmap_messages(subject, student), refresh=refresh)
+        return self.save_roadmap(student, subject, response, current_hash, refresh), True
+
+    def save_roadmap(self, student, subject, roadmap, current_hash, refreshed=False):
+        self.save_path(student, roadmap)
+        return roadmap_store.save(student.student_id, subject, roadmap, current_hash, refreshed)
+
+    PROMPT = PromptTemplate(
+        "guide_agent",
+        "You are the Learning Roadmap Creator in the PadhAI system, responsible for designing a personalized learning plan for each student. Your goal is to craft a specific, actionable roadmap based on the student’s Learning Status Score, Summary, and personal details. Key Responsibilities: 1. Create a customized learning roadmap based on the student's current understanding. 2. Set a Learning Score target and timeline. 3. Provide clear steps to help achieve goals. Operational Guidelines: 1. Obtain the student's Learning Status Score and Summary; get from Learning Status Tracker Agent if missing. Use personal info for customization. 2. Assess the Learning Status to identify strengths and weaknesses; adjust the roadmap accordingly. 3. Set a specific Learning Score goal and a feasible timeline. 4. Include actionable steps like topics, practice questions, and activities. 5. Ensure the roadmap is engaging and motivating. Roadmap Components: 1. Topics (covered by Tutor Agent). 2. Practice questions. 3. Hands-on activities. 4. Real-world applications or projects. 5. Progress checkpoints. Personalization Checklist: - Match the student’s understanding level. - Adapt to learning styles. - Address strengths and weaknesses. - Incorporate personal interests. - Adjust difficulty based on Learning Status Score. Roadmap Creation Guidelines: - Low Scores (<50%): Focus on basics, break into small chunks, add practice and activities. - Medium Scores (50-75%): Mix review with new material, increase complexity, add application exercises. - High Scores (75-90%): Introduce advanced concepts, problem-solving, projects, and peer teaching. - Exceptional Scores (>90%): Move to new topics, suggest enrichment, propose advanced projects or mentorship. Timeline and Milestones: - Set achievable goals with weekly or bi-weekly milestones. - Include regular progress check-ins. Engagement Strategies: - Use interests for relevant examples. - Incorporate gamification (points, levels). - Suggest collaborative activities. - Vary learning methods to keep interest. Sample Roadmap: - Status: 60% in Photosynthesis. Summary: Basic understanding, struggles with details. - Target Score: 85% in 4 weeks. - Week 1: Basics - Overview, role of sunlight, practice questions, video, drawing activity. - Week 2: Processes - Light-dependent and Calvin cycle, short-answer questions, experiment, story writing. - Week 3: Application - Real-life importance, case studies, mini-project, presentation. Self-Evaluation: 1. Is the roadmap tailored to the student’s needs? 2. Are the steps clear and attainable? 3. Does it address weaknesses and enhance strengths? 4. Is it engaging? 5. Does it challenge the student appropriately? Adjust if needed. Keep the tone encouraging and present the roadmap as an exciting learning journey to foster curiosity, confidence, and enjoyment in learning.",
+        fields=(("basic_summary", "About me"), ("tracking_summary", "My learning scores and tracking summary")),
+    )
+
+    def suggest_path_messages(self, learning_score, student):
+        return prompt_builder.build(
+            self.PROMPT,
+            f"{learning_score}. Based on my learning scores and tracking summary above, suggest the next learning path for a improve my learning score.",
+            basic_summary=student['basic_summary'],
+            tracking_summary=student['tracking_summary'],
+        )
     
 # create a summary
-def create_summary(student_data, student_id="", summary_type="basic"):
-    student = students_collection.find_one({"_id": ObjectId(student_id)}) if student_id else None
-    existing_summary = student['basic_summary'] if student else ""
-        
-    prompt = f"Update the summary with new information: {existing_summary} \n New Data : {student_data}"
-    
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-           {"role": "system","content": "You are an AI assistant specialized in creating concise and informative summaries of student information. Your task is to generate or update student summaries based on provided data. Follow these guidelines: 1. Summarize key information about the student, including name, grade level, subjects of interest, and learning preferences. 2. Highlight any notable strengths, challenges, or unique characteristics mentioned. 3. If updating an existing summary, seamlessly integrate new information while maintaining coherence. 4. Keep the summary concise, typically 3-5 sentences. 5. Use a professional yet friendly tone appropriate for educational contexts. 6. Focus on information relevant to the student's academic profile and learning journey. 7. Avoid including sensitive personal information or making subjective judgments. Your goal is to create a clear, informative snapshot of the student's academic profile that can be easily understood by educators and AI systems alike."},
-            {"role": "user", "content": prompt}
-        ]
+def create_summary(student_data, student=None, summary_type="basic"):
+    summary = chat_completion(
+        "create_summary",
+        messages=summary_messages(student_data, student)
     )
-    summary = response.choices[0].message.content
     return summary
+
+async def create_summary_async(student_data, student=None, summary_type="basic"):
+    return await async_chat_completion("create_summary", messages=summary_messages(student_data, student))
+
+SUMMARY_PROMPT = PromptTemplate(
+    "create_summary",
+    "You are an AI assistant specialized in creating concise and informative summaries of student information. Your task is to generate or update student summaries based on provided data. Follow these guidelines: 1. Summarize key information about the student, including name, grade level, subjects of interest, and learning preferences. 2. Highlight any notable strengths, challenges, or unique characteristics mentioned. 3. If updating an existing summary, seamlessly integrate new information while maintaining coherence. 4. Keep the summary concise, typically 3-5 sentences. 5. Use a professional yet friendly tone appropriate for educational contexts. 6. Focus on information relevant to the student's academic profile and learning journey. 7. Avoid including sensitive personal information or making subjective judgments. Your goal is to create a clear, informative snapshot of the student's academic profile that can be easily understood by educators and AI systems alike.",
+    fields=(("basic_summary", "Existing summary"), ("new_data", "New data")),
+)
+
+def summary_messages(student_data, student=None):
+    existing_summary = student.get('basic_summary', "") if student else ""
+    return prompt_builder.build(SUMMARY_PROMPT, "Update the summary with the new information.", basic_summary=existing_summary, new_data=student_data)
     
-app = Flask(__name__)
+# A chat the backend keeps the transcript for. Each turn sends the model the rolling
+# summary of older turns plus the most recent turns that fit SESSION_CONTEXT_TOKEN_BUDGET.
+class ChatSession:
+    KINDS = ("evaluate", "ask")
+
+    def __init__(self, document):
+        self.document = document
+        self.session_id = document['_id']
+
+    @classmethod
+    def create(cls, student_id, kind, topic):
+        now = utcnow()
+        document = {
+            "student_id": ObjectId(student_id),
+            "kind": kind,
+            "topic": topic,
+            "summary": "",
+            "summarized_until": 0,
+            "turn_count": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        document['_id'] = sessions_collection.insert_one(document).inserted_id
+        return cls(document)
+
+    @classmethod
+    def load(cls, session_id):
+        document = sessions_collection.find_one({"_id": ObjectId(session_id)})
+        return cls(document) if document else None
+
+    @property
+    def student_id(self):
+        return self.document['student_id']
+
+    def opening(self):
+        return f"i want to evaluate my knowledge about {self.document['topic']}"
+
+    # Newest unsummarized turns that fit the budget, oldest first; also reports whether older ones were left out
+    def window(self, budget=None):
+        summary = self.document.get('summary', "")
+        budget = (budget or SESSION_CONTEXT_TOKEN_BUDGET) - estimate_tokens(summary)
+        turns = session_turns_collection.find(
+            {"session_id": self.session_id, "index": {"$gte": self.document.get('summarized_until', 0)}}
+        ).sort("index", DESCENDING).limit(SESSION_WINDOW_MAX_TURNS)
+        window = []
+        for turn in turns:
+            cost = estimate_tokens(turn['content'])
+            if cost > budget:
+                break
+            budget -= cost
+            window.append(turn)
+        window.reverse()
+        first_index = window[0]['index'] if window else self.document.get('turn_count', 0)
+        return window, first_index > self.document.get('summarized_until', 0)
+
+    # Rebuild the query shape frontend.py used to send, from the server-side transcript
+    def build_query(self, message):
+        window, overflow = self.window()
+        if self.document['kind'] == "evaluate":
+            if self.document['turn_count'] == 0:
+                return f"user : {self.opening()}", overflow
+            lines = [f"user : {self.opening()}"]
+            agent_label = "learning_tracker_agent"
+        else:
+            lines = [f"user : {message}"]
+            agent_label = "response"
+        if self.document.get('summary'):
+            lines.append(f"summary of earlier conversation : {self.document['summary']}")
+        for turn in window:
+            lines.append(f"{agent_label if turn['role'] == 'agent' else 'User'} : {turn['content']}")
+        if self.document['kind'] == "evaluate":
+            lines.append(f"User : answer of questions : {message}")
+        return "\n".join(lines), overflow
+
+    def record(self, message, response, agent_type, overflow=False):
+        now = utcnow()
+        document = sessions_collection.find_one_and_update(
+            {"_id": self.session_id},
+            {"$inc": {"turn_count": 2}, "$set": {"updated_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        index = document['turn_count'] - 2
+        session_turns_collection.insert_many([
+            {"session_id": self.session_id, "index": index, "role": "user", "content": message, "timestamp": now},
+            {"session_id": self.session_id, "index": index + 1, "role": "agent", "agent": agent_type, "content": response, "timestamp": now},
+        ])
+        self.document = document
+        if overflow:
+            session_id = str(self.session_id)
+            job_queue.enqueue("summarize_session", {"session_id": session_id}, dedupe_key=f"summarize_session:{session_id}")
+
+    SUMMARY_PROMPT = PromptTemplate(
+        "session_summary",
+        "You summarize tutoring conversations between a student and the PadhAI agents. Be brief and factual.",
+        fields=(("summary", "Summary of the conversation so far"), ("transcript", "New turns")),
+    )
+
+    # Fold the turns that no longer fit the window into the rolling summary
+    def summarize(self):
+        window, overflow = self.window(SESSION_CONTEXT_TOKEN_BUDGET // 2)
+        if not overflow:
+            return
+        summarized_until = self.document.get('summarized_until', 0)
+        keep_from = window[0]['index'] if window else self.document['turn_count']
+        older = session_turns_collection.find(
+            {"session_id": self.session_id, "index": {"$gte": summarized_until, "$lt": keep_from}}
+        ).sort("index", ASCENDING)
+        transcript = "\n".join(f"{'Agent' if turn['role'] == 'agent' else 'User'} : {turn['content']}" for turn in older)
+        summary = chat_completion(
+            "session_summary",
+            max_tokens=SESSION_CONTEXT_TOKEN_BUDGET // 3,
+            messages=prompt_builder.build(
+                self.SUMMARY_PROMPT,
+                "Update the summary of the conversation so far with the new turns. Keep questions that are still unanswered, the student's answers and any scores.",
+                summary=self.document.get('summary', ''),
+                transcript=transcript,
+            )
+        )
+        sessions_collection.update_one(
+            {"_id": self.session_id, "summarized_until": summarized_until},
+            {"$set": {"summary": summary, "summarized_until": keep_from}}
+        )
+
+# Routes live on a blueprint so create_app() can build the app; labels use the bare view name
+api = Blueprint("api", __name__)
+
+@api.before_app_request
+def tag_endpoint():
+    endpoint = request.endpoint.rpartition(".")[2] if request.endpoint else None
+    current_endpoint.set(endpoint)
+    g.trace = tracer.start_trace(endpoint, request.method)
+    # Liveness must not wait on MongoDB; readiness runs the startup itself
+    if endpoint not in ("health", "ready"):
+        process_started.get()
+
+@api.after_app_request
+def record_status(response):
+    if 'trace' in g:
+        g.trace["status"] = response.status_code
+    return response
+
+@api.teardown_app_request
+def finish_trace(error=None):
+    if 'trace' in g:
+        tracer.finish_trace(g.pop('trace'))
+
+@api.app_errorhandler(SchedulerOverloaded)
+def scheduler_overloaded(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+@api.app_errorhandler(IdempotencyConflict)
+def idempotency_conflict(e):
+    return jsonify({"error": str(e)}), 422
+
+@api.app_errorhandler(IdempotencyPending)
+def idempotency_pending(e):
+    return jsonify({"error": str(e)}), 409, {"Retry-After": "5"}
+
+coalesced_requests = metrics_registry.counter(
+    "padhai_coalesced_requests_total", "Requests that ran, joined an identical in-flight request, or replayed an Idempotency-Key.",
+    ("endpoint", "outcome"))
+
+# Identical concurrent requests (same route, path arguments and normalized JSON body) share one
+# run, streamed or not; a request with an Idempotency-Key replays the stored result of an earlier run.
+# With shared=False (a route whose body names no student, like /initialize, where two students can
+# send the same form) only retries of one Idempotency-Key are coalesced, and other requests just run
+def coalesced(view=None, shared=True):
+    if view is None:
+        return lambda view: coalesced(view, shared)
+
+    @wraps(view)
+    def wrapper(**view_args):
+        endpoint = current_endpoint.get()
+        key = request.headers.get("Idempotency-Key")
+        if not shared and not key:
+            return view(**view_args)
+        payload = request.get_json(silent=True) if request.is_json else request.get_data(as_text=True)
+        request_fingerprint = fingerprint(endpoint, view_args, payload)
+        flight_key = request_fingerprint if shared else fingerprint(request_fingerprint, key)
+        record_id = idempotency_store.record_id(endpoint, key) if key else None
+        on_complete = on_abandon = None
+        # Filled by sse_error() while the leader streams; shared with followers through meta
+        stream_errors = g.stream_errors = []
+        if record_id:
+            stored = idempotency_store.begin(record_id, request_fingerprint)
+            if stored:
+                (status, mimetype, headers), body = stored
+                coalesced_requests.inc(endpoint=endpoint, outcome="replayed")
+                return Response(body, status=status, mimetype=mimetype, headers=headers + [("Idempotent-Replayed", "true")])
+            on_complete = lambda meta, chunks: (idempotency_store.abandon(record_id) if meta[3]
+                                                else idempotency_store.finish(record_id, meta[:3], "".join(chunks)))
+            on_abandon = lambda: idempotency_store.abandon(record_id)
+
+        def start():
+            response = current_app.make_response(view(**view_args))
+            headers = [(name, value) for name, value in response.headers if name not in ("Content-Type", "Content-Length")]
+            chunks = response.response if response.is_streamed else [response.get_data(as_text=True)]
+            return (response.status_code, response.mimetype, headers, stream_errors), chunks
+
+        (status, mimetype, headers, _), chunks, led = request_flights.share(
+            flight_key, start, on_complete, on_abandon,
+            abandoned=sse_event("error", {"error": "The original request was interrupted"}),
+        )
+        coalesced_requests.inc(endpoint=endpoint, outcome="led" if led else "coalesced")
+        return Response(chunks, status=status, mimetype=mimetype, headers=headers)
+    return wrapper
 
 master_agent = MasterAgent()
 discover_agent = DiscoverAgent()
@@ -198,7 +1014,67 @@ tutor_agent = TutorAgent()
 learning_tracker_agent = LearningTrackerAgent()
 guide_agent = GuideAgent()
 
-@app.route('/initialize', methods=['POST'])
+# Background job handlers
+def run_tracking_summary_job(student_id):
+    student = StudentContext(student_id)
+    learning_tracker_agent.update_tracking_summary(student)
+    student.commit()
+
+def run_basic_summary_job(student_id, questions_answer):
+    student = StudentContext(student_id)
+    student.set("basic_summary", create_summary(questions_answer, student))
+    student.commit()
+
+job_queue.register("update_tracking_summary", background(run_tracking_summary_job))
+job_queue.register("compact_tracking_summary", background(learning_tracker_agent.compact_tracking_summary))
+job_queue.register("save_basic_summary", background(run_basic_summary_job))
+job_queue.register("summarize_session", background(lambda session_id: ChatSession.load(session_id).summarize()))
+
+# Bulk onboarding: roster summaries run at background priority so they queue behind live students
+roster_import = RosterImport(
+    students_collection,
+    db[os.getenv("ROSTER_IMPORTS_COLLECTION_NAME", "roster_imports")],
+    background(lambda row: create_summary(row, summary_type="basic")),
+    concurrency=int(os.getenv("ROSTER_CONCURRENCY", "8")),
+    batch_size=int(os.getenv("ROSTER_BATCH_SIZE", "50")),
+)
+# Banked quizzes; a key with no banked quiz yet generates one on demand (see pregenerate_quizzes.py)
+quiz_bank = QuizBank(
+    db[os.getenv("QUIZ_COLLECTION_NAME", "quizzes")],
+    lambda messages: chat_completion("quiz_generation", messages=messages),
+)
+
+# Index creation is idempotent but costs a round trip per index, so it runs once per process at
+# startup rather than at import; set MONGO_ENSURE_INDEXES=0 when a deploy step creates them
+def ensure_indexes():
+    conversations_collection.create_index([("student_id", ASCENDING), ("agent", ASCENDING), ("subject", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+    conversations_collection.create_index([("student_id", ASCENDING), ("agent", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+    session_turns_collection.create_index([("session_id", ASCENDING), ("index", DESCENDING)])
+    tutor_answers_collection.create_index([("created_at", ASCENDING)])
+    for store in (score_store, roadmap_store, idempotency_store, completion_cache, roster_import, quiz_bank):
+        store.ensure_indexes()
+
+# Per-process startup: indexes, job workers and warm clients. Runs once in each worker process,
+# on its first request or earlier via warm_up(); a failure is retried on the next request
+def start_process():
+    if MONGO_ENSURE_INDEXES:
+        ensure_indexes()
+    job_queue.start()
+    mongo_client.get().admin.command("ping")
+    openai_client.get()
+    return os.getpid()
+
+process_started = ProcessLocal(start_process)
+
+# For a pre-fork server's post_fork hook, so a worker is warm before it takes traffic
+def warm_up():
+    process_started.get()
+
+ROSTER_MAX_ROWS = int(os.getenv("ROSTER_MAX_ROWS", "5000"))
+ROSTER_FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+@api.route('/initialize', methods=['POST'])
+@coalesced(shared=False)
 def initialize_student():
     data = request.json
     name = data.get('name')
@@ -219,30 +1095,422 @@ def initialize_student():
     
     return jsonify({"student_id": str(result.inserted_id), "basic_summary": student_summary})
 
-@app.route('/agent', methods=['POST'])
-def agent():
-    query = request.json['query']
-    student_id = request.json['student_id']
-    agent_type = master_agent.decide_agent(query, student_id)
+# The selected agent's completion as (completion agent, messages, callback that persists its final
+# text). answer is a standalone question's shared tutor answer, which is then only personalized
+def prepare_agent_call(agent_type, query, student, question=None, answer=None, topic=None):
+    if agent_type == "discover_agent":
+        return agent_type, discover_agent.student_info_messages(student, query), lambda text: None
+    elif agent_type == "tutor_agent" and answer is not None:
+        return "tutor_personalize", tutor_agent.personalize_messages(question, answer, student), lambda text: None
+    elif agent_type == "tutor_agent":
+        return agent_type, tutor_agent.explain_topic_messages(query, student), lambda text: None
+    elif agent_type == "learning_tracker_agent":
+        return (agent_type, learning_tracker_agent.evaluate_student_messages(query, student),
+                lambda text: learning_tracker_agent.log_conversation(student, query, text, "learning_tracker_agent", topic=topic))
+    elif agent_type == "guide_agent":
+        return agent_type, guide_agent.suggest_path_messages(query, student), lambda text: guide_agent.save_path(student, text)
+    return agent_type, None, lambda text: None
+
+# Speculation: when the fast router is unsure and the LLM router has to run, start the
+# predicted agent's completion alongside it and keep the answer only if the router agrees
+SPECULATION_MIN_CONFIDENCE = float(os.getenv("SPECULATION_MIN_CONFIDENCE", "0.5"))
+speculation_pool = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATION_WORKERS", "8")))
+speculation_counters = Counter()
+speculation_lock = threading.Lock()
+
+def should_speculate(decision, student):
+    return (decision.source == "fallback" and decision.agent is not None
+            and decision.confidence >= SPECULATION_MIN_CONFIDENCE and bool(student.get('basic_summary')))
+
+def count_speculation(outcome, messages=None, response=None):
+    with speculation_lock:
+        speculation_counters[outcome] += 1
+        if messages is not None:
+            wasted = sum(estimate_tokens(message['content']) for message in messages) + estimate_tokens(response)
+            speculation_counters["wasted_tokens"] += wasted
+
+def speculation_stats():
+    with speculation_lock:
+        attempts = speculation_counters["hits"] + speculation_counters["misses"]
+        return {
+            "attempts": attempts,
+            "hits": speculation_counters["hits"],
+            "misses": speculation_counters["misses"],
+            "cancelled": speculation_counters["cancelled"],
+            "hit_rate": speculation_counters["hits"] / attempts if attempts else 0.0,
+            "wasted_tokens": speculation_counters["wasted_tokens"],
+            "min_confidence": SPECULATION_MIN_CONFIDENCE,
+        }
+
+# The guessed agent's completion as (completion agent, messages, on_complete, shared); a guess that
+# cannot even build its prompt is simply not speculated on. A standalone tutor question checks the
+# answer index first: a served answer speculates on its personalization, otherwise the shared
+# answer is generated (shared=True), then remembered and personalized once the router agrees
+def speculative_call(agent_type, query, student, question=None, topic=None):
+    try:
+        if agent_type == "tutor_agent" and question:
+            match = tutor_agent.lookup(question, student)
+            if not (match and match['served']):
+                return ("tutor_agent", tutor_agent.shared_answer_messages(question, match),
+                        lambda text: tutor_agent.remember(question, text, student), True)
+            return prepare_agent_call(agent_type, query, student, question, match['answer']) + (False,)
+        return prepare_agent_call(agent_type, query, student, topic=topic) + (False,)
+    except Exception:
+        return None, None, None, False
+
+# A speculated completion streamed in the speculation pool while the router decides. Its deltas
+# are buffered, so on a hit they are replayed and the rest follows as it arrives; cancelling
+# closes the stream, which hands its scheduler slot back
+class SpeculativeStream:
+    def __init__(self, agent, messages):
+        self.messages = messages
+        self.deltas = queue.Queue()
+        self.cancelled = threading.Event()
+        speculation_pool.submit(copy_context().run, self.run, agent, messages)
+
+    def run(self, agent, messages):
+        stream = stream_completion(agent, messages)
+        try:
+            for delta in stream:
+                if self.cancelled.is_set():
+                    break
+                self.deltas.put(delta)
+        except Exception as e:
+            self.deltas.put(e)
+        finally:
+            stream.close()
+            self.deltas.put(None)
+
+    def __iter__(self):
+        while True:
+            delta = self.deltas.get()
+            if delta is None:
+                return
+            if isinstance(delta, Exception):
+                raise delta
+            yield delta
+
+    def cancel(self):
+        self.cancelled.set()
+
+# topic is the chat session's topic, if any
+def run_agent(query, student, question=None, topic=None):
+    with tracer.span("fast_route"):
+        decision = fast_router.route(query)
+    speculation = None
+    if should_speculate(decision, student):
+        call_agent, messages, on_complete, shared = speculative_call(decision.agent, query, student, question, topic)
+        if messages is not None:
+            speculation = (messages, on_complete, shared, speculation_pool.submit(copy_context().run, chat_completion, call_agent, messages))
+    agent_type = master_agent.decide_agent(query, student, decision)
+    
+    if speculation:
+        messages, on_complete, shared, future = speculation
+        if agent_type == decision.agent:
+            response = future.result()
+            # Side effects are deferred until the router has confirmed the guess
+            on_complete(response)
+            if shared:
+                response = tutor_agent.personalize(question, response, student)
+            count_speculation("hits")
+            return response, agent_type
+        count_speculation("misses")
+        # A blocking OpenAI call cannot be interrupted; count what it burns once it finishes
+        future.add_done_callback(lambda done: count_speculation("wasted", messages, done.result() if not done.exception() else ""))
     
     if agent_type == "discover_agent":
-        response = discover_agent.get_student_info(student_id, query)
+        response = discover_agent.get_student_info(student, query)
     elif agent_type == "tutor_agent":
-        # response = tutor_agent.explain_topic(query, student_id, ResponseTone)
-        response = tutor_agent.explain_topic(query, student_id)
+        # response = tutor_agent.explain_topic(query, student, ResponseTone)
+        response = tutor_agent.explain_topic(query, student, question)
         
     elif agent_type == "learning_tracker_agent":
-        response = learning_tracker_agent.evaluate_student(query, student_id)
+        response = learning_tracker_agent.evaluate_student(query, student, topic)
+    elif agent_type == "guide_agent":
+        response = guide_agent.suggest_path(query, student)
+    else:
+        response = "Agent not found."
+    return response, agent_type
+
+async def run_agent_async(query, student, question=None, topic=None):
+    with tracer.span("fast_route"):
+        decision = fast_router.route(query)
+    speculation = None
+    if should_speculate(decision, student):
+        call_agent, messages, on_complete, shared = speculative_call(decision.agent, query, student, question, topic)
+        if messages is not None:
+            speculation = (messages, on_complete, shared, asyncio.create_task(async_chat_completion(call_agent, messages)))
+    agent_type = await master_agent.decide_agent_async(query, student, decision)
+    
+    if speculation:
+        messages, on_complete, shared, task = speculation
+        if agent_type == decision.agent:
+            response = await task
+            if shared:
+                await asyncio.to_thread(on_complete, response)
+                response = await async_chat_completion("tutor_personalize", messages=tutor_agent.personalize_messages(question, response, student))
+            else:
+                on_complete(response)
+            count_speculation("hits")
+            return response, agent_type
+        count_speculation("misses")
+        if task.done():
+            count_speculation("wasted", messages, task.result() if not task.exception() else "")
+        else:
+            task.cancel()
+            count_speculation("cancelled", messages)
+    
+    if agent_type == "discover_agent":
+        response = await discover_agent.get_student_info_async(student, query)
+    elif agent_type == "tutor_agent":
+        response = await tutor_agent.explain_topic_async(query, student, question)
+    elif agent_type == "learning_tracker_agent":
+        response = await learning_tracker_agent.evaluate_student_async(query, student, topic)
     elif agent_type == "guide_agent":
-        response = guide_agent.suggest_path(query, student_id)
+        response = await guide_agent.suggest_path_async(query, student)
     else:
         response = "Agent not found."
+    return response, agent_type
+
+@api.route('/agent', methods=['POST'])
+@coalesced
+def agent():
+    query = request.json['query']
+    student = StudentContext(request.json['student_id'])
+    response, agent_type = run_agent(query, student, question=query)
+    student.commit()
     return jsonify({"response": response, "model": agent_type})
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# A stream's failure event. The response is still a 200, so this also flags the request for
+# coalesced(), which then keeps it out of the Idempotency-Key store and lets a retry run again
+def sse_error(error, **details):
+    if "stream_errors" in g:
+        g.stream_errors.append(error)
+    return sse_event("error", dict({"error": error}, **details))
+
+# SSE stream of one agent answer; on_response(response, agent_type) runs before the final commit
+# The streamed form of run_agent's speculation; side effects still wait for the router
+def agent_event_stream(query, student, on_response=None, question=None, topic=None):
+    with tracer.span("fast_route"):
+        decision = fast_router.route(query)
+    speculation = None
+    if should_speculate(decision, student):
+        call_agent, messages, on_complete, shared = speculative_call(decision.agent, query, student, question, topic)
+        if messages is not None:
+            speculation = (SpeculativeStream(call_agent, messages), on_complete, shared)
+    agent_type = master_agent.decide_agent(query, student, decision)
+    if speculation:
+        if agent_type == decision.agent:
+            count_speculation("hits")
+        else:
+            speculation[0].cancel()
+            count_speculation("misses")
+            count_speculation("cancelled", speculation[0].messages)
+            speculation = None
+
+    def generate():
+        yield sse_event("agent", {"model": agent_type})
+        try:
+            if speculation:
+                deltas, on_complete, shared = speculation
+                if shared:
+                    # The speculated shared answer is only the input of this student's personalization
+                    answer = "".join(deltas)
+                    on_complete(answer)
+                    call_agent, messages, on_complete = prepare_agent_call(agent_type, query, student, question, answer, topic)
+                    deltas = stream_completion(call_agent, messages)
+            else:
+                # A standalone tutor question first gets its shared answer; only the personalization streams
+                answer = None
+                if agent_type == "tutor_agent" and question:
+                    answer, generated = tutor_agent.shared_answer(question, student)
+                    if generated:
+                        tutor_agent.remember(question, answer, student)
+                call_agent, messages, on_complete = prepare_agent_call(agent_type, query, student, question, answer, topic)
+                deltas = stream_completion(call_agent, messages) if messages is not None else None
+            if deltas is None:
+                response = "Student not found." if agent_type == "discover_agent" else "Agent not found."
+                yield sse_event("delta", {"delta": response})
+            else:
+                parts = []
+                for delta in deltas:
+                    parts.append(delta)
+                    yield sse_event("delta", {"delta": delta})
+                response = "".join(parts)
+                # Persist only once the full completion has arrived
+                on_complete(response)
+                student.commit()
+            if on_response:
+                on_response(response, agent_type)
+            yield sse_event("done", {"response": response, "model": agent_type})
+        except Exception as e:
+            yield sse_error(str(e))
+        finally:
+            # A client that disconnects mid-answer also stops the speculated stream
+            if speculation:
+                speculation[0].cancel()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+@api.route('/agent/stream', methods=['POST'])
+@coalesced
+def agent_stream():
+    query = request.json['query']
+    student = StudentContext(request.json['student_id'])
+    return agent_event_stream(query, student, question=query)
     
-@app.route('/get-learning-summary/<student_id>', methods=['GET'])
+@api.route('/sessions', methods=['POST'])
+@coalesced
+def create_session():
+    try:
+        data = request.json
+        student_id = data.get('student_id')
+        kind = data.get('kind', "ask")
+        topic = data.get('topic')
+        
+        if not student_id or kind not in ChatSession.KINDS or (kind == "evaluate" and not topic):
+            return jsonify({"error": "Missing student_id, or invalid kind/topic"}), 400
+        if not StudentContext(student_id).exists:
+            return jsonify({"error": "Student not found"}), 404
+        
+        session = ChatSession.create(student_id, kind, topic)
+        return jsonify({"session_id": str(session.session_id)}), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/sessions/<session_id>/turns', methods=['GET'])
+def get_session_turns(session_id):
+    try:
+        query = {"session_id": ObjectId(session_id)}
+        before = request.args.get('before', type=int)
+        if before is not None:
+            query["index"] = {"$lt": before}
+        limit = min(request.args.get('limit', default=50, type=int), 200)
+        turns = list(session_turns_collection.find(query, {"_id": 0, "session_id": 0}).sort("index", DESCENDING).limit(limit))
+        for turn in turns:
+            turn['timestamp'] = turn['timestamp'].isoformat()
+        turns.reverse()
+        next_before = turns[0]['index'] if len(turns) == limit else None
+        return jsonify({"turns": turns, "next_before": next_before}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def session_turn_request(session_id):
+    session = ChatSession.load(session_id)
+    if not session:
+        return None, None, None, None
+    message = (request.json or {}).get('message', "")
+    if session.document['kind'] == "evaluate" and session.document['turn_count'] == 0:
+        message = message or session.opening()
+    query, overflow = session.build_query(message)
+    return session, message, query, overflow
+
+# The first message of an ask session has no conversation around it, so it can be matched
+# against past tutor answers
+def standalone_question(session, message):
+    return message if session.document['kind'] == "ask" and session.document['turn_count'] == 0 else None
+
+@api.route('/sessions/<session_id>/turns', methods=['POST'])
+@coalesced
+def post_session_turn(session_id):
+    try:
+        session, message, query, overflow = session_turn_request(session_id)
+        if not session:
+            return jsonify({"error": "Session not found"}), 404
+        if not message:
+            return jsonify({"error": "Missing message"}), 400
+        
+        student = StudentContext(session.student_id)
+        response, agent_type = run_agent(query, student, standalone_question(session, message), session.document['topic'])
+        student.commit()
+        session.record(message, response, agent_type, overflow)
+        return jsonify({"response": response, "model": agent_type}), 200
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/sessions/<session_id>/turns/stream', methods=['POST'])
+@coalesced
+def stream_session_turn(session_id):
+    session, message, query, overflow = session_turn_request(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+    if not message:
+        return jsonify({"error": "Missing message"}), 400
+    
+    student = StudentContext(session.student_id)
+    return agent_event_stream(query, student, lambda response, agent_type: session.record(message, response, agent_type, overflow),
+                              standalone_question(session, message), session.document['topic'])
+
+@api.route('/models/stats', methods=['GET'])
+def model_stats():
+    stats = usage_recorder.stats(recent=request.args.get('recent', default=0, type=int))
+    stats['registry'] = {agent: model_registry.resolve(agent) for agent in AGENT_TASKS}
+    return jsonify(stats), 200
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+@api.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    return jsonify(llm_scheduler.stats()), 200
+
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(completion_cache.stats()), 200
+
+@api.route('/answer-index/stats', methods=['GET'])
+def answer_index_stats():
+    return jsonify(answer_index.stats()), 200
+
+@api.route('/router/stats', methods=['GET'])
+def router_stats():
+    limit = request.args.get('limit', default=0, type=int)
+    stats = fast_router.stats()
+    stats['speculation'] = speculation_stats()
+    if limit:
+        stats['recent'] = fast_router.recent_decisions(limit)
+    return jsonify(stats), 200
+
+@api.route('/conversations/<student_id>', methods=['GET'])
+def get_conversations(student_id):
+    try:
+        before = request.args.get('before')
+        before_id = request.args.get('before_id')
+        before = datetime.fromisoformat(before) if before else None
+        before_id = ObjectId(before_id) if before_id else None
+    except (ValueError, InvalidId) as e:
+        return jsonify({"error": f"Invalid cursor: {e}"}), 400
+    try:
+        limit = min(request.args.get('limit', default=20, type=int), 100)
+        conversations = find_conversations(
+            student_id,
+            agent=request.args.get('agent'),
+            subject=request.args.get('subject'),
+            before=before,
+            before_id=before_id,
+            limit=limit,
+        )
+        next_before = next_before_id = None
+        if len(conversations) == limit:
+            next_before, next_before_id = conversations[-1]['timestamp'].isoformat(), str(conversations[-1]['_id'])
+        for conv in conversations:
+            del conv['_id']
+            conv['timestamp'] = conv['timestamp'].isoformat()
+        return jsonify({"conversations": conversations, "next_before": next_before, "next_before_id": next_before_id}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/get-learning-summary/<student_id>', methods=['GET'])
 def get_tracking_summary(student_id):
     try:
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
+        student = students_collection.find_one({"_id": ObjectId(student_id)}, {"tracking_summary": 1})
         
         if not student:
             return jsonify({"error": "Student not found"}), 404
@@ -253,7 +1521,101 @@ def get_tracking_summary(student_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/save-basic-summary', methods=['POST'])
+def roadmap_payload(document, current_hash):
+    return {
+        "subject": document['subject'],
+        "version": document['version'],
+        "roadmap": document['roadmap'],
+        "refreshed": document.get('refreshed', False),
+        "created_at": document['created_at'].isoformat(),
+        "stale": document['inputs_hash'] != current_hash,
+    }
+
+# Latest stored roadmap for a subject (or ?version=N); never generates. "stale" means the
+# student's summaries have changed since it was built
+@api.route('/roadmaps/<student_id>/<subject>', methods=['GET'])
+def get_roadmap(student_id, subject):
+    try:
+        student = StudentContext(student_id)
+        if not student.exists:
+            return jsonify({"error": "Student not found"}), 404
+        version = request.args.get('version', type=int)
+        if version:
+            document = roadmap_store.get(student.student_id, subject, version)
+        else:
+            document = roadmap_store.latest(student.student_id, subject)
+        if not document:
+            return jsonify({"error": "Roadmap not found"}), 404
+        return jsonify(roadmap_payload(document, guide_agent.roadmap_hash(student, subject))), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/roadmaps/<student_id>/<subject>/versions', methods=['GET'])
+def get_roadmap_versions(student_id, subject):
+    try:
+        student = StudentContext(student_id)
+        if not student.exists:
+            return jsonify({"error": "Student not found"}), 404
+        current_hash = guide_agent.roadmap_hash(student, subject)
+        limit = min(request.args.get('limit', default=20, type=int), 100)
+        versions = roadmap_store.versions(student.student_id, subject, limit)
+        for entry in versions:
+            entry['created_at'] = entry['created_at'].isoformat()
+            entry['stale'] = entry.pop('inputs_hash') != current_hash
+        return jsonify({"subject": subject, "versions": versions}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# The stored roadmap while it is current; otherwise, or with {"refresh": true}, a new version
+@api.route('/roadmaps/<student_id>/<subject>', methods=['POST'])
+@coalesced
+def build_roadmap(student_id, subject):
+    try:
+        refresh = bool((request.get_json(silent=True) or {}).get('refresh'))
+        student = StudentContext(student_id)
+        if not student.exists:
+            return jsonify({"error": "Student not found"}), 404
+        document, generated = guide_agent.roadmap(student, subject, refresh)
+        student.commit()
+        return jsonify(dict(roadmap_payload(document, document['inputs_hash']), generated=generated)), 200
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# SSE counterpart of build_roadmap: a current roadmap arrives as a single "done" event
+@api.route('/roadmaps/<student_id>/<subject>/stream', methods=['POST'])
+@coalesced
+def stream_roadmap(student_id, subject):
+    refresh = bool((request.get_json(silent=True) or {}).get('refresh'))
+    student = StudentContext(student_id)
+    if not student.exists:
+        return jsonify({"error": "Student not found"}), 404
+    current_hash = guide_agent.roadmap_hash(student, subject)
+    latest = roadmap_store.latest(student.student_id, subject)
+
+    def generate():
+        yield sse_event("agent", {"model": "guide_agent"})
+        try:
+            if latest and not refresh and latest['inputs_hash'] == current_hash:
+                document, generated = latest, False
+            else:
+                parts = []
+                for delta in stream_completion("guide_agent", guide_agent.roadmap_messages(subject, student), refresh=refresh):
+                    parts.append(delta)
+                    yield sse_event("delta", {"delta": delta})
+                document, generated = guide_agent.save_roadmap(student, subject, "".join(parts), current_hash, refresh), True
+                student.commit()
+            payload = dict(roadmap_payload(document, current_hash), generated=generated)
+            yield sse_event("done", dict(payload, response=document['roadmap'], model="guide_agent"))
+        except Exception as e:
+            yield sse_error(str(e))
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+@api.route('/save-basic-summary', methods=['POST'])
+@coalesced
 def save_basic_summary():
     try:
         data = request.json
@@ -263,14 +1625,236 @@ def save_basic_summary():
         if not student_id or not questions_answer:
             return jsonify({"error": "Missing student_id or questions_answer"}), 400
         
-        summary = create_summary(questions_answer, student_id)
-        result = students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"basic_summary": summary}})
+        student = StudentContext(student_id)
+        if not student.exists:
+            return jsonify({"error": "Student not found"}), 404
         
-        if result.matched_count == 0:
+        job_id = job_queue.enqueue("save_basic_summary", {"student_id": student_id, "questions_answer": questions_answer})
+        return jsonify({"message": "Basic summary update queued", "job_id": job_id}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Roster upload (raw CSV/NDJSON body or a multipart "roster" file); progress streams back as SSE.
+# Posting the same roster again, or passing the same ?import_id=, resumes an interrupted import
+@api.route('/rosters', methods=['POST'])
+@coalesced
+def import_roster():
+    upload = request.files.get('roster')
+    text = upload.read().decode('utf-8') if upload else request.get_data(as_text=True)
+    format = request.args.get('format') or ROSTER_FORMATS.get(upload.mimetype if upload else request.mimetype)
+    try:
+        rows = parse_roster(text, format)
+    except (ValueError, csv.Error) as e:
+        return jsonify({"error": f"Invalid roster: {e}"}), 400
+    if not rows:
+        return jsonify({"error": "Roster is empty"}), 400
+    if len(rows) > ROSTER_MAX_ROWS:
+        return jsonify({"error": f"Roster has {len(rows)} rows; the limit is {ROSTER_MAX_ROWS}"}), 413
+    import_id = request.args.get('import_id') or roster_import_id(text)
+
+    def generate():
+        try:
+            for event, data in roster_import.run(import_id, rows):
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_error(str(e), import_id=import_id)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+@api.route('/rosters/<import_id>', methods=['GET'])
+def get_roster_import(import_id):
+    try:
+        status = roster_import.status(import_id)
+        if not status:
+            return jsonify({"error": "Roster import not found"}), 404
+        return jsonify(status), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Previous quiz results on a topic, newest first
+def quiz_history(student_id, topic):
+    return list(conversations_collection.find(
+        {"student_id": ObjectId(student_id), "agent": "learning_tracker_agent", "subject": topic, "quiz_id": {"$exists": True}},
+        {"_id": 0, "quiz_id": 1, "difficulty": 1, "score": 1},
+    ).sort("timestamp", DESCENDING).limit(CONVERSATION_HISTORY_LIMIT))
+
+def quiz_evaluation(quiz, graded):
+    strong = sorted({result["concept"] for result in graded["results"] if result["correct"] and result["concept"]})
+    weak = sorted({result["concept"] for result in graded["results"] if not result["correct"] and result["concept"]})
+    evaluation = (f"{quiz['topic']} - {graded['score']}% ({level(graded['score'])}). "
+                  f"{quiz['difficulty'].capitalize()} quiz: {graded['earned']}/{graded['possible']}.")
+    if strong:
+        evaluation += f" Strong: {', '.join(strong)}."
+    if weak:
+        evaluation += f" Needs work: {', '.join(weak)}."
+    return evaluation
+
+QUIZ_FEEDBACK_PROMPT = PromptTemplate(
+    "quiz_feedback",
+    "You are a friendly tutor giving short, encouraging feedback on a student's written quiz answers. For each answer, say what was right and what was missing in one or two sentences. Do not give a score.",
+)
+
+def quiz_feedback_messages(quiz, graded):
+    lines = []
+    for result in graded["results"]:
+        question = quiz["questions"][result["index"]]
+        if question["type"] == "open" and result["answer"]:
+            lines.append(f"Question: {question['question']}\nExpected points: {'; '.join(question['key_points'])}\nStudent answer: {result['answer']}")
+    if not lines:
+        return None
+    return prompt_builder.build(QUIZ_FEEDBACK_PROMPT, "\n\n".join(lines))
+
+@api.route('/quizzes', methods=['POST'])
+@coalesced
+def start_quiz():
+    try:
+        data = request.json
+        student_id = data.get('student_id')
+        subject = data.get('subject')
+        topic = data.get('topic')
+        if not student_id or not subject or not topic:
+            return jsonify({"error": "Missing student_id, subject or topic"}), 400
+        student = StudentContext(student_id)
+        if not student.exists:
+            return jsonify({"error": "Student not found"}), 404
+        
+        history = quiz_history(student_id, topic)
+        difficulty = data.get('difficulty')
+        if difficulty not in DIFFICULTIES:
+            difficulty = next_difficulty(history[0]['difficulty'], history[0]['score']) if history else "medium"
+        quiz, banked = quiz_bank.draw(subject, topic, student.get('standard'), difficulty, [entry['quiz_id'] for entry in history])
+        return jsonify(dict(public_quiz(quiz), banked=banked)), 200
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Scored against the stored answer key; the model is only asked for feedback on open answers
+@api.route('/quizzes/<quiz_id>/answers', methods=['POST'])
+@coalesced
+def submit_quiz(quiz_id):
+    try:
+        data = request.json
+        student_id = data.get('student_id')
+        answers = data.get('answers')
+        if not student_id or not isinstance(answers, list):
+            return jsonify({"error": "Missing student_id or answers"}), 400
+        quiz = quiz_bank.get(quiz_id)
+        if not quiz:
+            return jsonify({"error": "Quiz not found"}), 404
+        student = StudentContext(student_id)
+        if not student.exists:
             return jsonify({"error": "Student not found"}), 404
-        return jsonify({"message": "Basic summary saved successfully"}), 200
+        
+        graded = grade(quiz, answers)
+        feedback = None
+        messages = quiz_feedback_messages(quiz, graded) if data.get('feedback', True) else None
+        if messages:
+            feedback = chat_completion("quiz_feedback", messages=messages)
+        evaluation = quiz_evaluation(quiz, graded)
+        learning_tracker_agent.log_conversation(
+            student, quiz['topic'], evaluation, "learning_tracker_agent",
+            scores=[(quiz['subject'], quiz['topic'], graded['score'])],
+            quiz_id=quiz['_id'], difficulty=quiz['difficulty'], score=graded['score'],
+        )
+        student.commit()
+        return jsonify(dict(
+            graded,
+            level=level(graded['score']),
+            evaluation=evaluation,
+            feedback=feedback,
+            next_difficulty=next_difficulty(quiz['difficulty'], graded['score']),
+        )), 200
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Filters shared by the analytics endpoints: subject, topic, standard, cohort (roster import id),
+# student_id and an ISO since/until window
+def score_query():
+    since = request.args.get('since')
+    until = request.args.get('until')
+    student_id = request.args.get('student_id')
+    return score_store.match(
+        subject=request.args.get('subject'),
+        topic=request.args.get('topic'),
+        standard=request.args.get('standard'),
+        cohort=request.args.get('cohort'),
+        student_id=ObjectId(student_id) if student_id else None,
+        since=datetime.fromisoformat(since) if since else None,
+        until=datetime.fromisoformat(until) if until else None,
+    )
+
+@api.route('/analytics/scores/distribution', methods=['GET'])
+def score_distribution():
+    try:
+        query = score_query()
+    except (ValueError, InvalidId) as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+    try:
+        bins = min(max(request.args.get('bins', default=10, type=int), 1), 100)
+        return jsonify(score_store.distribution(query, bins)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/analytics/scores/progress', methods=['GET'])
+def score_progress():
+    interval = request.args.get('interval', "week")
+    if interval not in INTERVALS:
+        return jsonify({"error": f"interval must be one of {', '.join(INTERVALS)}"}), 400
+    try:
+        query = score_query()
+    except (ValueError, InvalidId) as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+    try:
+        return jsonify(score_store.progress(query, interval)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Liveness: the process is up and serving requests
+@api.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
+# Readiness: this worker has started up and MongoDB answers a ping
+@api.route('/ready', methods=['GET'])
+def ready():
+    try:
+        process_started.get()
+        started = time.perf_counter()
+        mongo_client.get().admin.command("ping")
+        mongo_ms = round((time.perf_counter() - started) * 1000, 1)
+    except Exception as e:
+        return jsonify({"status": "unavailable", "pid": os.getpid(), "error": str(e)}), 503
+    return jsonify({
+        "status": "ready",
+        "pid": os.getpid(),
+        "mongo_ms": mongo_ms,
+        "job_workers": len(job_queue.threads),
+        "mongo_pool": MONGO_POOL_OPTIONS,
+    }), 200
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job = job_queue.status(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+# Application factory. Importing this module opens no connections and starts no threads, so a
+# pre-fork server can preload it, e.g. gunicorn --preload -w 8 "backend:create_app()"
+def create_app():
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
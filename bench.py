@@ -0,0 +1,355 @@
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+from fake_openai import FakeOpenAIConfig, serve
+
+# Load/benchmark harness: boots backend.py in-process against fake_openai.py and a Mongo stand-in
+# (mongomock by default, or a real server with --mongo-uri), drives a weighted traffic mix from
+# concurrent virtual students and writes a JSON report for comparing runs across commits.
+#   python bench.py --users 16 --duration 60 --latency 0.5
+#   python bench.py --compare bench_results/<older>.json
+SUBJECTS = ["Physics", "Biology", "Mathematics", "History", "Chemistry"]
+TOPICS = ["motion", "cells", "fractions", "the french revolution", "atoms", "light", "ecosystems"]
+CHAT_MESSAGES = [
+    "Can you explain {topic} simply?",
+    "Why does that happen?",
+    "Can you give me an example from daily life?",
+    "What is a common mistake students make here?",
+    "How is this related to what we covered before?",
+    "Summarize what we discussed so far.",
+]
+ANSWERS = ["I think it is because of energy transfer.", "I am not sure, maybe the second option.", "It depends on the mass."]
+DEFAULT_MIX = "evaluate=2,chat=4,roadmap=1,initialize=1"
+COMMAND_NAMES = {
+    "find": "find", "find_one": "find", "insert_one": "insert", "insert_many": "insert",
+    "update_one": "update", "update_many": "update", "find_one_and_update": "findAndModify",
+    "delete_one": "delete", "delete_many": "delete", "count_documents": "aggregate",
+    "aggregate": "aggregate", "create_index": "createIndexes",
+}
+
+# mongomock has no command monitoring; time its collection methods into the same metrics and trace
+# spans that telemetry.MongoCommandListener produces for a real server
+def instrument_mongomock(mongomock, tracer):
+    def timed(method, command):
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return method(self, *args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                tracer.mongo_seconds.observe(elapsed, collection=self.name, command=command, outcome=outcome)
+                tracer.add_span("mongo", started, elapsed, collection=self.name, command=command, outcome=outcome)
+        return wrapper
+
+    for name, command in COMMAND_NAMES.items():
+        setattr(mongomock.Collection, name, timed(getattr(mongomock.Collection, name), command))
+
+def boot_backend(args, openai_url, trace_path):
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": openai_url,
+        "MONGODB_URI": args.mongo_uri or "mongodb://localhost:27017",
+        "DB_NAME": f"padhai_bench_{int(time.time())}",
+        "COLLECTION_NAME": "students",
+        "TRACE_LOG_PATH": trace_path,
+        "TRACE_SAMPLE_RATE": "1.0",
+        "ROUTER_LOG_PATH": "",
+    })
+    if not args.cache:
+        os.environ["LLM_CACHE_AGENTS"] = ""
+    if not args.mongo_uri:
+        import mongomock
+        import pymongo
+
+        class MongomockClient(mongomock.MongoClient):
+            # Drops the TLS, monitoring and pool options mongomock has no use for
+            def __init__(self, host=None, tlsCAFile=None, event_listeners=None, **options):
+                super().__init__(host)
+
+        pymongo.MongoClient = MongomockClient
+    import backend
+    if not args.mongo_uri:
+        instrument_mongomock(mongomock, backend.tracer)
+    return backend
+
+def serve_app(app, port):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return weights
+
+class VirtualStudent:
+    def __init__(self, base_url, rng, results, chat_turns):
+        import requests
+        self.http = requests.Session()
+        self.base_url = base_url
+        self.rng = rng
+        self.results = results
+        self.chat_turns = chat_turns
+        self.student_id = None
+        self.subject = rng.choice(SUBJECTS)
+
+    def call(self, kind, method, path, body=None):
+        started = time.perf_counter()
+        status = 0
+        data = None
+        try:
+            response = self.http.request(method, self.base_url + path, json=body, timeout=300)
+            status = response.status_code
+            data = response.json()
+        except Exception:
+            pass
+        self.results.add(kind, time.perf_counter() - started, status)
+        return data if 200 <= status < 300 else None
+
+    def initialize(self):
+        data = self.call("initialize", "POST", "/initialize", {
+            "name": f"Student {self.rng.randrange(10000)}",
+            "standard": str(self.rng.randint(6, 12)),
+            "subject": self.subject,
+            "like_study": self.rng.choice(["visual examples", "short notes", "practice questions"]),
+        })
+        if data:
+            self.student_id = data["student_id"]
+
+    def session(self, kind, topic=None):
+        data = self.call("session_create", "POST", "/sessions", {"student_id": self.student_id, "kind": kind, "topic": topic})
+        return data["session_id"] if data else None
+
+    def evaluate(self):
+        topic = self.rng.choice(TOPICS)
+        session_id = self.session("evaluate", topic)
+        if session_id:
+            self.call("evaluate_turn", "POST", f"/sessions/{session_id}/turns", {"message": ""})
+            for _ in range(2):
+                self.call("evaluate_turn", "POST", f"/sessions/{session_id}/turns", {"message": self.rng.choice(ANSWERS)})
+
+    # One multi-turn chat; the server-side transcript grows with every turn
+    def chat(self):
+        topic = self.rng.choice(TOPICS)
+        session_id = self.session("ask")
+        if session_id:
+            for message in CHAT_MESSAGES[:self.chat_turns]:
+                self.call("chat_turn", "POST", f"/sessions/{session_id}/turns", {"message": message.format(topic=topic)})
+
+    # Served from the stored version unless the student's summaries changed since it was built
+    def roadmap(self):
+        self.call("roadmap", "POST", f"/roadmaps/{self.student_id}/{quote(self.subject, safe='')}", {})
+
+SCENARIOS = {
+    "initialize": VirtualStudent.initialize,
+    "evaluate": VirtualStudent.evaluate,
+    "chat": VirtualStudent.chat,
+    "roadmap": VirtualStudent.roadmap,
+}
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def add(self, kind, elapsed, status):
+        with self.lock:
+            self.latencies[kind].append(elapsed)
+            self.statuses[kind][status] += 1
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def latency_summary(values, elapsed):
+    return {
+        "requests": len(values),
+        "rps": round(len(values) / elapsed, 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        "max_ms": round(max(values, default=0.0) * 1000, 1),
+    }
+
+# Per-endpoint LLM and Mongo work, read back from the backend's own per-request trace log
+def trace_summary(trace_path):
+    totals = defaultdict(Counter)
+    with open(trace_path, encoding="utf-8") as f:
+        for line in f:
+            trace = json.loads(line)
+            if trace["endpoint"] in (None, "metrics"):
+                continue
+            row = totals[trace["endpoint"]]
+            row["requests"] += 1
+            for span in trace["spans"]:
+                if span["kind"] == "mongo":
+                    row["mongo_ops"] += 1
+                elif span["kind"] == "openai":
+                    row["llm_calls" if span["outcome"] != "cached" else "llm_cache_hits"] += 1
+                    row["prompt_tokens"] += span["prompt_tokens"] or 0
+                    row["completion_tokens"] += span["completion_tokens"] or 0
+    return {
+        endpoint: dict({name: round(value / row["requests"], 2) for name, value in row.items() if name != "requests"}, requests=row["requests"])
+        for endpoint, row in sorted(totals.items())
+    }
+
+# Process-wide totals from /metrics, background jobs included
+def metric_totals(metrics_text):
+    totals = Counter()
+    for line in metrics_text.splitlines():
+        if line.startswith("padhai_mongo_command_seconds_count"):
+            totals["mongo_ops"] += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("padhai_llm_call_seconds_count") and 'outcome="cached"' not in line:
+            totals["llm_calls"] += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("padhai_llm_tokens_total"):
+            totals["llm_tokens"] += float(line.rsplit(" ", 1)[1])
+    return totals
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    trace_path = tempfile.mktemp(prefix="padhai_trace_", suffix=".jsonl")
+    fake_config = FakeOpenAIConfig(args.latency, args.tokens_per_second, args.completion_tokens, args.error_rate,
+                                   args.rate_limit_rate, args.retry_after, args.seed)
+    fake_server = serve("127.0.0.1", args.openai_port, fake_config)
+    threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+    backend = boot_backend(args, f"http://127.0.0.1:{args.openai_port}/v1", trace_path)
+    app_server = serve_app(backend.app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    weights = parse_mix(args.mix)
+    names = list(weights)
+    results = Results()
+    deadline = time.perf_counter() + args.duration
+
+    def virtual_student(index):
+        rng = random.Random(None if args.seed is None else args.seed + index)
+        student = VirtualStudent(base_url, rng, results, args.chat_turns)
+        student.initialize()
+        if not student.student_id:
+            return
+        iterations = 0
+        while time.perf_counter() < deadline and (not args.iterations or iterations < args.iterations):
+            SCENARIOS[rng.choices(names, [weights[name] for name in names])[0]](student)
+            iterations += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(virtual_student, range(args.users)))
+    elapsed = time.perf_counter() - started
+    # Let queued background jobs (tracking summaries, compaction) drain before reading totals
+    time.sleep(args.drain)
+
+    import requests
+    metrics = metric_totals(requests.get(base_url + "/metrics", timeout=30).text)
+    all_latencies = [value for values in results.latencies.values() for value in values]
+    requests_total = len(all_latencies)
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "config": {name: value for name, value in vars(args).items() if name not in ("compare", "output_dir")},
+        "elapsed_s": round(elapsed, 3),
+        "overall": dict(latency_summary(all_latencies, elapsed), errors=sum(
+            count for statuses in results.statuses.values() for status, count in statuses.items() if not 200 <= status < 300)),
+        "requests": {kind: dict(latency_summary(values, elapsed), statuses=dict(results.statuses[kind]))
+                     for kind, values in sorted(results.latencies.items())},
+        "per_request": trace_summary(trace_path),
+        "totals": {
+            "llm_calls_per_request": round(metrics["llm_calls"] / max(requests_total, 1), 2),
+            "llm_tokens_per_request": round(metrics["llm_tokens"] / max(requests_total, 1), 1),
+            "mongo_ops_per_request": round(metrics["mongo_ops"] / max(requests_total, 1), 2),
+        },
+        "fake_openai": dict(fake_config.stats),
+        "scheduler": backend.llm_scheduler.stats(),
+    }
+    app_server.shutdown()
+    fake_server.shutdown()
+    os.remove(trace_path)
+    return report
+
+def print_report(report):
+    overall = report["overall"]
+    print(f"{report['git_revision'] or 'working tree'}: {overall['requests']} requests in {report['elapsed_s']}s "
+          f"({overall['rps']} req/s, {overall['errors']} errors)")
+    print(f"{'request':<16}{'count':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, row in list(report["requests"].items()) + [("overall", overall)]:
+        print(f"{kind:<16}{row['requests']:>7}{row['rps']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print(f"{'endpoint':<24}{'llm calls':>10}{'cache hits':>11}{'tokens':>9}{'mongo ops':>10}")
+    for endpoint, row in report["per_request"].items():
+        tokens = row.get("prompt_tokens", 0) + row.get("completion_tokens", 0)
+        print(f"{endpoint:<24}{row.get('llm_calls', 0):>10}{row.get('llm_cache_hits', 0):>11}{round(tokens, 1):>9}{row.get('mongo_ops', 0):>10}")
+    print("process totals per request (background jobs included): " + ", ".join(f"{k}={v}" for k, v in report["totals"].items()))
+
+def print_comparison(report, baseline):
+    print(f"vs {baseline.get('git_revision') or 'baseline'} ({baseline['started_at']}):")
+    for kind, row in list(report["requests"].items()) + [("overall", report["overall"])]:
+        before = baseline["requests"].get(kind) if kind != "overall" else baseline["overall"]
+        if not before:
+            continue
+        deltas = []
+        for name in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            change = (row[name] - before[name]) / before[name] * 100 if before[name] else 0.0
+            deltas.append(f"{name} {before[name]} -> {row[name]} ({change:+.1f}%)")
+        print(f"  {kind:<16}" + ", ".join(deltas))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test backend.py against a fake OpenAI server and a Mongo stand-in")
+    parser.add_argument("--users", type=int, default=8, help="concurrent virtual students")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic after initialization")
+    parser.add_argument("--iterations", type=int, default=0, help="scenarios per student (0 = until --duration)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted scenarios, e.g. evaluate=2,chat=4,roadmap=1,initialize=1")
+    parser.add_argument("--chat-turns", type=int, default=len(CHAT_MESSAGES))
+    parser.add_argument("--cache", action="store_true", help="keep the completion cache enabled")
+    parser.add_argument("--mongo-uri", help="real MongoDB to use instead of mongomock (a throwaway database is created)")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--openai-port", type=int, default=8011)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for background jobs before reading totals")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", help="earlier report to diff against")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['git_revision'] or 'local'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {path}")
+    sys.exit(1 if report["overall"]["errors"] else 0)
@@ -0,0 +1,38 @@
+import argparse
+from datetime import datetime
+from answer_index import DIMENSIONS, partition_key, write_index
+from backend import tutor_answers_collection
+
+# Offline build of the memory-mapped tutor answer index from stored tutor answers. The newest
+# answer wins when a partition has the same question more than once. Point ANSWER_INDEX_PATH at
+# the output directory and restart (or roll) the workers to pick it up. Only answers marked
+# "shared" are indexed: they were written from a prompt without any student's profile, while
+# older stored answers may quote the student who asked.
+def build_answer_index(path, since=None, max_per_partition=None, dimensions=DIMENSIONS):
+    query = {"shared": True}
+    if since:
+        query["created_at"] = {"$gte": since}
+    latest = {}
+    counts = {}
+    cursor = tutor_answers_collection.find(query, {"_id": 0, "subject": 1, "standard": 1, "question": 1, "answer": 1}).sort("created_at", -1)
+    for document in cursor:
+        key = partition_key(document.get('subject'), document.get('standard'))
+        question = " ".join(document['question'].split())
+        if (key, question.lower()) in latest:
+            continue
+        if max_per_partition and counts.get(key, 0) >= max_per_partition:
+            continue
+        latest[(key, question.lower())] = (key, question, document['answer'])
+        counts[key] = counts.get(key, 0) + 1
+    return write_index(path, latest.values(), dimensions), len(counts)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the tutor answer index files from the tutor_answers collection")
+    parser.add_argument("--output", default="answer_index")
+    parser.add_argument("--since", help="only answers stored on or after this ISO date")
+    parser.add_argument("--max-per-partition", type=int, help="keep the newest N answers per subject and standard")
+    parser.add_argument("--dimensions", type=int, default=DIMENSIONS)
+    args = parser.parse_args()
+    since = datetime.fromisoformat(args.since) if args.since else None
+    entries, partitions = build_answer_index(args.output, since, args.max_per_partition, args.dimensions)
+    print(f"Indexed {entries} answers in {partitions} partitions under {args.output}.")
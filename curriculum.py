@@ -0,0 +1,11 @@
+# Subjects and topics offered in the frontend; the quiz bank is pre-generated over the same list
+SUBJECT_TOPICS = {
+    "Mathematics": ["Algebra", "Calculus", "Geometry"],
+    "Science": ["Physics", "Chemistry", "Biology"],
+    "English": ["Grammar", "Literature"],
+    "Social Studies": ["History", "Geography", "Environment"],
+    "Humanities": ["Philosophy", "Psychology"],
+    "IT": ["CS", "Programming"]
+}
+
+STANDARDS = ["1st", "2nd", "3rd", "4th", "5th", "6th", "7th", "8th", "9th", "10th", "11th", "12th"]
@@ -0,0 +1,172 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from router import ROUTING_QUESTION
+
+# Local OpenAI-compatible stub for exercising the backend without real quota.
+# Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+WORDS = "energy force motion atoms cells plants light water numbers shapes history maps words ideas practice review quiz".split()
+
+class FakeOpenAIConfig:
+    def __init__(self, latency=0.2, tokens_per_second=200.0, completion_tokens=150, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+def count_tokens(messages):
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4 + 1
+
+# A well-formed quiz for the quiz bank's generation prompt
+def quiz_text(prompt, count=5):
+    questions = []
+    for index in range(count - 1):
+        words = [WORDS[(len(prompt) + index * 3 + offset) % len(WORDS)] for offset in range(4)]
+        questions.append({"type": "mcq", "question": f"Which term best matches {words[0]}?", "options": words,
+                          "answer": index % 4, "concept": words[0], "explanation": f"{words[index % 4]} is the match."})
+    questions.append({"type": "open", "question": "Explain how energy moves in a simple system.",
+                      "key_points": ["energy transfer", "conservation of energy"], "concept": "energy", "explanation": "Energy is transferred and conserved."})
+    return json.dumps({"questions": questions})
+
+# Routing prompts (recognized by the master agent's system prompt) get an agent name back so the
+# request flow continues like production
+def completion_text(messages, length):
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    system = str(messages[0].get("content", "")) if messages else ""
+    if "quizzes as JSON" in system:
+        return quiz_text(prompt)
+    if ROUTING_QUESTION in system:
+        query = prompt.lower()
+        if "evaluate my knowledge" in query or "answer of questions" in query:
+            return "learning_tracker_agent"
+        if "learning path" in query or "roadmap" in query:
+            return "guide_agent"
+        return "tutor_agent"
+    return " ".join(WORDS[(len(prompt) + index) % len(WORDS)] for index in range(length))
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with config.lock:
+                    self.send_json(200, dict(config.stats))
+            else:
+                self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "not found"}})
+                return
+            config.count(requests=1)
+            roll = config.roll()
+            if roll < config.rate_limit_rate:
+                config.count(rate_limited=1)
+                self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                               {"retry-after": str(config.retry_after)})
+                return
+            if roll < config.rate_limit_rate + config.error_rate:
+                config.count(errors=1)
+                self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                return
+
+            messages = body.get("messages", [])
+            completion_tokens = min(config.completion_tokens, body.get("max_tokens") or config.completion_tokens)
+            text = completion_text(messages, completion_tokens)
+            completion_tokens = len(text.split())
+            usage = {"prompt_tokens": count_tokens(messages), "completion_tokens": completion_tokens,
+                     "total_tokens": count_tokens(messages) + completion_tokens}
+            config.count(prompt_tokens=usage["prompt_tokens"], completion_tokens=completion_tokens)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            created = int(time.time())
+            model = body.get("model", "gpt-4")
+            time.sleep(config.latency)
+
+            if not body.get("stream"):
+                time.sleep(completion_tokens / config.tokens_per_second)
+                self.send_json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+            for index, word in enumerate(text.split()):
+                delta = {"content": word if index == 0 else " " + word}
+                self.write_event(dict(chunk, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+                time.sleep(1 / config.tokens_per_second)
+            self.write_event(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self.write_event(dict(chunk, choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def write_event(self, data):
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    return Handler
+
+def serve(host="127.0.0.1", port=8001, config=None):
+    server = ThreadingHTTPServer((host, port), make_handler(config or FakeOpenAIConfig()))
+    server.daemon_threads = True
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    config = FakeOpenAIConfig(args.latency, args.tokens_per_second, args.completion_tokens, args.error_rate,
+                              args.rate_limit_rate, args.retry_after, args.seed)
+    server = serve(args.host, args.port, config)
+    print(f"Fake OpenAI listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
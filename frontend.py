@@ -1,17 +1,27 @@
 import streamlit as st
 import requests
 import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from urllib3.util.retry import Retry
+from curriculum import STANDARDS, SUBJECT_TOPICS
 
 API_ENDPOINT = "http://localhost:5000"
+# (connect, read) seconds; a read timeout means no bytes for that long, so streams are not cut off
+REQUEST_TIMEOUT = (5, 120)
+HTTP_POOL_SIZE = 20
+# How long a prefetched roadmap or learning summary is shown before it is fetched again
+PREFETCH_TTL_SECONDS = 60
+# Exchanges (question and answer) shown per page of chat history
+CHAT_PAGE_SIZE = 10
 
-SUBJECT_TOPICS = {
-    "Mathematics": ["Algebra", "Calculus", "Geometry"],
-    "Science": ["Physics", "Chemistry", "Biology"],
-    "English": ["Grammar", "Literature"],
-    "Social Studies": ["History", "Geography", "Environment"],
-    "Humanities": ["Philosophy", "Psychology"],
-    "IT": ["CS", "Programming"]
-}
+# st.rerun and st.fragment replaced their experimental_ names; without fragments the chat views
+# fall back to full reruns
+rerun = getattr(st, "rerun", None) or st.experimental_rerun
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", lambda func: func)
 
 # Add dark/light mode toggle
 if 'theme' not in st.session_state:
@@ -46,6 +56,30 @@ st.markdown(f"""
 </style>
 """, unsafe_allow_html=True)
 
+# One pooled keep-alive session per Streamlit server process, shared by every rerun and browser
+# session. GETs are retried on connection errors and 502/503/504 (honouring Retry-After); POSTs
+# are retried by idempotent_post, whose Idempotency-Key makes that safe
+@st.cache_resource
+def http_session():
+    session = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({"GET"}), raise_on_status=False)
+    adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# POST with an Idempotency-Key, retried once on a dropped connection or timeout; the backend
+# replays the first attempt's result instead of generating (and logging) it twice
+def idempotent_post(url, data, stream=False, attempts=2):
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    for attempt in range(attempts):
+        try:
+            return http_session().post(url, json=data, headers=headers, stream=stream, timeout=REQUEST_TIMEOUT)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == attempts - 1:
+                raise
+
 @st.cache_data(ttl=3600)
 def get_subjects():
     return list(SUBJECT_TOPICS.keys())
@@ -59,7 +93,7 @@ def initialize_student():
     }
     try:
         with st.spinner('Initializing student...'):
-            response = requests.post(f"{API_ENDPOINT}/initialize", json=data)
+            response = idempotent_post(f"{API_ENDPOINT}/initialize", data)
         if response.status_code == 200:
             st.success("Student initialized successfully!")
             st.session_state.student_id = response.json()["student_id"]
@@ -72,42 +106,180 @@ def initialize_student():
             st.session_state.view_subject = True
             st.session_state.view_topics = True
             
-            st.experimental_rerun()
+            rerun()
         else:
             st.error("Failed to initialize student. Please try again.")
     except requests.exceptions.RequestException:
         st.error("Network error. Please check your connection and try again.")
 
-def interact_with_agent(prompt):
+# Parse Server-Sent Events from a streaming response into (event, data) pairs
+def iter_sse_events(response):
+    event = "message"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            event = "message"
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            yield event, json.loads(line[len("data:"):].strip())
+
+def stream_agent_response(url, data):
+    placeholder = st.empty()
+    try:
+        with idempotent_post(url, data, stream=True) as response:
+            if response.status_code != 200:
+                st.error("Failed to get response from agent. Please try again.")
+                return None
+            placeholder.info("Getting response...")
+            text = ""
+            for event, payload in iter_sse_events(response):
+                if event == "delta":
+                    text += payload["delta"]
+                    placeholder.markdown(text + "▌")
+                elif event == "done":
+                    text = payload["response"]
+                elif event == "error":
+                    placeholder.empty()
+                    st.error("Failed to get response from agent. Please try again.")
+                    return None
+            placeholder.markdown(text)
+            return text
+    except requests.exceptions.RequestException:
+        placeholder.empty()
+        st.error("Network error. Please check your connection and try again.")
+        return None
+
+# The backend keeps the transcript of a session, so each turn only sends the new message
+def start_session(kind, topic):
     data = {
-        "query": prompt,
-        "student_id": st.session_state.student_id
+        "student_id": st.session_state.student_id,
+        "kind": kind,
+        "topic": topic
     }
     try:
-        with st.spinner('Getting response...'):
-            response = requests.post(f"{API_ENDPOINT}/agent", json=data)
-        if response.status_code == 200:
-            return response.json()["response"]
-        else:
-            st.error("Failed to get response from agent. Please try again.")
-            return None
+        response = idempotent_post(f"{API_ENDPOINT}/sessions", data)
+        if response.status_code == 201:
+            return response.json()["session_id"]
+        st.error("Failed to start a chat session. Please try again.")
     except requests.exceptions.RequestException:
         st.error("Network error. Please check your connection and try again.")
+    return None
+
+def send_session_turn(session_id, message=""):
+    if not session_id:
         return None
+    forget_prefetched("learning_summary")
+    forget_prefetched("roadmap")
+    return stream_agent_response(f"{API_ENDPOINT}/sessions/{session_id}/turns/stream", {"message": message})
 
-def get_My_Roadmap(subject):
-    fixed_prompt = f"Generate a comprehensive learning path for {subject} that covers all major topics and subtopics. Include estimated time frames for each section and suggested resources or activities."
+# A banked quiz for the topic; None if the backend cannot serve one
+def start_quiz(topic):
     data = {
-        "query": fixed_prompt,
-        "student_id": st.session_state.student_id
+        "student_id": st.session_state.student_id,
+        "subject": st.session_state.selected_subject,
+        "topic": topic
     }
-    response = requests.post(f"{API_ENDPOINT}/agent", json=data)
-    if response.status_code == 200:
-        return response.json()["response"]
-    else:
+    try:
+        with st.spinner('Preparing your quiz...'):
+            response = idempotent_post(f"{API_ENDPOINT}/quizzes", data)
+        if response.status_code == 200:
+            return response.json()
+    except requests.exceptions.RequestException:
+        pass
+    return None
+
+def submit_quiz(quiz_id, answers):
+    data = {
+        "student_id": st.session_state.student_id,
+        "answers": answers
+    }
+    try:
+        with st.spinner('Checking your answers...'):
+            response = idempotent_post(f"{API_ENDPOINT}/quizzes/{quiz_id}/answers", data)
+        if response.status_code == 200:
+            # Grading updates the tracking summary (and so the roadmap's inputs)
+            forget_prefetched("learning_summary")
+            forget_prefetched("roadmap")
+            return response.json()
+        st.error("Failed to submit your answers. Please try again.")
+    except requests.exceptions.RequestException:
+        st.error("Network error. Please check your connection and try again.")
+    return None
+
+def roadmap_url(subject, suffix=""):
+    return f"{API_ENDPOINT}/roadmaps/{st.session_state.student_id}/{quote(subject, safe='')}{suffix}"
+
+# The stored roadmap comes back at once while it is current; a new one streams as it is generated
+def get_My_Roadmap(subject, refresh=False):
+    response = stream_agent_response(roadmap_url(subject, "/stream"), {"refresh": refresh})
+    if response is None:
         st.error("Failed to get learning path from agent.")
+    return response
+
+def get_roadmap_versions(subject):
+    try:
+        response = http_session().get(roadmap_url(subject, "/versions"), timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            return response.json()["versions"]
+    except requests.exceptions.RequestException:
+        pass
+    return []
+
+def get_roadmap_version(subject, version):
+    try:
+        response = http_session().get(roadmap_url(subject), params={"version": version}, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            return response.json()
+    except requests.exceptions.RequestException:
+        pass
+    return None
+
+@st.cache_resource
+def prefetch_pool():
+    return ThreadPoolExecutor(max_workers=4)
+
+# Prefetch workers run outside the script thread, so they only do HTTP and never touch st.*
+# Only the stored roadmap is prefetched, and only while it is current: the GET never generates,
+# so a missing or stale roadmap is built when "My Roadmap" is actually clicked
+def fetch_roadmap(student_id, subject):
+    response = http_session().get(f"{API_ENDPOINT}/roadmaps/{student_id}/{quote(subject, safe='')}", timeout=REQUEST_TIMEOUT)
+    if response.status_code != 200:
+        return None
+    roadmap = response.json()
+    return None if roadmap["stale"] else roadmap["roadmap"]
+
+def fetch_learning_summary(student_id):
+    response = http_session().get(f"{API_ENDPOINT}/get-learning-summary/{student_id}", timeout=REQUEST_TIMEOUT)
+    return response.json()["tracking_summary"] if response.status_code == 200 else None
+
+# Start fetch(*args) in the background unless a recent result (or fetch in progress) exists
+def prefetch(name, fetch, *args):
+    entries = st.session_state.setdefault("prefetch", {})
+    entry = entries.get((name,) + args)
+    if entry and time.monotonic() - entry[1] < PREFETCH_TTL_SECONDS:
+        return
+    entries[(name,) + args] = (prefetch_pool().submit(fetch, *args), time.monotonic())
+
+# The prefetched result, waiting for it if the fetch is still running; None if there is none or it failed
+def prefetched(name, *args):
+    entry = st.session_state.get("prefetch", {}).get((name,) + args)
+    if not entry:
+        return None
+    future, _ = entry
+    try:
+        if not future.done():
+            with st.spinner('Getting response...'):
+                return future.result(timeout=REQUEST_TIMEOUT[1])
+        return future.result()
+    except Exception:
         return None
 
+def forget_prefetched(name):
+    entries = st.session_state.get("prefetch", {})
+    for key in [key for key in entries if key[0] == name]:
+        del entries[key]
+
 def subject_dashboard():
     st.subheader("Subject Dashboard")
     
@@ -121,131 +293,215 @@ def subject_dashboard():
                 st.session_state.selected_subject = subject
                 st.session_state.view_subject = True
                 st.session_state.view_topics = True
-                st.experimental_rerun()
+                rerun()
     else:
         st.write("No subjects available. Please initialize the student first.")
 
 def topic_view():
     st.subheader(f"Topics in {st.session_state.selected_subject}")
+    # Warm the views reachable from here so they open without waiting on the backend
+    prefetch("roadmap", fetch_roadmap, st.session_state.student_id, st.session_state.selected_subject)
+    prefetch("learning_summary", fetch_learning_summary, st.session_state.student_id)
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("Evaluate My knowledge"):
             st.session_state.view_tracker = True
-            st.experimental_rerun()
+            rerun()
     
     with col2:
         if st.button("My Roadmap"):
-            My_Roadmap = get_My_Roadmap(st.session_state.selected_subject)
+            My_Roadmap = prefetched("roadmap", st.session_state.student_id, st.session_state.selected_subject)
+            if not My_Roadmap:
+                My_Roadmap = get_My_Roadmap(st.session_state.selected_subject)
             if My_Roadmap:
                 st.session_state.My_Roadmap_response = My_Roadmap
                 st.session_state.view_My_Roadmap = True
-                st.experimental_rerun()
+                rerun()
     
     with col3:
         if st.button("Ask Me Anything"):
             st.session_state.view_ask_directly = True
-            st.experimental_rerun()
+            rerun()
 
     if st.button("Back to Subjects", key="back_to_subjects"):
         st.session_state.view_topics = False
         st.session_state.view_tracker = False
         st.session_state.view_My_Roadmap = False
         st.session_state.view_ask_directly = False
-        st.experimental_rerun()
+        rerun()
 
 def learning_score_tracker_view():
     st.subheader(f"Evaluate Your Knowledge About - {st.session_state.selected_subject}")
     topics = SUBJECT_TOPICS.get(st.session_state.selected_subject, [])
     
+    summary = prefetched("learning_summary", st.session_state.student_id)
+    if summary:
+        with st.expander("Your learning summary"):
+            st.write(summary)
+    
     st.write("Select a sub-topic to evaluate your knowledge:")
     for topic in topics:
         if st.button(f"{topic}", key=f"topic_{topic}"):
             st.session_state.selected_topic = topic
+            quiz = start_quiz(topic)
+            if quiz:
+                st.session_state.quiz = quiz
+                st.session_state.quiz_result = None
+                st.session_state.view_quiz = True
+                rerun()
+            # No quiz available: fall back to a conversational evaluation
             st.session_state.view_chatbot = True
             st.session_state.chat_history = []
+            st.session_state.pop("chat_history_pages", None)
+            st.session_state.evaluate_session_id = start_session("evaluate", topic)
             initial_prompt = f"user : i want to evaluate my knowledge about {st.session_state.selected_topic}"
-            response = interact_with_agent(initial_prompt)
+            response = send_session_turn(st.session_state.evaluate_session_id)
             st.session_state.chat_history.append(("User", initial_prompt))
             st.session_state.chat_history.append(("Agent", response))
-            st.experimental_rerun()
+            rerun()
 
     if st.button("Back to Topics", key="back_to_topics"):
         st.session_state.view_tracker = False
-        st.experimental_rerun()
+        rerun()
 
-def chatbot_view():
-    st.subheader(f"Chat about {st.session_state.selected_topic}")
+def quiz_view():
+    quiz = st.session_state.quiz
+    st.subheader(f"Quiz on {quiz['topic']} ({quiz['difficulty']})")
+    result = st.session_state.get("quiz_result")
     
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-
-    for role, message in st.session_state.chat_history:
-        if role == "User":
-            st.text_input("You:", value=message, key=f"user_{message}")
-        else:
-            st.text_area("Agent:", value=message, height=500, key=f"agent_{message}")
-    
-    user_input = st.text_input("Your message:")
-    if st.button("Send"):
-        if user_input:
-            query = f"user : i want to evaluate my knowledge about {st.session_state.selected_topic}\n"
-            for role, message in st.session_state.chat_history:
-                if role == "Agent":
-                    query += f"learning_tracker_agent : {message}\n"
+    if not result:
+        with st.form(key=f"quiz_{quiz['quiz_id']}"):
+            answers = []
+            for index, question in enumerate(quiz["questions"]):
+                label = f"Q{index + 1}. {question['question']}"
+                if question["type"] == "mcq":
+                    options = question["options"]
+                    # index=None leaves the question unanswered instead of preselecting the first option
+                    answers.append(st.radio(label, list(range(len(options))), format_func=options.__getitem__, index=None, key=f"q_{quiz['quiz_id']}_{index}"))
                 else:
-                    query += f"User : {message}\n"
-            query += f"User : answer of questions : {user_input}"
-            response = interact_with_agent(query)
-            
-            st.session_state.chat_history.append(("User", user_input))
-            st.session_state.chat_history.append(("Agent", response))
-            st.experimental_rerun()
+                    answers.append(st.text_area(label, key=f"q_{quiz['quiz_id']}_{index}"))
+            if st.form_submit_button("Submit answers"):
+                unanswered = [str(index + 1) for index, answer in enumerate(answers) if answer is None]
+                if unanswered:
+                    st.warning(f"Please choose an answer for question {', '.join(unanswered)} before submitting.")
+                else:
+                    st.session_state.quiz_result = submit_quiz(quiz["quiz_id"], answers)
+                    rerun()
+    else:
+        st.write(f"Learning score: {result['score']}% ({result['level']})")
+        for item in result["results"]:
+            question = quiz["questions"][item["index"]]
+            mark = "✅" if item["correct"] else "❌"
+            st.write(f"{mark} Q{item['index'] + 1}. {question['question']}")
+            if question["type"] == "mcq" and not item["correct"]:
+                st.write(f"Correct answer: {question['options'][item['correct_answer']]}")
+            if item["explanation"]:
+                st.caption(item["explanation"])
+        if result.get("feedback"):
+            st.write(result["feedback"])
+        if st.button("Next quiz"):
+            quiz = start_quiz(quiz["topic"])
+            if quiz:
+                st.session_state.quiz = quiz
+                st.session_state.quiz_result = None
+                rerun()
+            st.error("Failed to get a new quiz. Please try again.")
+    
+    if st.button("Back to Topics"):
+        st.session_state.view_quiz = False
+        st.session_state.quiz = None
+        st.session_state.quiz_result = None
+        rerun()
+
+def show_more_history(pages_key):
+    st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+
+def render_chat_turn(role, message):
+    with st.chat_message("user" if role == "User" else "assistant"):
+        st.markdown(message or "")
+
+# Only the latest pages of a long history are rendered; older exchanges stay one click away
+def render_history(history, pages_key):
+    shown = st.session_state.get(pages_key, 1) * CHAT_PAGE_SIZE * 2
+    if len(history) > shown:
+        st.button(f"Show earlier messages ({(len(history) - shown + 1) // 2} more)", key=f"{pages_key}_more",
+                  on_click=show_more_history, args=(pages_key,))
+    for role, message in history[-shown:]:
+        render_chat_turn(role, message)
+
+# Runs as a fragment: sending a message reruns only the chat region, not the whole page
+@fragment
+def chat_panel(history_key, session_key, kind, topic, label, button):
+    history = st.session_state.setdefault(history_key, [])
+    render_history(history, f"{history_key}_pages")
+    new_turn = st.container()
+    with st.form(key=f"{history_key}_form", clear_on_submit=True):
+        message = st.text_input(label)
+        sent = st.form_submit_button(button)
+    if sent and message:
+        with new_turn:
+            render_chat_turn("User", message)
+            if not st.session_state.get(session_key):
+                st.session_state[session_key] = start_session(kind, topic)
+            with st.chat_message("assistant"):
+                response = send_session_turn(st.session_state[session_key], message)
+        history.append(("User", message))
+        history.append(("Agent", response))
+
+def chatbot_view():
+    st.subheader(f"Chat about {st.session_state.selected_topic}")
+    chat_panel("chat_history", "evaluate_session_id", "evaluate", st.session_state.selected_topic, "Your message:", "Send")
     
     if st.button("Back to Topics"):
         st.session_state.view_chatbot = False
         st.session_state.chat_history = []
-        st.experimental_rerun()
+        st.session_state.pop("chat_history_pages", None)
+        st.session_state.evaluate_session_id = None
+        rerun()
 
 def My_Roadmap_view():
-    st.subheader(f"Your Roadmap for {st.session_state.selected_subject}")
+    subject = st.session_state.selected_subject
+    st.subheader(f"Your Roadmap for {subject}")
     st.write(st.session_state.My_Roadmap_response)
+    
+    if st.button("Refresh Roadmap"):
+        My_Roadmap = get_My_Roadmap(subject, refresh=True)
+        forget_prefetched("roadmap")
+        if My_Roadmap:
+            st.session_state.My_Roadmap_response = My_Roadmap
+            rerun()
+    
+    versions = get_roadmap_versions(subject)
+    if len(versions) > 1:
+        with st.expander("Compare with an earlier roadmap"):
+            labels = {entry["version"]: f"Version {entry['version']} ({entry['created_at'][:10]})" for entry in versions[1:]}
+            version = st.selectbox("Earlier version", list(labels), format_func=labels.get)
+            earlier = get_roadmap_version(subject, version)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f"**Current (version {versions[0]['version']})**")
+                st.write(st.session_state.My_Roadmap_response)
+            with col2:
+                st.markdown(f"**{labels[version]}**")
+                st.write(earlier["roadmap"] if earlier else "This version is no longer available.")
+    
     if st.button("Back to Topics"):
         st.session_state.view_My_Roadmap = False
-        st.experimental_rerun()
+        rerun()
 
 def ask_directly_view():
     st.subheader(f"Ask me anything about {st.session_state.selected_topic}")
-    
-    if 'ask_directly_history' not in st.session_state:
-        st.session_state.ask_directly_history = []
-    
-    for role, message in st.session_state.ask_directly_history:
-        if role == "User":
-            st.text_input("You:", value=message, key=f"ask_user_{message}")
-        else:
-            st.text_area("Agent:", value=message, height=500, key=f"ask_agent_{message}")
-    
-    user_question = st.text_input("Your question:")
-    if st.button("Send Question"):
-        if user_question:
-            query = f"user : {user_question}\n"
-            for role, message in st.session_state.ask_directly_history:
-                if role == "Agent":
-                    query += f"response : {message}\n"
-                else:
-                    query += f"User : {message}\n"
-            response = interact_with_agent(query)
-            
-            st.session_state.ask_directly_history.append(("User", user_question))
-            st.session_state.ask_directly_history.append(("Agent", response))
-            st.experimental_rerun()
+    topic = st.session_state.get("selected_topic") or st.session_state.selected_subject
+    chat_panel("ask_directly_history", "ask_session_id", "ask", topic, "Your question:", "Send Question")
     
     if st.button("Back to Topics"):
         st.session_state.view_ask_directly = False
         st.session_state.ask_directly_history = []
-        st.experimental_rerun()
+        st.session_state.pop("ask_directly_history_pages", None)
+        st.session_state.ask_session_id = None
+        rerun()
 
 def main():
     st.title("PadhAi - Your EduGuide")
@@ -266,6 +522,8 @@ def main():
         st.session_state.view_tracker = False
     if 'view_chatbot' not in st.session_state:
         st.session_state.view_chatbot = False
+    if 'view_quiz' not in st.session_state:
+        st.session_state.view_quiz = False
     if 'view_My_Roadmap' not in st.session_state:
         st.session_state.view_My_Roadmap = False
     if 'view_ask_directly' not in st.session_state:
@@ -281,7 +539,7 @@ def main():
             if st.button("Log Out", key="start_over"):
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
-                st.experimental_rerun()
+                rerun()
 
     if not st.session_state.initialized:
         if st.session_state.form_step == 1:
@@ -290,15 +548,14 @@ def main():
             with col1:
                 name = st.text_input("What's your name?")
             with col2:
-                standards = ["1st", "2nd", "3rd", "4th", "5th", "6th", "7th", "8th", "9th", "10th", "11th", "12th"]
-                standard = st.selectbox("Which standard are you studying in?", standards)
+                standard = st.selectbox("Which standard are you studying in?", STANDARDS)
                 
             st.session_state.name = name
             st.session_state.standard = standard
             if st.button("Next", key="next_step1"):
                 if name and standard:
                     st.session_state.form_step = 2
-                    st.experimental_rerun()
+                    rerun()
                 else:
                     st.warning("Please fill in all fields before proceeding.")
 
@@ -309,7 +566,7 @@ def main():
             
             if st.button("Next", key="next_step2"):
                 st.session_state.form_step = 3
-                st.experimental_rerun()
+                rerun()
 
         elif st.session_state.form_step == 3:
             like_study_options = ["I Love it", "I Dislike it", "Interested in some topics but not studying as a whole", "Other"]
@@ -317,11 +574,13 @@ def main():
             st.session_state.like_study = like_study
             if st.button("Next", key="next_step3"):
                 st.session_state.form_step = 4
-                st.experimental_rerun()
+                rerun()
 
         elif st.session_state.form_step == 4:
             initialize_student()
 
+    elif st.session_state.view_quiz:
+        quiz_view()
     elif st.session_state.view_chatbot:
         chatbot_view()
     elif st.session_state.view_My_Roadmap:
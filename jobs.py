@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# In-process worker pool over durable job records in MongoDB. Jobs survive restarts:
+# any pending job, or running job whose lease expired, is claimed by the next idle worker
+# in whichever process gets to it first.
+class JobQueue:
+    def __init__(self, collection, workers=4, lease_seconds=300, poll_interval=5.0, max_attempts=3):
+        self.collection = collection
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self.wakeups = queue.Queue()
+        self.threads = []
+        self.started_pid = None
+        self.lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.collection.create_index([("status", ASCENDING), ("lease_until", ASCENDING), ("created_at", ASCENDING)])
+        # At most one pending job per dedupe key; later enqueues collapse into it
+        self.collection.create_index(
+            [("dedupe_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"status": "pending", "dedupe_key": {"$type": "string"}},
+        )
+
+    def register(self, name, handler):
+        self.handlers[name] = handler
+
+    # Worker threads do not survive a fork, so a forked child starts its own
+    def start(self):
+        with self.lock:
+            if self.started_pid == os.getpid():
+                return
+            self.ensure_indexes()
+            self.threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self.work, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            self.started_pid = os.getpid()
+
+    def enqueue(self, name, args=None, dedupe_key=None):
+        now = utcnow()
+        job = {
+            "name": name,
+            "args": args or {},
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if dedupe_key:
+            job["dedupe_key"] = dedupe_key
+            args = job.pop("args")
+            job.pop("updated_at")
+            job_id = None
+            # Two racing upserts can both miss; the loser hits the unique index and retries as an update
+            while job_id is None:
+                try:
+                    stored = self.collection.find_one_and_update(
+                        {"dedupe_key": dedupe_key, "status": "pending"},
+                        {"$setOnInsert": job, "$set": {"args": args, "updated_at": now}, "$inc": {"enqueued": 1}},
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER,
+                    )
+                    job_id = stored["_id"]
+                except DuplicateKeyError:
+                    continue
+        else:
+            job_id = self.collection.insert_one(job).inserted_id
+        self.wakeups.put(job_id)
+        return str(job_id)
+
+    def status(self, job_id):
+        job = self.collection.find_one({"_id": ObjectId(job_id)}, {"args": 0})
+        if not job:
+            return None
+        job["_id"] = str(job["_id"])
+        for field in ("created_at", "updated_at", "lease_until", "retry_at", "finished_at"):
+            if job.get(field):
+                job[field] = job[field].isoformat()
+        return job
+
+    def claim(self, job_id=None):
+        now = utcnow()
+        claimable = {"$or": [
+            {"status": "pending", "retry_at": {"$not": {"$gt": now}}},
+            {"status": "running", "lease_until": {"$lt": now}},
+        ]}
+        if job_id is not None:
+            claimable["_id"] = job_id
+        return self.collection.find_one_and_update(
+            claimable,
+            {"$set": {"status": "running", "lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def work(self):
+        while True:
+            try:
+                job_id = self.wakeups.get(timeout=self.poll_interval)
+            except queue.Empty:
+                job_id = None
+            try:
+                job = self.claim(job_id)
+                # A wakeup for a job another worker took still means there may be other work waiting
+                if job is None and job_id is not None:
+                    job = self.claim()
+                if job is not None:
+                    self.run(job)
+            except Exception:
+                traceback.print_exc()
+                time.sleep(self.poll_interval)
+
+    def run(self, job):
+        handler = self.handlers.get(job["name"])
+        try:
+            if handler is None:
+                raise KeyError(f"No handler registered for job '{job['name']}'")
+            handler(**job["args"])
+        except Exception as e:
+            now = utcnow()
+            status = "failed" if job["attempts"] >= self.max_attempts else "pending"
+            update = {"status": status, "error": str(e), "updated_at": now}
+            if status == "pending":
+                update["retry_at"] = now + timedelta(seconds=self.poll_interval * 2 ** job["attempts"])
+            try:
+                self.collection.update_one({"_id": job["_id"]}, {"$set": update, "$unset": {"lease_until": ""}})
+            except DuplicateKeyError:
+                # A newer job with the same dedupe key is already pending and will redo this work
+                self.collection.update_one({"_id": job["_id"]}, {"$set": {"status": "superseded", "error": str(e), "updated_at": now}, "$unset": {"lease_until": ""}})
+            return
+        now = utcnow()
+        self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "done", "updated_at": now, "finished_at": now}, "$unset": {"lease_until": ""}},
+        )
@@ -0,0 +1,174 @@
+import re
+from datetime import datetime, timezone
+import numpy as np
+from pymongo import ASCENDING, DESCENDING
+from quiz_bank import standard_key
+
+# "Algebra - 20 %", "Physics: 75%", "Learning Score: 60%"
+SCORE_PATTERN = re.compile(r"([A-Za-z][A-Za-z &/'()-]{1,60}?)\s*[-:–]\s*(\d{1,3}(?:\.\d+)?)\s*%")
+EVALUATE_PATTERN = re.compile(r"evaluate my knowledge about\s+([^\n]+)", re.I)
+GENERIC_LABELS = {"learning score", "score", "mastery level", "overall", "overall score", "total"}
+PERCENTILES = (10, 25, 50, 75, 90)
+INTERVALS = {"day": "D", "week": "W", "month": "M"}
+
+def canonical_topic(label, topics=()):
+    label = label.strip(" -*#").strip()
+    for topic in topics:
+        if topic.lower() == label.lower():
+            return topic
+    return label
+
+# The known topic named on the "evaluate my knowledge about X" line of a query, as a whole word
+# ("CS" must not match "physics"); longer names win so "Organic Chemistry" beats "Chemistry"
+def evaluated_topic(text, topics=()):
+    match = EVALUATE_PATTERN.search(text or "")
+    if not match:
+        return None
+    for topic in sorted(topics, key=len, reverse=True):
+        if re.search(rf"(?<!\w){re.escape(topic)}(?!\w)", match.group(1), re.I):
+            return topic
+    return None
+
+# (topic, score) pairs stated in a free-text evaluation; a generic "Learning Score" is
+# attributed to the evaluated topic
+def extract_scores(text, default_topic=None, topics=()):
+    scores = {}
+    for label, value in SCORE_PATTERN.findall(text or ""):
+        score = float(value)
+        if score > 100:
+            continue
+        label = label.strip()
+        if label.lower() in GENERIC_LABELS:
+            if not default_topic:
+                continue
+            label = default_topic
+        scores[canonical_topic(label, topics)] = score
+    return list(scores.items())
+
+def summarize(values):
+    values = np.asarray(values, dtype=float)
+    if not values.size:
+        return {"count": 0}
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 2),
+        "std": round(float(values.std()), 2),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "percentiles": {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, percentiles)},
+    }
+
+# Per-group statistics over flat arrays: one sort, then contiguous slices per group
+def grouped_summaries(groups, values):
+    groups = np.asarray(groups)
+    values = np.asarray(values, dtype=float)
+    if not values.size:
+        return {}
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    labels, starts = np.unique(groups, return_index=True)
+    bounds = np.append(starts, values.size)
+    return {str(label): summarize(values[bounds[i]:bounds[i + 1]]) for i, label in enumerate(labels)}
+
+# One document per (student, subject, topic, timestamp) score, denormalized with the student's
+# standard and roster cohort so class and school reports never touch the students collection
+class ScoreStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("student_id", ASCENDING), ("subject", ASCENDING), ("topic", ASCENDING), ("timestamp", DESCENDING)])
+        self.collection.create_index([("subject", ASCENDING), ("topic", ASCENDING), ("timestamp", DESCENDING)])
+        self.collection.create_index([("cohort", ASCENDING), ("timestamp", DESCENDING)])
+
+    def record(self, documents):
+        if documents:
+            self.collection.insert_many(documents, ordered=False)
+
+    # scores are (subject, topic, score) triples from one evaluation
+    @staticmethod
+    def documents(student_id, student, scores, source, timestamp=None, **details):
+        timestamp = timestamp or datetime.now(timezone.utc).replace(tzinfo=None)
+        return [dict({
+            "student_id": student_id,
+            "subject": subject,
+            "topic": topic,
+            "score": float(score),
+            "source": source,
+            "standard": standard_key(student.get("standard")),
+            "cohort": (student.get("roster_import") or {}).get("import_id"),
+            "timestamp": timestamp,
+        }, **details) for subject, topic, score in scores]
+
+    @staticmethod
+    def match(subject=None, topic=None, standard=None, cohort=None, student_id=None, since=None, until=None):
+        query = {}
+        standard = standard_key(standard) if standard else None
+        for field, value in (("subject", subject), ("topic", topic), ("standard", standard), ("cohort", cohort), ("student_id", student_id)):
+            if value:
+                query[field] = value
+        if since or until:
+            query["timestamp"] = {}
+            if since:
+                query["timestamp"]["$gte"] = since
+            if until:
+                query["timestamp"]["$lt"] = until
+        return query
+
+    # Each student's latest score per topic, as flat columns
+    def latest(self, query):
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"timestamp": -1}},
+            {"$group": {"_id": {"student_id": "$student_id", "topic": "$topic"}, "score": {"$first": "$score"}}},
+            {"$project": {"_id": 0, "topic": "$_id.topic", "score": 1}},
+        ]
+        rows = list(self.collection.aggregate(pipeline, allowDiskUse=True))
+        return np.array([row["topic"] or "" for row in rows], dtype=object), np.array([row["score"] for row in rows], dtype=float)
+
+    # Cohort distribution of latest scores: overall and per topic, with a histogram over 0-100
+    def distribution(self, query, bins=10):
+        topics, scores = self.latest(query)
+        counts, edges = np.histogram(scores, bins=bins, range=(0, 100))
+        return {
+            "overall": summarize(scores),
+            "histogram": {"edges": edges.round(2).tolist(), "counts": counts.tolist()},
+            "topics": grouped_summaries(topics.astype(str), scores),
+        }
+
+    # Score statistics per time bucket, plus each student's change from first to latest score per topic
+    def progress(self, query, interval="week"):
+        rows = list(self.collection.aggregate([
+            {"$match": query},
+            {"$sort": {"timestamp": 1}},
+            {"$project": {"_id": 0, "student_id": 1, "topic": 1, "score": 1, "timestamp": 1}},
+        ], allowDiskUse=True))
+        if not rows:
+            return {"interval": interval, "periods": [], "improvement": {"count": 0}}
+        timestamps = np.array([row["timestamp"] for row in rows], dtype="datetime64[ms]")
+        scores = np.array([row["score"] for row in rows], dtype=float)
+        if interval == "week":
+            # numpy weeks count from the epoch, a Thursday; shift so buckets start on Monday
+            monday = np.timedelta64(3, "D")
+            periods = ((timestamps + monday).astype("datetime64[W]").astype("datetime64[D]") - monday)
+        else:
+            periods = timestamps.astype(f"datetime64[{INTERVALS[interval]}]").astype("datetime64[D]")
+        by_period = grouped_summaries(periods.astype(str), scores)
+
+        # Rows are in time order, so per (student, topic) the first and last occurrences are the
+        # first and latest scores
+        keys = np.array([f"{row['student_id']}\t{row['topic']}" for row in rows])
+        _, first = np.unique(keys, return_index=True)
+        _, last_reversed = np.unique(keys[::-1], return_index=True)
+        last = keys.size - 1 - last_reversed
+        repeated = first != last
+        deltas = scores[last[repeated]] - scores[first[repeated]]
+        improvement = summarize(deltas)
+        if deltas.size:
+            improvement["improved_share"] = round(float((deltas > 0).mean()), 4)
+        return {
+            "interval": interval,
+            "periods": [dict(summary, period=period) for period, summary in sorted(by_period.items())],
+            "improvement": improvement,
+        }
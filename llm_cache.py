@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+
+# Content-addressed cache for chat completions: an in-memory LRU in front of a
+# MongoDB collection whose TTL index expires old entries.
+class CompletionCache:
+    def __init__(self, collection=None, max_entries=1000, max_entry_bytes=64 * 1024, ttl_seconds=7 * 24 * 3600, agents=None):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl_seconds = ttl_seconds
+        self.agents = set(agents or [])
+        self.entries = OrderedDict()
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def ensure_indexes(self):
+        if self.collection is not None:
+            self.collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=self.ttl_seconds)
+
+    def enabled_for(self, agent):
+        return agent in self.agents
+
+    @staticmethod
+    def key(model, messages, params=None):
+        payload = json.dumps({"model": model, "messages": messages, "params": params or {}}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, agent=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                self.counters[f"{agent}:hits"] += 1
+                return self.entries[key]
+        if self.collection is not None:
+            document = self.collection.find_one({"_id": key}, {"response": 1})
+            if document:
+                self.remember(key, document["response"])
+                with self.lock:
+                    self.counters["mongo_hits"] += 1
+                    self.counters[f"{agent}:hits"] += 1
+                return document["response"]
+        with self.lock:
+            self.counters["misses"] += 1
+            self.counters[f"{agent}:misses"] += 1
+        return None
+
+    def set(self, key, response, agent=None, model=None):
+        if response is None or len(response.encode("utf-8")) > self.max_entry_bytes:
+            with self.lock:
+                self.counters["skipped"] += 1
+            return
+        self.remember(key, response)
+        if self.collection is not None:
+            self.collection.replace_one(
+                {"_id": key},
+                {"response": response, "agent": agent, "model": model, "created_at": datetime.now(timezone.utc)},
+                upsert=True,
+            )
+        with self.lock:
+            self.counters["stores"] += 1
+
+    def remember(self, key, response):
+        with self.lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        with self.lock:
+            hits = self.counters["memory_hits"] + self.counters["mongo_hits"]
+            lookups = hits + self.counters["misses"]
+            per_agent = {}
+            for name, value in self.counters.items():
+                if ":" in name:
+                    agent, kind = name.split(":", 1)
+                    per_agent.setdefault(agent, {"hits": 0, "misses": 0})[kind] = value
+            return {
+                "memory_hits": self.counters["memory_hits"],
+                "mongo_hits": self.counters["mongo_hits"],
+                "misses": self.counters["misses"],
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "stores": self.counters["stores"],
+                "skipped": self.counters["skipped"],
+                "evictions": self.counters["evictions"],
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "agents": sorted(self.agents),
+                "per_agent": per_agent,
+            }
@@ -0,0 +1,292 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+import openai
+
+class SchedulerOverloaded(Exception):
+    pass
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` is available (0 when it already is)
+    def wait_time(self, amount):
+        self.refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    # Settle an estimate against what was actually used; the level may go negative
+    def adjust(self, amount):
+        self.refill()
+        self.level = min(self.capacity, self.level - amount)
+
+# A streamed completion keeps its concurrency slot until the stream is drained, fails or is
+# closed, and the token estimate is settled from the usage chunk that ends it
+class HeldStream:
+    def __init__(self, scheduler, stream, tokens):
+        self.scheduler = scheduler
+        self.stream = stream
+        self.tokens = tokens
+        self.used = None
+        self.released = False
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                used = self.scheduler.used_tokens(chunk)
+                if used is not None:
+                    self.used = used
+                yield chunk
+        finally:
+            self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        try:
+            if hasattr(self.stream, "close"):
+                self.stream.close()
+        finally:
+            self.scheduler.release(self.tokens, self.used)
+
+class Ticket:
+    def __init__(self, priority, tokens, notify):
+        self.priority = priority
+        self.tokens = tokens
+        self.notify = notify
+        self.granted = False
+
+# Shared gate in front of the OpenAI client: requests and tokens per minute are token
+# buckets, in-flight calls are capped, and waiting calls are granted strictly by priority
+# class (interactive before background), FIFO within a class. Each class has a bounded
+# queue; once it is full new calls are rejected with SchedulerOverloaded instead of piling up.
+class LLMScheduler:
+    PRIORITIES = {"interactive": 0, "background": 1}
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=80000, max_concurrency=32, max_queue=256,
+                 max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.queued = Counter()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.timer = None
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def enqueue(self, tokens, priority, notify):
+        rank = self.PRIORITIES[priority]
+        ticket = Ticket(priority, tokens, notify)
+        with self.lock:
+            if self.queued[priority] >= self.max_queue:
+                self.counters[f"{priority}_rejected"] += 1
+                raise SchedulerOverloaded(f"LLM queue for {priority} calls is full")
+            self.queued[priority] += 1
+            heapq.heappush(self.waiting, (rank, next(self.sequence), ticket))
+            self.dispatch()
+        return ticket
+
+    # Grant waiting tickets while a slot and both buckets allow; otherwise re-check when they will
+    def dispatch(self):
+        while self.waiting and self.in_flight < self.max_concurrency:
+            ticket = self.waiting[0][2]
+            wait = max(self.paused_until - time.monotonic(),
+                       self.request_bucket.wait_time(1),
+                       self.token_bucket.wait_time(ticket.tokens))
+            if wait > 0:
+                if self.timer is None:
+                    self.timer = threading.Timer(wait, self.wake)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            heapq.heappop(self.waiting)
+            self.queued[ticket.priority] -= 1
+            self.request_bucket.take(1)
+            self.token_bucket.take(ticket.tokens)
+            self.in_flight += 1
+            ticket.granted = True
+            ticket.notify()
+
+    def wake(self):
+        with self.lock:
+            self.timer = None
+            self.dispatch()
+
+    def withdraw(self, ticket):
+        with self.lock:
+            if ticket.granted:
+                self.release_locked()
+                return
+            for index, (_, _, waiting) in enumerate(self.waiting):
+                if waiting is ticket:
+                    self.waiting.pop(index)
+                    heapq.heapify(self.waiting)
+                    self.queued[ticket.priority] -= 1
+                    break
+
+    def acquire(self, tokens, priority):
+        event = threading.Event()
+        self.enqueue(tokens, priority, event.set)
+        event.wait()
+
+    async def acquire_async(self, tokens, priority):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        ticket = self.enqueue(tokens, priority, grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.withdraw(ticket)
+            raise
+
+    def release_locked(self):
+        self.in_flight -= 1
+        self.dispatch()
+
+    def release(self, estimated_tokens=0, used_tokens=None):
+        with self.lock:
+            if used_tokens is not None:
+                self.token_bucket.adjust(used_tokens - estimated_tokens)
+            self.release_locked()
+
+    # Seconds to wait before retrying `error`, or None when it should not be retried
+    def retry_delay(self, error, attempt):
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code != 429 and error.status_code < 500:
+                return None
+        elif not isinstance(error, openai.APIConnectionError):
+            return None
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            # Every caller shares the provider's limit, so hold the whole queue, not just this call
+            with self.lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            return retry_after + random.uniform(0, self.base_delay)
+        return backoff
+
+    @staticmethod
+    def retry_after(error):
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max((parsedate_to_datetime(value).timestamp() - time.time()), 0.0)
+            except (TypeError, ValueError):
+                return None
+
+    @staticmethod
+    def used_tokens(result):
+        usage = getattr(result, "usage", None)
+        return usage.total_tokens if usage else None
+
+    # With stream=True, call() opens a stream; it is returned as a HeldStream, which releases the
+    # slot only once the stream ends
+    def run(self, call, tokens=1, priority="interactive", stream=False):
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens, priority)
+            try:
+                result = call()
+            except Exception as e:
+                self.release(tokens)
+                delay = self.retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    self.count("failures")
+                    raise
+                self.count("retries")
+                time.sleep(delay)
+                continue
+            self.count(f"{priority}_calls")
+            if stream:
+                return HeldStream(self, result, tokens)
+            self.release(tokens, self.used_tokens(result))
+            return result
+
+    async def run_async(self, call, tokens=1, priority="interactive"):
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(tokens, priority)
+            try:
+                result = await call()
+            except Exception as e:
+                self.release(tokens)
+                delay = self.retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    self.count("failures")
+                    raise
+                self.count("retries")
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                self.release(tokens)
+                raise
+            self.release(tokens, self.used_tokens(result))
+            self.count(f"{priority}_calls")
+            return result
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": dict(self.queued),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "paused_for": max(self.paused_until - time.monotonic(), 0.0),
+                "requests_available": round(self.request_bucket.level, 2),
+                "tokens_available": round(self.token_bucket.level, 2),
+                "counters": dict(self.counters),
+            }
@@ -0,0 +1,54 @@
+from datetime import timedelta
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from backend import students_collection, conversations_collection
+
+# One-shot move of embedded `conversations` arrays into the conversations collection.
+# Safe to re-run: each entry is upserted on (student_id, migrated_index) and the
+# array is only removed from the student once all of its entries are stored.
+# A tracking summary written before the move already covers the migrated evaluations, so its
+# cursor is set to the last of them; otherwise the next update would fold them in again.
+def migrate_conversations(batch_size=100):
+    conversations_collection.create_index([("student_id", ASCENDING), ("migrated_index", ASCENDING)], sparse=True)
+    migrated_students = 0
+    migrated_conversations = 0
+    cursor = students_collection.find({"conversations": {"$exists": True}}, {"conversations": 1, "tracking_summary": 1, "tracking_summary_until": 1}).batch_size(batch_size)
+    for student in cursor:
+        conversations = student.get('conversations') or []
+        # Embedded entries carry no timestamp; keep their order relative to the student's creation time
+        created = student['_id'].generation_time
+        operations = []
+        for index, conv in enumerate(conversations):
+            document = {
+                "student_id": student['_id'],
+                "agent": conv.get('agent'),
+                "subject": conv.get('subject'),
+                "evaluation": conv.get('evaluation'),
+                "timestamp": created + timedelta(milliseconds=index),
+                "migrated_index": index,
+            }
+            operations.append(UpdateOne(
+                {"student_id": student['_id'], "migrated_index": index},
+                {"$setOnInsert": document},
+                upsert=True,
+            ))
+        if operations:
+            conversations_collection.bulk_write(operations, ordered=False)
+        if student.get('tracking_summary') and not student.get('tracking_summary_until'):
+            folded = conversations_collection.find_one(
+                {"student_id": student['_id'], "agent": "learning_tracker_agent", "migrated_index": {"$exists": True}},
+                {"timestamp": 1},
+                sort=[("timestamp", DESCENDING), ("_id", DESCENDING)],
+            )
+            if folded:
+                students_collection.update_one({"_id": student['_id']}, {"$set": {
+                    "tracking_summary_until": folded['timestamp'],
+                    "tracking_summary_until_id": folded['_id'],
+                }})
+        students_collection.update_one({"_id": student['_id']}, {"$unset": {"conversations": ""}})
+        migrated_students += 1
+        migrated_conversations += len(operations)
+    return migrated_students, migrated_conversations
+
+if __name__ == '__main__':
+    students, conversations = migrate_conversations()
+    print(f"Migrated {conversations} conversations from {students} students.")
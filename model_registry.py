@@ -0,0 +1,158 @@
+import copy
+import json
+import os
+import threading
+from collections import defaultdict, deque
+
+# Which task each completion caller performs; models and limits are configured per task
+# and can be overridden per agent.
+AGENT_TASKS = {
+    "master_agent": "route",
+    "create_summary": "summarize",
+    "tracking_summary": "summarize",
+    "session_summary": "summarize",
+    "discover_agent": "discover",
+    "tutor_agent": "tutor",
+    "tutor_personalize": "personalize",
+    "learning_tracker_agent": "evaluate",
+    "quiz_generation": "evaluate",
+    "quiz_feedback": "evaluate",
+    "guide_agent": "roadmap",
+}
+
+DEFAULT_CONFIG = {
+    # prompt_budgets caps each per-call prompt field, in tokens; "request" is the query itself
+    "default": {
+        "models": ["gpt-4"],
+        "prompt_budgets": {
+            "request": 2000,
+            "basic_summary": 400,
+            "basic_info": 600,
+            "tracking_summary": 600,
+            "match": 600,
+            "answer": 1000,
+            "new_data": 800,
+            "conversations": 2000,
+            "summary": 600,
+            "transcript": 2000,
+        },
+    },
+    "tasks": {
+        # The router only ever answers with one agent name, and needs little context to pick it
+        "route": {"max_tokens": 20, "temperature": 0, "prompt_budgets": {"request": 300, "basic_summary": 150, "tracking_summary": 150}},
+        # Summaries being compacted are over budget by definition
+        "summarize": {"prompt_budgets": {"tracking_summary": 1500}},
+        "discover": {},
+        "tutor": {},
+        # Fits a shared tutor answer to one student: a rewrite, so a small model will do
+        "personalize": {"models": ["gpt-4o-mini", "gpt-4"]},
+        "evaluate": {},
+        "roadmap": {},
+    },
+    "agents": {},
+    # USD per 1K tokens as [prompt, completion]; calls to unpriced models report no cost
+    "prices": {},
+}
+
+def merge(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+class ModelRegistry:
+    def __init__(self, config=None):
+        self.config = merge(DEFAULT_CONFIG, config or {})
+
+    # JSON file from MODEL_REGISTRY_PATH, then MODEL_<TASK>=model-a,model-b fallback chains
+    @classmethod
+    def from_env(cls):
+        config = {}
+        path = os.getenv("MODEL_REGISTRY_PATH")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                config = json.load(f)
+        for task in DEFAULT_CONFIG["tasks"]:
+            chain = os.getenv(f"MODEL_{task.upper()}")
+            if chain:
+                config.setdefault("tasks", {}).setdefault(task, {})["models"] = [model.strip() for model in chain.split(",") if model.strip()]
+        return cls(config)
+
+    def resolve(self, agent):
+        task = AGENT_TASKS.get(agent, agent)
+        resolved = merge(self.config["default"], self.config["tasks"].get(task, {}))
+        resolved = merge(resolved, self.config["agents"].get(agent, {}))
+        resolved["task"] = task
+        return resolved
+
+    # Registry limits cap what a caller asks for; caller-supplied temperature wins
+    def apply_limits(self, resolved, params):
+        params = dict(params)
+        cap = resolved.get("max_tokens")
+        if cap:
+            params["max_tokens"] = min(params.get("max_tokens") or cap, cap)
+        if "temperature" in resolved and "temperature" not in params:
+            params["temperature"] = resolved["temperature"]
+        return params
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        price = self.config["prices"].get(model)
+        if not price:
+            return None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1000
+
+# Per-call model, token and wall-time records, aggregated per endpoint and task
+class UsageRecorder:
+    def __init__(self, registry, history=1000):
+        self.registry = registry
+        self.recent = deque(maxlen=history)
+        self.totals = defaultdict(lambda: {"calls": 0, "cached": 0, "errors": 0, "prompt_size": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0, "total_ms": 0.0, "max_ms": 0.0, "cost": 0.0})
+        self.lock = threading.Lock()
+
+    # prompt_size is the local token count of the messages; cached_prompt_tokens is the part of
+    # prompt_tokens the provider served from its prompt cache
+    def record(self, endpoint, agent, task, model, prompt_tokens=0, completion_tokens=0, elapsed=0.0, cached=False, error=None,
+               prompt_size=0, cached_prompt_tokens=0):
+        elapsed_ms = elapsed * 1000
+        cost = self.registry.cost(model, prompt_tokens, completion_tokens)
+        entry = {
+            "endpoint": endpoint or "background",
+            "agent": agent,
+            "task": task,
+            "model": model,
+            "prompt_size": prompt_size,
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "cached": cached,
+            "error": error,
+            "cost": cost,
+        }
+        with self.lock:
+            self.recent.append(entry)
+            totals = self.totals[(entry["endpoint"], task, model)]
+            totals["calls"] += 1
+            totals["cached"] += int(cached)
+            totals["errors"] += int(error is not None)
+            totals["prompt_size"] += prompt_size
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_prompt_tokens"] += cached_prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["total_ms"] += elapsed_ms
+            totals["max_ms"] = max(totals["max_ms"], elapsed_ms)
+            totals["cost"] += cost or 0.0
+
+    def stats(self, recent=0):
+        with self.lock:
+            endpoints = {}
+            for (endpoint, task, model), totals in self.totals.items():
+                row = dict(totals, task=task, model=model, avg_ms=totals["total_ms"] / totals["calls"])
+                endpoints.setdefault(endpoint, []).append(row)
+            stats = {"endpoints": endpoints}
+            if recent:
+                stats["recent"] = list(self.recent)[-recent:]
+            return stats
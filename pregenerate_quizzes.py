@@ -0,0 +1,42 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from backend import background, quiz_bank
+from curriculum import STANDARDS, SUBJECT_TOPICS
+from quiz_bank import DIFFICULTIES
+
+# Offline top-up of the quiz bank: every (subject, topic, standard, difficulty) gets at least
+# --per-key quizzes. Safe to re-run; keys that are already full cost nothing.
+def pregenerate_quizzes(per_key=3, subjects=None, standards=None, difficulties=DIFFICULTIES, concurrency=8):
+    tasks = []
+    for subject, topics in SUBJECT_TOPICS.items():
+        if subjects and subject not in subjects:
+            continue
+        for topic in topics:
+            for standard in standards or STANDARDS:
+                for difficulty in difficulties:
+                    missing = per_key - quiz_bank.count(subject, topic, standard, difficulty)
+                    tasks.extend([(subject, topic, standard, difficulty)] * max(missing, 0))
+    created = failed = 0
+    create = background(quiz_bank.create)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(copy_context().run, create, *task) for task in tasks]
+        for future in as_completed(futures):
+            if future.exception():
+                failed += 1
+            else:
+                created += 1
+            if (created + failed) % 50 == 0:
+                print(f"{created + failed}/{len(tasks)} quizzes ({failed} failed)")
+    return created, failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-generate quizzes for every subject, topic, standard and difficulty")
+    parser.add_argument("--per-key", type=int, default=3)
+    parser.add_argument("--subjects", nargs="*")
+    parser.add_argument("--standards", nargs="*")
+    parser.add_argument("--difficulties", nargs="*", default=list(DIFFICULTIES))
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    created, failed = pregenerate_quizzes(args.per_key, args.subjects, args.standards, args.difficulties, args.concurrency)
+    print(f"Created {created} quizzes, {failed} failed.")
@@ -0,0 +1,56 @@
+import os
+import threading
+import weakref
+
+instances = weakref.WeakSet()
+
+# A value built on first use in each process. Clients that own sockets or threads (MongoClient,
+# the OpenAI HTTP pool, job workers) must not be shared with a forked child, so a worker forked
+# from a preloaded parent starts empty and builds its own
+class ProcessLocal:
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.pid = None
+        self.value = None
+        instances.add(self)
+
+    def get(self):
+        pid = os.getpid()
+        if self.pid != pid:
+            with self.lock:
+                if self.pid != pid:
+                    self.value = self.factory()
+                    self.pid = pid
+        return self.value
+
+    @property
+    def ready(self):
+        return self.pid == os.getpid()
+
+    # The parent's value (and a lock another thread may have held) is dropped, not closed:
+    # closing would act on sockets the parent still uses
+    def forget(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.value = None
+
+def forget_all():
+    for instance in list(instances):
+        instance.forget()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_all)
+
+# Stands in for whatever resolve() returns, so module-level names such as a collection can be
+# bound at import time and only connect on first use. Indexing yields another proxy, cached per
+# process: db["students"] is a lazy collection
+class LazyProxy:
+    def __init__(self, resolve):
+        self._resolve = resolve
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, key):
+        return LazyProxy(ProcessLocal(lambda: self._resolve()[key]).get)
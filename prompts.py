@@ -0,0 +1,110 @@
+import logging
+import re
+import threading
+
+# Word pieces and single punctuation marks; a long word counts one token per 4 characters, which
+# tracks BPE tokenizers closely enough for budgeting English prose
+PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+TRUNCATION_MARK = " …"
+
+def piece_tokens(piece):
+    return (len(piece) + 3) // 4
+
+logger = logging.getLogger(__name__)
+
+# Local token counting and truncation: tiktoken's encoding when the package (and its encoding
+# file) is available, otherwise the word-piece approximation above. The encoding is loaded on
+# first use, since tiktoken may download its file: constructing a Tokenizer opens no connections
+class Tokenizer:
+    def __init__(self, encoding="cl100k_base"):
+        self.encoding_name = encoding
+        self.lock = threading.Lock()
+        self.loaded = False
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning("tiktoken encoding %s unavailable (%s); approximating token counts", self.encoding_name, e)
+                    self.loaded = True
+        return self._encoding
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return sum(piece_tokens(piece) for piece in PIECE_PATTERN.findall(text))
+
+    # The longest start of text that fits max_tokens (marked as cut), and whether it was cut
+    def truncate(self, text, max_tokens):
+        if not max_tokens or self.count(text) <= max_tokens:
+            return text, False
+        budget = max(max_tokens - self.count(TRUNCATION_MARK), 0)
+        if self.encoding:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:budget]) + TRUNCATION_MARK, True
+        end = 0
+        for match in PIECE_PATTERN.finditer(text):
+            budget -= piece_tokens(match.group())
+            if budget < 0:
+                break
+            end = match.end()
+        return text[:end] + TRUNCATION_MARK, True
+
+# An agent's prompt: a system message that never changes between calls, so the provider can
+# serve it from its prompt cache as a shared prefix, then one user message holding the per-call
+# fields and finally the request. fields are (name, label) pairs in display order
+class PromptTemplate:
+    def __init__(self, agent, system, fields=(), request_label=None):
+        self.agent = agent
+        self.system = system
+        self.fields = fields
+        self.request_label = request_label
+
+# Builds messages from templates, cutting each per-call field (and the request, as "request") to
+# the agent's token budget; budgets(agent) returns {field: max tokens}
+class PromptBuilder:
+    def __init__(self, budgets, metrics, tokenizer=None):
+        self.budgets = budgets
+        self.tokenizer = tokenizer or Tokenizer()
+        self.static_tokens = {}
+        self.tokens = metrics.counter(
+            "padhai_prompt_tokens_total", "Prompt tokens built per agent, by static prefix and per-call part (local tokenizer count).",
+            ("agent", "part"))
+        self.truncations = metrics.counter(
+            "padhai_prompt_truncations_total", "Per-call prompt fields cut to their token budget.", ("agent", "field"))
+
+    def budget(self, agent, field):
+        return self.budgets(agent).get(field)
+
+    def fit(self, agent, field, value, budgets):
+        value, truncated = self.tokenizer.truncate(str(value), budgets.get(field))
+        if truncated:
+            self.truncations.inc(agent=agent, field=field)
+        return value
+
+    # Empty fields are left out; the request always comes last
+    def build(self, template, request, **values):
+        budgets = self.budgets(template.agent)
+        parts = []
+        for name, label in template.fields:
+            if values.get(name):
+                parts.append(f"{label}: {self.fit(template.agent, name, values[name], budgets)}")
+        request = self.fit(template.agent, "request", request, budgets)
+        parts.append(f"{template.request_label}: {request}" if template.request_label else request)
+        content = "\n\n".join(parts)
+
+        if template not in self.static_tokens:
+            self.static_tokens[template] = self.tokenizer.count(template.system)
+        self.tokens.inc(self.static_tokens[template], agent=template.agent, part="static")
+        self.tokens.inc(self.tokenizer.count(content), agent=template.agent, part="dynamic")
+        return [
+            {"role": "system", "content": template.system},
+            {"role": "user", "content": content},
+        ]
@@ -0,0 +1,175 @@
+import json
+import random
+import re
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import ASCENDING
+
+DIFFICULTIES = ("easy", "medium", "hard")
+QUESTIONS_PER_QUIZ = 5
+
+QUIZ_SYSTEM_PROMPT = (
+    "You write short school quizzes as JSON. Reply with one JSON object: "
+    '{"questions": [{"type": "mcq", "question": "...", "options": ["...", "...", "...", "..."], "answer": <index of the correct option>, '
+    '"concept": "...", "explanation": "..."}, {"type": "open", "question": "...", "key_points": ["...", "..."], '
+    '"concept": "...", "explanation": "..."}]}. '
+    "Use mostly multiple-choice questions with exactly four options and at most one open question. "
+    "key_points are the short phrases a complete open answer must mention. Keep questions clear and age-appropriate."
+)
+
+# "8th", "Class 8" and 8 all bank under "8"
+def standard_key(standard):
+    match = re.search(r"\d+", str(standard or ""))
+    return match.group(0) if match else "any"
+
+def quiz_messages(subject, topic, standard, difficulty, count=QUESTIONS_PER_QUIZ):
+    prompt = (f"Write a {difficulty} quiz of {count} questions on {topic} ({subject}) for a student in standard {standard}. "
+              "Start with basics and increase difficulty; include real-world examples where they help.")
+    return [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+# Validated questions from the model's JSON; malformed questions are dropped
+def parse_questions(text):
+    # Tolerate prose or code fences around the object
+    data = json.loads(text[text.find("{"):text.rfind("}") + 1] if "{" in text else text)
+    questions = []
+    for question in data.get("questions", []):
+        if not isinstance(question, dict) or not question.get("question"):
+            continue
+        entry = {
+            "type": question.get("type", "mcq"),
+            "question": str(question["question"]),
+            "concept": str(question.get("concept") or ""),
+            "explanation": str(question.get("explanation") or ""),
+        }
+        if entry["type"] == "mcq":
+            options = [str(option) for option in question.get("options") or []]
+            answer = question.get("answer")
+            if len(options) < 2 or not isinstance(answer, int) or not 0 <= answer < len(options):
+                continue
+            entry.update(options=options, answer=answer)
+        elif entry["type"] == "open":
+            key_points = [str(point) for point in question.get("key_points") or [] if str(point).strip()]
+            if not key_points:
+                continue
+            entry["key_points"] = key_points
+        else:
+            continue
+        questions.append(entry)
+    if not questions:
+        raise ValueError("Quiz has no usable questions")
+    return questions
+
+def words(text):
+    return set(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+# Fraction of a key point's words that appear in the answer; a point counts once most of it is there
+def key_point_covered(point, answer_words):
+    point_words = words(point)
+    return bool(point_words) and len(point_words & answer_words) / len(point_words) >= 0.6
+
+# Score answers against the stored key without a model call: multiple choice is right or wrong,
+# open answers earn the share of key points they mention
+def grade(quiz, answers):
+    results = []
+    points = 0.0
+    for index, question in enumerate(quiz["questions"]):
+        given = answers[index] if index < len(answers) else None
+        result = {"index": index, "concept": question["concept"], "explanation": question["explanation"]}
+        if question["type"] == "mcq":
+            try:
+                choice = int(given)
+            except (TypeError, ValueError):
+                choice = None
+            earned = 1.0 if choice == question["answer"] else 0.0
+            result.update(answer=choice, correct_answer=question["answer"])
+        else:
+            answer_words = words(given or "")
+            covered = [point for point in question["key_points"] if key_point_covered(point, answer_words)]
+            earned = len(covered) / len(question["key_points"])
+            result.update(answer=given or "", key_points=question["key_points"], covered=covered)
+        result["earned"] = round(earned, 2)
+        result["correct"] = earned >= 0.5
+        points += earned
+        results.append(result)
+    possible = len(quiz["questions"])
+    percent = round(points / possible * 100) if possible else 0
+    return {"earned": round(points, 2), "possible": possible, "score": percent, "results": results}
+
+def level(score):
+    if score >= 90:
+        return "Master"
+    if score >= 70:
+        return "Advanced"
+    if score >= 40:
+        return "Intermediate"
+    return "Beginner"
+
+def next_difficulty(difficulty, score):
+    index = DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else 1
+    if score >= 80:
+        index = min(index + 1, len(DIFFICULTIES) - 1)
+    elif score < 40:
+        index = max(index - 1, 0)
+    return DIFFICULTIES[index]
+
+# Quiz as sent to the student: no answers, key points or explanations
+def public_quiz(quiz):
+    questions = []
+    for question in quiz["questions"]:
+        entry = {"type": question["type"], "question": question["question"]}
+        if question["type"] == "mcq":
+            entry["options"] = question["options"]
+        questions.append(entry)
+    return {
+        "quiz_id": str(quiz["_id"]),
+        "subject": quiz["subject"],
+        "topic": quiz["topic"],
+        "standard": quiz["standard"],
+        "difficulty": quiz["difficulty"],
+        "questions": questions,
+    }
+
+# Quizzes with answer keys in MongoDB, several per (subject, topic, standard, difficulty), so
+# starting an evaluation is a read rather than a GPT-4 call
+class QuizBank:
+    def __init__(self, collection, generate):
+        self.collection = collection
+        self.generate = generate
+
+    def ensure_indexes(self):
+        self.collection.create_index([("subject", ASCENDING), ("topic", ASCENDING), ("standard", ASCENDING), ("difficulty", ASCENDING)])
+
+    def create(self, subject, topic, standard, difficulty, count=QUESTIONS_PER_QUIZ):
+        questions = parse_questions(self.generate(quiz_messages(subject, topic, standard, difficulty, count)))
+        quiz = {
+            "subject": subject,
+            "topic": topic,
+            "standard": standard_key(standard),
+            "difficulty": difficulty,
+            "questions": questions,
+            "created_at": datetime.now(timezone.utc),
+        }
+        quiz["_id"] = self.collection.insert_one(quiz).inserted_id
+        return quiz
+
+    def count(self, subject, topic, standard, difficulty):
+        return self.collection.count_documents(
+            {"subject": subject, "topic": topic, "standard": standard_key(standard), "difficulty": difficulty})
+
+    # A random banked quiz the student has not taken yet when there is one; an empty bank
+    # for the key falls back to generating (and banking) a quiz now
+    def draw(self, subject, topic, standard, difficulty, taken=()):
+        query = {"subject": subject, "topic": topic, "standard": standard_key(standard), "difficulty": difficulty}
+        candidates = list(self.collection.find(query, {"_id": 1}))
+        if not candidates:
+            return self.create(subject, topic, standard, difficulty), False
+        taken = {str(quiz_id) for quiz_id in taken}
+        fresh = [candidate for candidate in candidates if str(candidate["_id"]) not in taken]
+        choice = random.choice(fresh or candidates)
+        return self.collection.find_one({"_id": choice["_id"]}), True
+
+    def get(self, quiz_id):
+        return self.collection.find_one({"_id": ObjectId(quiz_id)})
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+# Hash of what a roadmap is generated from; a stored roadmap stays current while this matches
+def inputs_hash(subject, basic_summary, tracking_summary):
+    payload = json.dumps([subject, basic_summary or "", tracking_summary or ""], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Generated roadmaps per (student, subject), numbered from 1. The newest version is served until
+# the student's summaries change; older versions are kept (up to max_versions) for comparison
+class RoadmapStore:
+    def __init__(self, collection, max_versions=20):
+        self.collection = collection
+        self.max_versions = max_versions
+
+    def ensure_indexes(self):
+        self.collection.create_index([("student_id", ASCENDING), ("subject", ASCENDING), ("version", DESCENDING)], unique=True)
+
+    def latest(self, student_id, subject):
+        return self.collection.find_one({"student_id": student_id, "subject": subject}, sort=[("version", DESCENDING)])
+
+    def get(self, student_id, subject, version):
+        return self.collection.find_one({"student_id": student_id, "subject": subject, "version": version})
+
+    # Newest first, without the roadmap text
+    def versions(self, student_id, subject, limit=20):
+        cursor = self.collection.find(
+            {"student_id": student_id, "subject": subject},
+            {"_id": 0, "version": 1, "inputs_hash": 1, "refreshed": 1, "created_at": 1},
+        ).sort("version", DESCENDING).limit(limit)
+        return list(cursor)
+
+    def save(self, student_id, subject, roadmap, inputs_hash, refreshed=False):
+        while True:
+            latest = self.latest(student_id, subject)
+            document = {
+                "student_id": student_id,
+                "subject": subject,
+                "version": latest["version"] + 1 if latest else 1,
+                "roadmap": roadmap,
+                "inputs_hash": inputs_hash,
+                "refreshed": refreshed,
+                "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            }
+            try:
+                document["_id"] = self.collection.insert_one(document).inserted_id
+                break
+            except DuplicateKeyError:
+                # Another process stored the same version number first; take the next one
+                continue
+        if self.max_versions:
+            self.collection.delete_many({
+                "student_id": student_id,
+                "subject": subject,
+                "version": {"$lte": document["version"] - self.max_versions},
+            })
+        return document
@@ -0,0 +1,144 @@
+import csv
+import hashlib
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+ROSTER_FIELDS = ("name", "standard", "subject", "like_study")
+
+# Rows from a CSV (header line with the roster fields) or NDJSON (one object per line) roster
+def parse_roster(text, format=None):
+    text = text.lstrip("\ufeff")
+    if format is None:
+        format = "ndjson" if text.lstrip().startswith("{") else "csv"
+    if format == "csv":
+        records = csv.DictReader(io.StringIO(text))
+    elif format == "ndjson":
+        records = (json.loads(line) for line in text.splitlines() if line.strip())
+    else:
+        raise ValueError(f"Unsupported roster format: {format}")
+    rows = []
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"row {len(rows)} is not a JSON object")
+        rows.append({field: str(record.get(field) or "").strip() for field in ROSTER_FIELDS})
+    return rows
+
+# Re-uploading the same roster resumes the same import unless the caller names one
+def roster_import_id(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+def row_error(row):
+    missing = [field for field in ("name", "standard", "subject") if not row[field]]
+    return f"Missing {', '.join(missing)}" if missing else None
+
+# Onboards a roster into the students collection. Summaries are generated with bounded
+# concurrency and written with insert_many in batches; every student remembers its
+# (import_id, row), so a rerun of an interrupted import skips rows that were already inserted.
+class RosterImport:
+    def __init__(self, students, imports, summarize, concurrency=8, batch_size=50):
+        self.students = students
+        self.imports = imports
+        self.summarize = summarize
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+    def ensure_indexes(self):
+        self.students.create_index(
+            [("roster_import.import_id", ASCENDING), ("roster_import.row", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"roster_import.import_id": {"$exists": True}},
+        )
+
+    def imported_rows(self, import_id):
+        cursor = self.students.find({"roster_import.import_id": import_id}, {"roster_import.row": 1})
+        return {document["roster_import"]["row"]: str(document["_id"]) for document in cursor}
+
+    def status(self, import_id):
+        document = self.imports.find_one({"_id": import_id})
+        if document:
+            document["imported"] = self.students.count_documents({"roster_import.import_id": import_id})
+        return document
+
+    def summarize_row(self, row):
+        try:
+            return self.summarize(row), None
+        except Exception as e:
+            return None, str(e)
+
+    # Progress events as dicts: one "start", a "progress" per inserted batch, then "done"
+    def run(self, import_id, rows):
+        now = datetime.now(timezone.utc)
+        imported = self.imported_rows(import_id)
+        self.imports.update_one(
+            {"_id": import_id},
+            {"$set": {"total": len(rows), "status": "running", "failed": 0, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+            upsert=True,
+        )
+        pending = [(index, row) for index, row in enumerate(rows) if index not in imported]
+        progress = {"import_id": import_id, "total": len(rows), "already_imported": len(imported), "inserted": 0, "failed": 0}
+        yield "start", dict(progress)
+
+        valid = []
+        failures = []
+        for index, row in pending:
+            error = row_error(row)
+            if error:
+                failures.append({"row": index, "error": error})
+            else:
+                valid.append((index, row))
+        if failures:
+            yield "progress", self.flush(import_id, [], failures, progress)
+
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            # Submitting every row up front keeps the workers busy across batch boundaries;
+            # results are still consumed in row order
+            futures = [pool.submit(copy_context().run, self.summarize_row, row) for index, row in valid]
+            batch, failures = [], []
+            for (index, row), future in zip(valid, futures):
+                summary, error = future.result()
+                if error:
+                    failures.append({"row": index, "error": error})
+                else:
+                    batch.append(dict(row, basic_summary=summary, tracking_summary="",
+                                      roster_import={"import_id": import_id, "row": index}))
+                if len(batch) + len(failures) >= self.batch_size:
+                    yield "progress", self.flush(import_id, batch, failures, progress)
+                    batch, failures = [], []
+            if batch or failures:
+                yield "progress", self.flush(import_id, batch, failures, progress)
+        except GeneratorExit:
+            # The client went away; a rerun with the same import_id picks up from here
+            self.imports.update_one({"_id": import_id}, {"$set": {"status": "interrupted", "updated_at": datetime.now(timezone.utc)}})
+            raise
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        status = "completed" if progress["failed"] == 0 else "completed_with_errors"
+        self.imports.update_one({"_id": import_id}, {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}})
+        yield "done", dict(progress, status=status)
+
+    def flush(self, import_id, batch, failures, progress):
+        students = []
+        if batch:
+            try:
+                self.students.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Rows a concurrent run of the same import inserted first
+                duplicates = {error["index"] for error in e.details["writeErrors"] if error["code"] == 11000}
+                if len(duplicates) != len(e.details["writeErrors"]):
+                    raise
+                batch = [document for position, document in enumerate(batch) if position not in duplicates]
+            students = [{"row": document["roster_import"]["row"], "student_id": str(document["_id"])} for document in batch]
+        progress["inserted"] += len(students)
+        progress["failed"] += len(failures)
+        self.imports.update_one(
+            {"_id": import_id},
+            {"$inc": {"failed": len(failures)}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        )
+        return dict(progress, students=students, failures=failures)
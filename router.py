@@ -0,0 +1,193 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+AGENTS = ["discover_agent", "tutor_agent", "learning_tracker_agent", "guide_agent"]
+# Closing line of the master agent's system prompt; fake_openai.py recognizes routing calls by it
+ROUTING_QUESTION = "Which agent should handle the query? Provide only the agent's name, nothing more."
+
+# Regex rules over the first line of the query (the newest user message in every
+# prompt shape frontend.py sends). Each rule carries the confidence it routes with.
+RULES = [
+    (re.compile(r"\bi want to evaluate my knowledge about\b", re.I), "learning_tracker_agent", 0.99),
+    (re.compile(r"^\s*generate a comprehensive learning path for\b", re.I), "guide_agent", 0.99),
+    (re.compile(r"\b(road ?map|learning path|study plan|what should i study next)\b", re.I), "guide_agent", 0.9),
+    (re.compile(r"\b(quiz me|test me|evaluate me|assess me)\b", re.I), "learning_tracker_agent", 0.9),
+    (re.compile(r"\b(about me|my background|my interests|my hobbies)\b", re.I), "discover_agent", 0.85),
+]
+
+# Seed examples for the classifier; the decision log adds LLM-labelled queries on top
+SEED_EXAMPLES = [
+    ("i want to evaluate my knowledge about algebra", "learning_tracker_agent"),
+    ("i want to evaluate my knowledge about physics", "learning_tracker_agent"),
+    ("answer of questions : 1. a 2. c 3. b", "learning_tracker_agent"),
+    ("give me a quiz on chemistry", "learning_tracker_agent"),
+    ("test my understanding of geometry", "learning_tracker_agent"),
+    ("how good am i at grammar", "learning_tracker_agent"),
+    ("check my progress in biology", "learning_tracker_agent"),
+    ("generate a comprehensive learning path for mathematics", "guide_agent"),
+    ("generate a comprehensive learning path for science", "guide_agent"),
+    ("what should i study next in science", "guide_agent"),
+    ("make a study plan for history", "guide_agent"),
+    ("suggest a roadmap to improve my learning score", "guide_agent"),
+    ("how do i improve my score in calculus", "guide_agent"),
+    ("can you explain photosynthesis to me", "tutor_agent"),
+    ("what is newton's second law", "tutor_agent"),
+    ("explain the pythagorean theorem", "tutor_agent"),
+    ("how does electricity flow in a circuit", "tutor_agent"),
+    ("why is the sky blue", "tutor_agent"),
+    ("what are verbs and adverbs", "tutor_agent"),
+    ("define a variable in programming", "tutor_agent"),
+    ("describe the causes of world war 1", "tutor_agent"),
+    ("tell me about yourself and ask about my interests", "discover_agent"),
+    ("i am struggling and do not know where to start", "discover_agent"),
+    ("i am new here", "discover_agent"),
+    ("ask me some questions about my background", "discover_agent"),
+]
+
+# Rules over the whole query, for markers that never sit on its first line: an evaluation
+# session's reply comes last, after the opening line and the transcript
+QUERY_RULES = [
+    (re.compile(r"^\s*user\s*:\s*answer of questions\s*:", re.I | re.M), "learning_tracker_agent", 0.97),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_PREFIX_RE = re.compile(r"^\s*(user|learning_tracker_agent|response)\s*:\s*", re.I)
+
+def query_head(query):
+    head = (query or "").strip().split("\n", 1)[0]
+    return _PREFIX_RE.sub("", head).strip()
+
+def query_features(text):
+    tokens = _TOKEN_RE.findall(text.lower())
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+# Multinomial naive Bayes over unigram + bigram features of the query head
+class NaiveBayesRouter:
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.class_counts = Counter()
+        self.feature_counts = defaultdict(Counter)
+        self.feature_totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, examples):
+        for text, agent in examples:
+            if agent not in AGENTS:
+                continue
+            features = query_features(text)
+            self.class_counts[agent] += 1
+            self.feature_counts[agent].update(features)
+            self.feature_totals[agent] += len(features)
+            self.vocabulary.update(features)
+        return self
+
+    def predict(self, text):
+        total = sum(self.class_counts.values())
+        if not total:
+            return None, 0.0
+        features = [f for f in query_features(text) if f in self.vocabulary]
+        if not features:
+            return None, 0.0
+        vocab_size = len(self.vocabulary)
+        scores = {}
+        for agent, count in self.class_counts.items():
+            denominator = self.feature_totals[agent] + self.alpha * vocab_size
+            counts = self.feature_counts[agent]
+            score = math.log(count / total)
+            for feature in features:
+                score += math.log((counts[feature] + self.alpha) / denominator)
+            scores[agent] = score
+        best = max(scores, key=scores.get)
+        # Softmax over log scores gives the posterior used as confidence
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / norm
+
+def load_examples(log_path):
+    examples = []
+    if not log_path or not os.path.exists(log_path):
+        return examples
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("source") == "llm" and entry.get("agent") in AGENTS:
+                examples.append((entry["query"], entry["agent"]))
+    return examples
+
+class RouteDecision:
+    def __init__(self, agent, confidence, source):
+        self.agent = agent
+        self.confidence = confidence
+        self.source = source
+
+class FastRouter:
+    def __init__(self, rule_threshold=0.9, classifier_threshold=0.85, log_path=None, log_size=1000):
+        self.rule_threshold = rule_threshold
+        self.classifier_threshold = classifier_threshold
+        self.log_path = log_path
+        self.recent = deque(maxlen=log_size)
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.retrain()
+
+    def retrain(self):
+        self.classifier = NaiveBayesRouter().fit(SEED_EXAMPLES + load_examples(self.log_path))
+
+    def route(self, query):
+        head = query_head(query)
+        for pattern, agent, confidence in RULES:
+            if pattern.search(head) and confidence >= self.rule_threshold:
+                return RouteDecision(agent, confidence, "rule")
+        for pattern, agent, confidence in QUERY_RULES:
+            if pattern.search(query or "") and confidence >= self.rule_threshold:
+                return RouteDecision(agent, confidence, "rule")
+        agent, confidence = self.classifier.predict(head)
+        if agent and confidence >= self.classifier_threshold:
+            return RouteDecision(agent, confidence, "classifier")
+        return RouteDecision(agent, confidence, "fallback")
+
+    def record(self, query, decision, agent, elapsed):
+        entry = {
+            "ts": time.time(),
+            "query": query_head(query),
+            "predicted": decision.agent,
+            "confidence": round(decision.confidence, 4),
+            "source": "llm" if decision.source == "fallback" else decision.source,
+            "agent": agent,
+            "elapsed_ms": round(elapsed * 1000, 3),
+        }
+        with self.lock:
+            self.counters["total"] += 1
+            self.counters[entry["source"]] += 1
+            if decision.source == "fallback" and decision.agent == agent:
+                self.counters["fallback_agreed"] += 1
+            self.recent.append(entry)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def stats(self):
+        with self.lock:
+            total = self.counters["total"]
+            fast = self.counters["rule"] + self.counters["classifier"]
+            return {
+                "total": total,
+                "rule_hits": self.counters["rule"],
+                "classifier_hits": self.counters["classifier"],
+                "llm_fallbacks": self.counters["llm"],
+                "fallback_agreed": self.counters["fallback_agreed"],
+                "fast_path_hit_rate": fast / total if total else 0.0,
+                "rule_threshold": self.rule_threshold,
+                "classifier_threshold": self.classifier_threshold,
+            }
+
+    def recent_decisions(self, limit=100):
+        with self.lock:
+            return list(self.recent)[-limit:]
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+class IdempotencyConflict(Exception):
+    pass
+
+class IdempotencyPending(Exception):
+    pass
+
+# Strip surrounding whitespace and fix key order so trivially different duplicates share a key
+def normalize(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+def fingerprint(*parts):
+    payload = json.dumps(normalize(list(parts)), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class Flight:
+    def __init__(self):
+        self.meta = None
+        self.chunks = []
+        self.error = None
+        self.finished = False
+        self.callbacks = []
+        self.condition = threading.Condition()
+
+    def start(self, meta):
+        with self.condition:
+            self.meta = meta
+            self.condition.notify_all()
+
+    def publish(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.error = error
+            self.finished = True
+            self.condition.notify_all()
+
+    def wait_meta(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.meta is not None or self.finished)
+            if self.meta is None:
+                raise self.error
+            return self.meta
+
+    # Replays what the leader has produced so far, then follows it live
+    def follow(self, abandoned=None):
+        index = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: index < len(self.chunks) or self.finished)
+                chunks = self.chunks[index:]
+                finished = self.finished
+                error = self.error
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if finished and index == len(self.chunks):
+                if error is not None and abandoned is not None:
+                    yield abandoned
+                return
+
+# Response body of the leading request; published chunk by chunk to the followers. A class
+# rather than a generator so the WSGI server's close() releases the flight even if iteration
+# never started
+class LeaderStream:
+    def __init__(self, flights, key, flight, chunks):
+        self.flights = flights
+        self.key = key
+        self.flight = flight
+        self.iterator = iter(chunks)
+        self.source = chunks
+        self.completed = False
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.iterator)
+        except StopIteration:
+            self.completed = True
+            self.close()
+            raise
+        except BaseException as e:
+            self.close(e)
+            raise
+        self.flight.publish(chunk)
+        return chunk
+
+    def close(self, error=None):
+        if self.closed:
+            return
+        self.closed = True
+        if hasattr(self.source, "close"):
+            self.source.close()
+        self.flights.release(self.key, self.flight, self.completed, error)
+
+# Coalesces identical in-flight requests: the first caller for a key runs, later callers with
+# the same key attach to its output instead of starting their own LLM call and writes
+class SingleFlight:
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    # start() returns (meta, chunks); every caller gets (meta, chunks, led) for the shared result.
+    # Each caller's on_complete(meta, chunks) or on_abandon() runs once the leader is done
+    def share(self, key, start, on_complete=None, on_abandon=None, abandoned=None):
+        with self.lock:
+            flight = self.flights.get(key)
+            led = flight is None
+            if led:
+                flight = self.flights[key] = Flight()
+            flight.callbacks.append((on_complete, on_abandon))
+        if not led:
+            return flight.wait_meta(), flight.follow(abandoned), False
+        try:
+            meta, chunks = start()
+        except BaseException as e:
+            self.release(key, flight, False, e)
+            raise
+        flight.start(meta)
+        if isinstance(chunks, list):
+            for chunk in chunks:
+                flight.publish(chunk)
+            self.release(key, flight, True, None)
+            return meta, chunks, True
+        return meta, LeaderStream(self, key, flight, chunks), True
+
+    def release(self, key, flight, completed, error):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        try:
+            for on_complete, on_abandon in flight.callbacks:
+                if completed and on_complete:
+                    on_complete(flight.meta, flight.chunks)
+                elif not completed and on_abandon:
+                    on_abandon()
+        finally:
+            flight.finish(None if completed else error or RuntimeError("Request was abandoned"))
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.flights)
+
+# Results of requests sent with an Idempotency-Key, kept in MongoDB so a retry that lands on
+# any process replays the stored response instead of running again
+class IdempotencyStore:
+    def __init__(self, collection, ttl_seconds=24 * 3600, wait_seconds=60.0, poll_interval=0.25):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+
+    def ensure_indexes(self):
+        self.collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=self.ttl_seconds)
+
+    @staticmethod
+    def record_id(scope, key):
+        return hashlib.sha256(f"{scope}\n{key}".encode("utf-8")).hexdigest()
+
+    # None when the caller now owns the key and must run the request; otherwise the stored
+    # (meta, body) of the earlier run, once it has finished
+    def begin(self, record_id, request_fingerprint):
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            try:
+                self.collection.insert_one({
+                    "_id": record_id,
+                    "fingerprint": request_fingerprint,
+                    "status": "pending",
+                    "created_at": datetime.now(timezone.utc),
+                })
+                return None
+            except DuplicateKeyError:
+                pass
+            document = self.collection.find_one({"_id": record_id})
+            if document is None:
+                continue
+            if document["fingerprint"] != request_fingerprint:
+                raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+            if document["status"] == "done":
+                return (document["status_code"], document["mimetype"], document.get("headers", [])), document["body"]
+            if time.monotonic() >= deadline:
+                raise IdempotencyPending("A request with this Idempotency-Key is still in progress")
+            time.sleep(self.poll_interval)
+
+    # Server errors are not stored, so the client's retry runs the request again. Streams that
+    # failed after sending a 200 are abandoned by the caller instead of finished
+    def finish(self, record_id, meta, body):
+        status_code, mimetype, headers = meta
+        if status_code >= 500:
+            self.abandon(record_id)
+            return
+        self.collection.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "done", "status_code": status_code, "mimetype": mimetype, "headers": headers, "body": body}},
+        )
+
+    def abandon(self, record_id):
+        self.collection.delete_one({"_id": record_id, "status": "pending"})
@@ -0,0 +1,201 @@
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, format_labels(self.labels, key), value) for key, value in sorted(self.values.items())]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append((self.name + "_bucket", format_labels(self.labels, key, [("le", le)]), cumulative))
+                samples.append((self.name + "_sum", format_labels(self.labels, key), series["sum"]))
+                samples.append((self.name + "_count", format_labels(self.labels, key), series["count"]))
+        return samples
+
+# In-process metrics in the Prometheus text exposition format; one registry per process
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+# Spans for the request (or background job) running in the current context
+current_trace = ContextVar("current_trace", default=None)
+
+class Tracer:
+    def __init__(self, registry, log_path=None, sample_rate=1.0, slow_ms=0):
+        self.log_path = log_path
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.lock = threading.Lock()
+        self.http_seconds = registry.histogram(
+            "padhai_http_request_seconds", "Flask/Quart request latency.", ("endpoint", "method", "status"))
+        self.mongo_seconds = registry.histogram(
+            "padhai_mongo_command_seconds", "MongoDB command latency.", ("collection", "command", "outcome"))
+        self.llm_seconds = registry.histogram(
+            "padhai_llm_call_seconds", "OpenAI chat completion latency, cache hits included.", ("agent", "model", "outcome"),
+            buckets=(0.01, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0))
+        self.llm_tokens = registry.counter(
+            "padhai_llm_tokens_total", "OpenAI tokens by direction.", ("agent", "model", "kind"))
+        self.span_seconds = registry.histogram(
+            "padhai_span_seconds", "Latency of named in-process spans.", ("name",))
+
+    def start_trace(self, endpoint, method):
+        trace = {"endpoint": endpoint, "method": method, "status": 500, "started": time.perf_counter(), "ts": time.time(), "spans": []}
+        current_trace.set(trace)
+        return trace
+
+    # Called at teardown, after a streamed body has been fully sent
+    def finish_trace(self, trace):
+        current_trace.set(None)
+        status = trace["status"]
+        elapsed = time.perf_counter() - trace["started"]
+        self.http_seconds.observe(elapsed, endpoint=trace["endpoint"] or "unknown", method=trace["method"], status=status)
+        if not self.log_path:
+            return
+        slow = self.slow_ms and elapsed * 1000 >= self.slow_ms
+        if not slow and random.random() >= self.sample_rate:
+            return
+        entry = {
+            "ts": trace["ts"],
+            "endpoint": trace["endpoint"],
+            "method": trace["method"],
+            "status": status,
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "spans": trace["spans"],
+        }
+        with self.lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def add_span(self, kind, started, elapsed, **attrs):
+        trace = current_trace.get()
+        if trace is not None:
+            span = {"kind": kind, "offset_ms": round((started - trace["started"]) * 1000, 3), "elapsed_ms": round(elapsed * 1000, 3)}
+            span.update(attrs)
+            trace["spans"].append(span)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.span_seconds.observe(elapsed, name=name)
+            self.add_span("span", started, elapsed, name=name, **attrs)
+
+    def observe_llm(self, agent, model, prompt_tokens, completion_tokens, elapsed, cached=False, error=None):
+        outcome = "error" if error else "cached" if cached else "ok"
+        self.llm_seconds.observe(elapsed, agent=agent, model=model, outcome=outcome)
+        if prompt_tokens:
+            self.llm_tokens.inc(prompt_tokens, agent=agent, model=model, kind="prompt")
+        if completion_tokens:
+            self.llm_tokens.inc(completion_tokens, agent=agent, model=model, kind="completion")
+        self.add_span("openai", time.perf_counter() - elapsed, elapsed, agent=agent, model=model, outcome=outcome,
+                      prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, error=error)
+
+# Times every command a MongoClient sends; pass it in the client's event_listeners. Callbacks run
+# in the thread (or task) that issued the command, so spans land on the caller's trace
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self.lock:
+            self.pending[(event.connection_id, event.request_id)] = (collection, current_trace.get())
+
+    def finished(self, event, outcome):
+        with self.lock:
+            collection, trace = self.pending.pop((event.connection_id, event.request_id), ("", None))
+        elapsed = event.duration_micros / 1e6
+        self.tracer.mongo_seconds.observe(elapsed, collection=collection, command=event.command_name, outcome=outcome)
+        if trace is not None and trace is current_trace.get():
+            self.tracer.add_span("mongo", time.perf_counter() - elapsed, elapsed,
+                                 collection=collection, command=event.command_name, outcome=outcome)
+
+    def succeeded(self, event):
+        self.finished(event, "ok")
+
+    def failed(self, event):
+        self.finished(event, "error")
@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import FakeOpenAIConfig, serve
+
+@pytest.fixture(scope="session")
+def fake_openai():
+    config = FakeOpenAIConfig(latency=0.0, tokens_per_second=100000, completion_tokens=40, seed=1)
+    server = serve("127.0.0.1", 0, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield config, f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+# backend.py configures itself at import, so one instance (on mongomock) serves the whole session
+@pytest.fixture(scope="session")
+def backend(fake_openai, tmp_path_factory):
+    import bench
+    _, url = fake_openai
+    return bench.boot_backend(argparse.Namespace(mongo_uri=None, cache=False), url, str(tmp_path_factory.mktemp("trace") / "trace.jsonl"))
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+@pytest.fixture
+def student_id(client):
+    response = client.post("/initialize", json={"name": "Asha", "standard": "8th", "subject": "Science", "like_study": "experiments"})
+    return response.get_json()["student_id"]
@@ -0,0 +1,84 @@
+import uuid
+from answer_index import AnswerIndex, partition_key, write_index
+
+QUESTION = "Why do leaves change colour in autumn?"
+ANSWER = "Chlorophyll breaks down, so the yellow pigments show."
+
+def test_answers_are_partitioned_by_subject_and_standard():
+    index = AnswerIndex()
+    index.add(QUESTION, ANSWER, "Science", "8th")
+    assert index.lookup(QUESTION, "Science", "Class 8")["served"]
+    assert index.lookup(QUESTION, "Science", "7th") is None
+    assert index.lookup(QUESTION, "History", "8th") is None
+
+def test_close_question_seeds_and_near_duplicate_serves():
+    index = AnswerIndex(serve_threshold=0.99, seed_threshold=0.3)
+    index.add(QUESTION, ANSWER, "Science", "8th")
+    seed = index.lookup("Why do the leaves of trees change colour in autumn?", "Science", "8th")
+    assert seed and not seed["served"] and seed["answer"] == ANSWER
+    assert index.lookup(QUESTION, "Science", "8th")["served"]
+
+def test_index_file_is_searched(tmp_path):
+    write_index(str(tmp_path), [(partition_key("Science", "8th"), QUESTION, ANSWER)])
+    index = AnswerIndex(str(tmp_path))
+    assert index.lookup(QUESTION, "Science", "8th")["answer"] == ANSWER
+
+def record_completions(backend, monkeypatch):
+    calls = []
+    chat_completion, stream_completion = backend.chat_completion, backend.stream_completion
+    def recorded_chat(agent, messages, **options):
+        calls.append((agent, messages))
+        return chat_completion(agent, messages, **options)
+    def recorded_stream(agent, messages, **options):
+        calls.append((agent, messages))
+        return stream_completion(agent, messages, **options)
+    monkeypatch.setattr(backend, "chat_completion", recorded_chat)
+    monkeypatch.setattr(backend, "stream_completion", recorded_stream)
+    return calls
+
+def ask(backend, client, student_id, summary, question):
+    backend.students_collection.update_one({"_id": backend.ObjectId(student_id)}, {"$set": {"basic_summary": summary}})
+    response = client.post("/agent/stream", json={"student_id": student_id, "query": question})
+    assert "event: done" in response.get_data(as_text=True)
+
+def prompt_text(messages):
+    return "\n".join(message["content"] for message in messages)
+
+# Student A's question is answered once without A's profile; B reuses that answer, personalized for B
+def test_shared_answer_is_reused_for_another_student(backend, client, student_id, monkeypatch):
+    other_id = client.post("/initialize", json={"name": "Ravi", "standard": "8th", "subject": "Science", "like_study": "football"}).get_json()["student_id"]
+    question = f"explain why leaves change colour in autumn {uuid.uuid4().hex}"
+    calls = record_completions(backend, monkeypatch)
+
+    ask(backend, client, student_id, "Asha loves experiments", question)
+    (shared_agent, shared), (personal_agent, personal) = [call for call in calls if call[0].startswith("tutor")]
+    assert (shared_agent, personal_agent) == ("tutor_agent", "tutor_personalize")
+    assert "Asha" not in prompt_text(shared) and "Asha loves experiments" in prompt_text(personal)
+    answer = backend.tutor_answers_collection.find_one({"question": question})
+    assert answer["shared"] and "Asha" not in answer["answer"]
+
+    del calls[:]
+    ask(backend, client, other_id, "Ravi plays football", question)
+    assert [agent for agent, _ in calls if agent.startswith("tutor")] == ["tutor_personalize"]
+    personalized = prompt_text([call for call in calls if call[0] == "tutor_personalize"][0][1])
+    assert answer["answer"] in personalized and "Ravi plays football" in personalized and "Asha" not in personalized
+
+# A speculated tutor call goes through the index too: it stores the shared answer on a miss and reuses it on a hit
+def test_speculated_tutor_answers_use_the_index(backend, client, student_id, monkeypatch):
+    from router import RouteDecision
+    monkeypatch.setattr(backend.fast_router, "route", lambda query: RouteDecision("tutor_agent", 0.9, "fallback"))
+    other_id = client.post("/initialize", json={"name": "Ravi", "standard": "8th", "subject": "Science", "like_study": "football"}).get_json()["student_id"]
+    question = f"explain how rainbows form {uuid.uuid4().hex}"
+    calls = record_completions(backend, monkeypatch)
+    before = backend.answer_index.stats()
+    hits = backend.speculation_stats()["hits"]
+
+    for student in (student_id, other_id):
+        response = client.post("/agent", json={"student_id": student, "query": question})
+        assert response.get_json()["model"] == "tutor_agent"
+
+    after = backend.answer_index.stats()
+    assert backend.speculation_stats()["hits"] == hits + 2
+    assert (after["stores"] - before["stores"], after["served"] - before["served"]) == (1, 1)
+    assert backend.tutor_answers_collection.count_documents({"question": question, "shared": True}) == 1
+    assert [agent for agent, _ in calls if agent.startswith("tutor")] == ["tutor_agent", "tutor_personalize", "tutor_personalize"]
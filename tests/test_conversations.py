@@ -0,0 +1,21 @@
+from datetime import datetime
+
+def test_history_pages_do_not_skip_shared_timestamps(backend, client, student_id):
+    backend.conversations_collection.insert_many([
+        {"student_id": backend.ObjectId(student_id), "agent": "tutor_agent", "subject": "Physics",
+         "evaluation": f"answer-{index}", "timestamp": datetime(2026, 1, 1)}
+        for index in range(5)
+    ])
+    seen = []
+    params = {"agent": "tutor_agent", "limit": 2}
+    while True:
+        page = client.get(f"/conversations/{student_id}", query_string=params).get_json()
+        seen += [conv["evaluation"] for conv in page["conversations"]]
+        if not page["next_before"]:
+            break
+        params.update(before=page["next_before"], before_id=page["next_before_id"])
+    assert seen == [f"answer-{index}" for index in reversed(range(5))]
+
+def test_invalid_cursor_is_a_bad_request(client, student_id):
+    response = client.get(f"/conversations/{student_id}", query_string={"before": "2026-01-01T00:00:00", "before_id": "nope"})
+    assert response.status_code == 400
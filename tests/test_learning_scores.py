@@ -0,0 +1,32 @@
+from curriculum import SUBJECT_TOPICS
+from learning_scores import evaluated_topic, extract_scores, grouped_summaries, summarize
+
+TOPIC_SUBJECTS = {topic: subject for subject, topics in SUBJECT_TOPICS.items() for topic in topics}
+
+def test_extract_scores_labels_and_generic_score():
+    text = "Summary: Algebra - 20 %, geometry: 75%. Learning Score: 60%"
+    assert extract_scores(text, "Calculus", TOPIC_SUBJECTS) == [("Algebra", 20.0), ("Geometry", 75.0), ("Calculus", 60.0)]
+
+def test_generic_score_without_topic_is_dropped():
+    assert extract_scores("Learning Score: 60%", None, TOPIC_SUBJECTS) == []
+
+def test_scores_over_100_are_ignored():
+    assert extract_scores("Physics - 150%", None, TOPIC_SUBJECTS) == []
+
+def test_evaluated_topic_matches_whole_words_on_the_opening_line():
+    transcript = ("user : i want to evaluate my knowledge about Programming\n"
+                  "learning_tracker_agent : Let's cover the basics, topics in physics and CS later\n"
+                  "User : answer of questions : a b c")
+    assert evaluated_topic(transcript, TOPIC_SUBJECTS) == "Programming"
+
+def test_evaluated_topic_ignores_substrings():
+    assert evaluated_topic("i want to evaluate my knowledge about basics of physics", ["CS", "Physics"]) == "Physics"
+    assert evaluated_topic("i want to evaluate my knowledge about basics", ["CS"]) is None
+    assert evaluated_topic("explain CS to me", ["CS"]) is None
+
+def test_summaries():
+    assert summarize([])["count"] == 0
+    summary = summarize([10, 20, 30])
+    assert summary["mean"] == 20.0 and summary["min"] == 10.0 and summary["max"] == 30.0
+    groups = grouped_summaries(["b", "a", "b"], [1, 2, 3])
+    assert groups["a"]["count"] == 1 and groups["b"]["mean"] == 2.0
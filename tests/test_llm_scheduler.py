@@ -0,0 +1,104 @@
+import threading
+import time
+import openai
+import pytest
+from fake_openai import FakeOpenAIConfig, serve
+from llm_scheduler import LLMScheduler, SchedulerOverloaded
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(**options):
+        server = serve("127.0.0.1", 0, FakeOpenAIConfig(**options))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        client = openai.OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+        return server.RequestHandlerClass, client
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def complete(client, **params):
+    return lambda: client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "hello"}], **params)
+
+def test_concurrency_is_capped(fake_server):
+    _, client = fake_server(latency=0.05, tokens_per_second=100000, completion_tokens=5)
+    scheduler = LLMScheduler(max_concurrency=2)
+    peak = []
+    original = scheduler.release_locked
+
+    def observe():
+        peak.append(scheduler.in_flight)
+        original()
+
+    scheduler.release_locked = observe
+    threads = [threading.Thread(target=scheduler.run, args=(complete(client),)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(peak) == 6 and max(peak) <= 2
+    assert scheduler.stats()["counters"]["interactive_calls"] == 6
+
+def test_rate_limits_are_retried_after_retry_after(fake_server):
+    _, client = fake_server(latency=0.0, tokens_per_second=100000, completion_tokens=5, rate_limit_rate=0.5, retry_after=0.01, seed=3)
+    scheduler = LLMScheduler(max_retries=10, base_delay=0.01)
+    for _ in range(5):
+        assert scheduler.run(complete(client)).choices[0].message.content
+    assert scheduler.stats()["counters"]["retries"] > 0
+
+def test_client_errors_are_not_retried(fake_server):
+    _, client = fake_server(latency=0.0)
+    scheduler = LLMScheduler(max_retries=3)
+    with pytest.raises(openai.NotFoundError):
+        scheduler.run(lambda: client.models.retrieve("gpt-4"))
+    assert scheduler.stats()["counters"]["failures"] == 1
+    assert scheduler.stats()["in_flight"] == 0
+
+def test_stream_holds_its_slot_until_drained(fake_server):
+    _, client = fake_server(latency=0.0, tokens_per_second=100000, completion_tokens=20)
+    scheduler = LLMScheduler(tokens_per_minute=10000, max_concurrency=1)
+    stream = scheduler.run(complete(client, stream=True, stream_options={"include_usage": True}), tokens=1000, stream=True)
+    assert scheduler.stats()["in_flight"] == 1
+    chunks = list(stream)
+    assert chunks[-1].usage is not None
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    # The 1000-token estimate is settled against the real usage
+    assert stats["tokens_available"] > 10000 - 1000
+
+def test_closed_stream_releases_its_slot(fake_server):
+    _, client = fake_server(latency=0.0, tokens_per_second=100000, completion_tokens=20)
+    scheduler = LLMScheduler(max_concurrency=1)
+    stream = scheduler.run(complete(client, stream=True), stream=True)
+    next(iter(stream))
+    stream.close()
+    assert scheduler.stats()["in_flight"] == 0
+
+def test_interactive_calls_go_before_background():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+    scheduler.acquire(1, "interactive")
+    threads = []
+    for priority in ("background", "interactive"):
+        thread = threading.Thread(target=lambda priority=priority: (scheduler.acquire(1, priority), order.append(priority), scheduler.release()))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "background"]
+
+def test_full_queue_is_rejected():
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+    scheduler.acquire(1, "interactive")
+    waiter = threading.Thread(target=lambda: (scheduler.acquire(1, "interactive"), scheduler.release()))
+    waiter.start()
+    time.sleep(0.05)
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.acquire(1, "interactive")
+    scheduler.release()
+    waiter.join(5)
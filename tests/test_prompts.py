@@ -0,0 +1,16 @@
+import logging
+from prompts import Tokenizer
+
+def test_encoding_loads_on_first_count_and_logs_the_fallback(caplog):
+    tokenizer = Tokenizer("no-such-encoding")
+    assert not tokenizer.loaded
+    with caplog.at_level(logging.WARNING, logger="prompts"):
+        assert tokenizer.count("hello, world") == tokenizer.count("hello, world") == 5
+    assert tokenizer.loaded and tokenizer.encoding is None
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
+
+def test_truncate_marks_the_cut():
+    tokenizer = Tokenizer("no-such-encoding")
+    text, truncated = tokenizer.truncate("one two three four five six", 4)
+    assert truncated and text.endswith(" …") and tokenizer.count(text) <= 4
+    assert tokenizer.truncate("short", 4) == ("short", False)
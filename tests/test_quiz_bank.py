@@ -0,0 +1,55 @@
+import json
+import pytest
+from quiz_bank import grade, next_difficulty, parse_questions
+
+QUIZ = {"questions": [
+    {"type": "mcq", "question": "2 + 2?", "options": ["3", "4"], "answer": 1, "concept": "addition", "explanation": "2 + 2 = 4"},
+    {"type": "open", "question": "What do plants need?", "key_points": ["sunlight", "carbon dioxide and water"],
+     "concept": "photosynthesis", "explanation": "Light, CO2 and water."},
+]}
+
+def test_malformed_questions_are_dropped():
+    text = "Here you go:\n```json\n" + json.dumps({"questions": [
+        QUIZ["questions"][0],
+        {"type": "mcq", "question": "No options", "options": [], "answer": 0},
+        {"type": "mcq", "question": "Answer out of range", "options": ["a", "b"], "answer": 2},
+        {"type": "open", "question": "No key points", "key_points": [" "]},
+        {"type": "essay", "question": "Unknown type"},
+        "not a question",
+    ]}) + "\n```"
+    assert [question["question"] for question in parse_questions(text)] == ["2 + 2?"]
+
+def test_quiz_without_usable_questions_is_rejected():
+    with pytest.raises(ValueError):
+        parse_questions('{"questions": [{"type": "mcq", "question": "?", "options": ["a"], "answer": 0}]}')
+
+def test_grade_scores_choices_and_key_points():
+    graded = grade(QUIZ, ["1", "Plants need sunlight and lots of water"])
+    assert (graded["earned"], graded["possible"], graded["score"]) == (1.5, 2, 75)
+    mcq, open_answer = graded["results"]
+    assert mcq["correct"] and mcq["answer"] == 1
+    assert open_answer["covered"] == ["sunlight"] and open_answer["earned"] == 0.5
+
+def test_grade_treats_missing_and_unparseable_answers_as_wrong():
+    graded = grade(QUIZ, ["four"])
+    assert graded["score"] == 0 and graded["results"][1]["answer"] == ""
+
+def test_unanswered_choice_is_not_graded_as_the_first_option():
+    graded = grade({"questions": [dict(QUIZ["questions"][0], answer=0)]}, [None])
+    assert graded["score"] == 0 and graded["results"][0]["answer"] is None
+
+@pytest.mark.parametrize("difficulty, score, expected", [
+    ("medium", 80, "hard"), ("hard", 100, "hard"), ("medium", 39, "easy"), ("easy", 0, "easy"), ("medium", 60, "medium"), ("unknown", 90, "hard"),
+])
+def test_next_difficulty(difficulty, score, expected):
+    assert next_difficulty(difficulty, score) == expected
+
+def test_quiz_round_trip(backend, client, student_id):
+    quiz = client.post("/quizzes", json={"student_id": student_id, "subject": "Science", "topic": "Physics", "difficulty": "medium"}).get_json()
+    assert all("answer" not in question and "key_points" not in question for question in quiz["questions"])
+    stored = backend.quiz_bank.get(quiz["quiz_id"])
+    answers = [question["answer"] if question["type"] == "mcq" else " ".join(question["key_points"]) for question in stored["questions"]]
+    result = client.post(f"/quizzes/{quiz['quiz_id']}/answers", json={"student_id": student_id, "answers": answers, "feedback": False}).get_json()
+    assert (result["score"], result["level"], result["next_difficulty"]) == (100, "Master", "hard")
+    scores = backend.score_store.collection.find({"student_id": backend.ObjectId(student_id), "topic": "Physics"})
+    assert [score["score"] for score in scores] == [100.0]
@@ -0,0 +1,19 @@
+import pytest
+from roster import parse_roster
+
+def test_ndjson_rows():
+    rows = parse_roster('{"name": "Asha", "standard": "8th", "subject": "Science"}\n\n{"name": "Ravi", "standard": 7}\n')
+    assert rows == [
+        {"name": "Asha", "standard": "8th", "subject": "Science", "like_study": ""},
+        {"name": "Ravi", "standard": "7", "subject": "", "like_study": ""},
+    ]
+
+@pytest.mark.parametrize("line", ["[1, 2]", '"Asha"', "42", "null"])
+def test_ndjson_row_that_is_not_an_object_is_rejected(line):
+    with pytest.raises(ValueError, match="row 1 is not a JSON object"):
+        parse_roster('{"name": "Asha", "standard": "8th", "subject": "Science"}\n' + line, "ndjson")
+
+def test_upload_with_a_non_object_row_is_a_bad_request(client):
+    response = client.post("/rosters?format=ndjson", data='{"name": "Asha", "standard": "8th", "subject": "Science"}\n["Ravi"]\n')
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid roster: row 1 is not a JSON object"
@@ -0,0 +1,45 @@
+from router import FastRouter, NaiveBayesRouter, query_head
+
+def test_rule_routes_at_its_confidence():
+    decision = FastRouter().route("User : I want to evaluate my knowledge about Algebra\nUser : hi")
+    assert (decision.agent, decision.source, decision.confidence) == ("learning_tracker_agent", "rule", 0.99)
+
+# An evaluation reply ends the query, after an opening line no head rule recognizes
+def test_quiz_answers_are_matched_anywhere_in_the_query():
+    query = "user : quick check on gravity\nlearning_tracker_agent : Q1. What pulls objects down?\nUser : answer of questions : gravity"
+    decision = FastRouter().route(query)
+    assert (decision.agent, decision.source, decision.confidence) == ("learning_tracker_agent", "rule", 0.97)
+    assert FastRouter().route("user : what does answer of questions : mean").source != "rule"
+
+# A rule weaker than rule_threshold is skipped; the classifier or the LLM decides instead
+def test_rule_below_threshold_is_skipped():
+    query = "tell me about my hobbies"
+    assert FastRouter(rule_threshold=0.85).route(query).source == "rule"
+    assert FastRouter(rule_threshold=0.9).route(query).source != "rule"
+
+def test_classifier_threshold_decides_between_classifier_and_fallback():
+    query = "explain the pythagorean theorem"
+    confident = FastRouter(classifier_threshold=0.5).route(query)
+    assert (confident.agent, confident.source) == ("tutor_agent", "classifier")
+    assert FastRouter(classifier_threshold=1.01).route(query).source == "fallback"
+
+def test_unknown_words_fall_back_to_the_llm():
+    decision = FastRouter().route("zzzz qqqq")
+    assert (decision.agent, decision.confidence, decision.source) == (None, 0.0, "fallback")
+
+def test_only_the_newest_message_is_routed():
+    assert query_head("Response : explain the water cycle\nUser : make a study plan") == "explain the water cycle"
+
+def test_llm_decisions_are_learned_from_the_log(tmp_path):
+    log_path = str(tmp_path / "router.jsonl")
+    router = FastRouter(classifier_threshold=1.01, log_path=log_path)
+    decision = router.route("zzzz qqqq")
+    router.record("zzzz qqqq", decision, "discover_agent", 0.01)
+    assert router.stats()["llm_fallbacks"] == 1
+    router.retrain()
+    assert router.classifier.predict("zzzz qqqq")[0] == "discover_agent"
+
+def test_naive_bayes_confidence_is_a_probability():
+    classifier = NaiveBayesRouter().fit([("quiz me", "learning_tracker_agent"), ("explain gravity", "tutor_agent")])
+    agent, confidence = classifier.predict("explain gravity please")
+    assert agent == "tutor_agent" and 0.5 < confidence <= 1.0
@@ -0,0 +1,21 @@
+from fake_openai import completion_text
+from router import AGENTS, ROUTING_QUESTION
+
+def test_master_prompt_carries_routing_question(backend):
+    assert ROUTING_QUESTION in backend.MasterAgent.PROMPT.system
+
+def test_fake_server_routes_master_prompt(backend, student_id):
+    student = backend.StudentContext(student_id)
+    messages = backend.master_agent.decide_agent_messages("i want to evaluate my knowledge about Physics", student)
+    assert completion_text(messages, 40) == "learning_tracker_agent"
+    messages = backend.master_agent.decide_agent_messages("hmm", student)
+    assert completion_text(messages, 40) in AGENTS
+
+def test_llm_routed_agent_request(backend, client, student_id):
+    # Too vague for the fast router, so the master agent's LLM call picks the agent
+    assert backend.fast_router.route("hmm").source == "fallback"
+    response = client.post("/agent", json={"student_id": student_id, "query": "hmm"})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["model"] in AGENTS
+    assert body["response"] != "Agent not found."
@@ -0,0 +1,14 @@
+TRANSCRIPT = "user : i want to evaluate my knowledge about Programming\nUser : answer of questions : the basics of topics in physics"
+
+def logged_scores(backend, student_id, topic):
+    student = backend.StudentContext(student_id)
+    backend.learning_tracker_agent.log_conversation(student, TRANSCRIPT, "Learning Score: 60%", "learning_tracker_agent", topic=topic)
+    student.commit()
+    return [(doc["subject"], doc["topic"], doc["score"]) for doc in backend.score_store.collection.find({"student_id": student.student_id})]
+
+# "basics", "topics" and "physics" contain "CS" and "Physics"; none of them may claim the score
+def test_generic_score_goes_to_the_session_topic(backend, student_id):
+    assert logged_scores(backend, student_id, "Programming") == [("IT", "Programming", 60.0)]
+
+def test_generic_score_without_session_topic_uses_the_opening_line(backend, student_id):
+    assert logged_scores(backend, student_id, None) == [("IT", "Programming", 60.0)]
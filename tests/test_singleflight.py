@@ -0,0 +1,106 @@
+import threading
+import time
+import uuid
+import mongomock
+import pytest
+from singleflight import IdempotencyConflict, IdempotencyStore, SingleFlight, fingerprint
+
+def test_fingerprint_ignores_key_order_and_whitespace():
+    assert fingerprint("agent", {"a": " x ", "b": 1}) == fingerprint("agent", {"b": 1, "a": "x"})
+    assert fingerprint("agent", {"a": "x"}) != fingerprint("agent", {"a": "y"})
+
+def test_concurrent_identical_requests_share_one_run():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def start():
+        calls.append(1)
+        release.wait(5)
+        return "meta", ["result"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.share("key", start))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert sorted(led for _, _, led in results) == [False, False, False, True]
+    assert all(list(chunks) == ["result"] for _, chunks, _ in results)
+    assert flights.in_flight() == 0
+
+def test_streamed_result_reaches_followers_and_callbacks():
+    flights = SingleFlight()
+    completed = []
+    meta, chunks, led = flights.share("key", lambda: ("meta", iter(["a", "b"])), lambda meta, chunks: completed.append("".join(chunks)))
+    assert led and list(chunks) == ["a", "b"]
+    assert completed == ["ab"]
+
+def test_idempotency_store_replays_and_rejects_other_requests():
+    store = IdempotencyStore(mongomock.MongoClient().db.keys, wait_seconds=0.1, poll_interval=0.01)
+    record_id = store.record_id("agent", "key-1")
+    assert store.begin(record_id, "fp") is None
+    store.finish(record_id, (200, "application/json", []), '{"ok": true}')
+    assert store.begin(record_id, "fp") == ((200, "application/json", []), '{"ok": true}')
+    with pytest.raises(IdempotencyConflict):
+        store.begin(record_id, "other")
+
+def test_idempotency_store_does_not_keep_server_errors():
+    store = IdempotencyStore(mongomock.MongoClient().db.keys)
+    record_id = store.record_id("agent", "key-2")
+    assert store.begin(record_id, "fp") is None
+    store.finish(record_id, (500, "application/json", []), "{}")
+    assert store.begin(record_id, "fp") is None
+
+def stream_agent(client, student_id, key):
+    return client.post("/agent/stream", json={"student_id": student_id, "query": f"explain photosynthesis {key}"},
+                       headers={"Idempotency-Key": key})
+
+def test_failed_stream_is_not_replayed(backend, client, student_id, monkeypatch):
+    def fail(agent, messages, refresh=False):
+        raise RuntimeError("model unavailable")
+        yield
+
+    key = str(uuid.uuid4())
+    monkeypatch.setattr(backend, "stream_completion", fail)
+    failed = stream_agent(client, student_id, key)
+    assert failed.status_code == 200 and "event: error" in failed.get_data(as_text=True)
+    monkeypatch.undo()
+
+    retried = stream_agent(client, student_id, key)
+    assert "Idempotent-Replayed" not in retried.headers
+    assert "event: done" in retried.get_data(as_text=True)
+
+    replayed = stream_agent(client, student_id, key)
+    assert replayed.headers.get("Idempotent-Replayed") == "true"
+    assert replayed.get_data(as_text=True) == retried.get_data(as_text=True)
+
+# /initialize names no student, so identical sign-up forms from two students must each get their own
+def test_identical_signups_are_not_coalesced(backend, monkeypatch):
+    both_running = threading.Barrier(2, timeout=5)
+    def create_summary(student, summary_type=None):
+        both_running.wait()
+        return "summary"
+
+    monkeypatch.setattr(backend, "create_summary", create_summary)
+    form = {"name": "Asha", "standard": "8th", "subject": "Science", "like_study": "experiments"}
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(backend.app.test_client().post("/initialize", json=form)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert [response.status_code for response in responses] == [200, 200]
+    assert len({response.get_json()["student_id"] for response in responses}) == 2
+
+def test_signup_retry_replays_its_idempotency_key(client):
+    form = {"name": "Ravi", "standard": "7th", "subject": "Maths", "like_study": "puzzles"}
+    key = str(uuid.uuid4())
+    first = client.post("/initialize", json=form, headers={"Idempotency-Key": key})
+    retried = client.post("/initialize", json=form, headers={"Idempotency-Key": key})
+    assert retried.headers.get("Idempotent-Replayed") == "true"
+    assert retried.get_json()["student_id"] == first.get_json()["student_id"]
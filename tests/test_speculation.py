@@ -0,0 +1,46 @@
+import uuid
+from router import RouteDecision
+
+def guess(backend, monkeypatch, agent):
+    monkeypatch.setattr(backend.fast_router, "route", lambda query: RouteDecision(agent, 0.9, "fallback"))
+
+def record_streams(backend, monkeypatch):
+    agents = []
+    stream_completion = backend.stream_completion
+    def recorded(agent, messages, **options):
+        agents.append(agent)
+        return stream_completion(agent, messages, **options)
+    monkeypatch.setattr(backend, "stream_completion", recorded)
+    return agents
+
+def stream(client, student_id, query):
+    body = client.post("/agent/stream", json={"student_id": student_id, "query": query}).get_data(as_text=True)
+    assert "event: done" in body
+    return body
+
+def test_streamed_hit_replays_the_speculated_completion(backend, client, student_id, monkeypatch):
+    guess(backend, monkeypatch, "guide_agent")
+    agents = record_streams(backend, monkeypatch)
+    hits = backend.speculation_stats()["hits"]
+    body = stream(client, student_id, f"make me a roadmap for physics {uuid.uuid4().hex}")
+    assert '"model": "guide_agent"' in body
+    assert agents == ["guide_agent"]
+    assert backend.speculation_stats()["hits"] == hits + 1
+
+def test_streamed_miss_is_cancelled_and_the_routed_agent_answers(backend, client, student_id, monkeypatch):
+    guess(backend, monkeypatch, "guide_agent")
+    agents = record_streams(backend, monkeypatch)
+    stats = backend.speculation_stats()
+    body = stream(client, student_id, f"explain gravity {uuid.uuid4().hex}")
+    assert '"model": "tutor_agent"' in body
+    assert agents == ["guide_agent", "tutor_personalize"]
+    assert backend.speculation_stats()["misses"] == stats["misses"] + 1
+    assert backend.speculation_stats()["cancelled"] == stats["cancelled"] + 1
+
+def test_streamed_tutor_hit_stores_and_personalizes_the_shared_answer(backend, client, student_id, monkeypatch):
+    guess(backend, monkeypatch, "tutor_agent")
+    agents = record_streams(backend, monkeypatch)
+    question = f"explain how magnets work {uuid.uuid4().hex}"
+    stream(client, student_id, question)
+    assert agents == ["tutor_agent", "tutor_personalize"]
+    assert backend.tutor_answers_collection.count_documents({"question": question, "shared": True}) == 1
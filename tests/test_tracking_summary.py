@@ -0,0 +1,49 @@
+import re
+from datetime import datetime
+
+def folding(backend, monkeypatch):
+    folded = []
+    def chat_completion(agent, messages, **options):
+        folded.extend(re.findall(r"Evaluation: (eval-\d+)", messages[-1]["content"]))
+        return "summary"
+    monkeypatch.setattr(backend, "chat_completion", chat_completion)
+    return folded
+
+# Fold passes run on one uncommitted context: no follow-up jobs, and the cursor is read back from its updates
+def fold_all(backend, student_id):
+    student = backend.StudentContext(student_id)
+    for _ in range(20):
+        until = student.get('tracking_summary_until_id')
+        backend.learning_tracker_agent.update_tracking_summary(student)
+        if student.get('tracking_summary_until_id') == until:
+            break
+    return student
+
+def test_backlog_with_shared_timestamps_is_folded_once_oldest_first(backend, student_id, monkeypatch):
+    folded = folding(backend, monkeypatch)
+    timestamp = datetime(2026, 1, 1)
+    backend.conversations_collection.insert_many([
+        {"student_id": backend.ObjectId(student_id), "agent": "learning_tracker_agent", "subject": "Physics",
+         "evaluation": f"eval-{index}", "timestamp": timestamp}
+        for index in range(backend.CONVERSATION_HISTORY_LIMIT + 15)
+    ])
+    fold_all(backend, student_id)
+    assert folded == [f"eval-{index}" for index in range(backend.CONVERSATION_HISTORY_LIMIT + 15)]
+
+def test_migrated_evaluations_are_not_folded_again(backend, monkeypatch):
+    from migrate_conversations import migrate_conversations
+    folded = folding(backend, monkeypatch)
+    # mongomock's bulk_write does not accept this pymongo's UpdateOne; apply the upserts one by one
+    collection = backend.conversations_collection
+    monkeypatch.setattr(collection, "bulk_write", lambda operations, ordered=True: [
+        collection.update_one(operation._filter, operation._doc, upsert=operation._upsert) for operation in operations])
+    student_id = backend.students_collection.insert_one({
+        "standard": "8th", "subject": "Science", "basic_summary": "", "tracking_summary": "Physics - 40%",
+        "conversations": [{"agent": "learning_tracker_agent", "subject": "Physics", "evaluation": f"eval-{index}"} for index in range(3)],
+    }).inserted_id
+    migrate_conversations()
+    backend.conversations_collection.insert_one({
+        "student_id": student_id, "agent": "learning_tracker_agent", "subject": "Physics",
+        "evaluation": "eval-3", "timestamp": datetime(2030, 1, 1)})
+    fold_all(backend, student_id)
+    assert folded == ["eval-3"]